@@ -0,0 +1,344 @@
+"""HTTP load benchmark covering the main TypingLab routes.
+
+Seeds synthetic users, logs them in through /login, then drives a weighted
+mix of page and API requests from concurrent virtual users. Reports
+throughput and p50/p95/p99 latency per route and saves the results as JSON
+so runs can be compared between commits.
+
+    python benchmarks/bench_http.py --target inprocess --users 50 --seconds 20
+    python benchmarks/bench_http.py --target uvicorn --workers 2 --output run.json
+    DATABASE_URL=postgresql://localhost/typinglab_bench python benchmarks/bench_http.py --target hypercorn
+    python benchmarks/bench_http.py --target serve --scale 1,2,4 --output scaling.json
+    python benchmarks/bench_http.py --compare base.json run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = "bench-password"
+SEED_ROUNDS = 4
+
+# (route, weight)
+ROUTE_MIX = [
+    ("GET /", 25),
+    ("GET /test", 15),
+    ("GET /api/prompt", 25),
+    ("POST /api/session_json", 15),
+    ("GET /api/training_progress", 10),
+    ("POST /api/training_progress", 5),
+    ("GET /leaderboard", 5),
+]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed_users(count: int, prefix: str = "bench"):
+    """Insert users directly with a cheap bcrypt cost so seeding stays fast."""
+    import bcrypt
+    from sqlalchemy import text
+
+    import db
+
+    db.init_db()
+    pw_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=SEED_ROUNDS))
+    emails = [f"{prefix}{i}@bench.local" for i in range(count)]
+    with db.engine.begin() as conn:
+        for email in emails:
+            conn.execute(
+                text("""
+                    INSERT INTO users (name, email, password_hash) VALUES (:name, :email, :password_hash)
+                    ON CONFLICT (email) DO NOTHING
+                """),
+                {"name": email.split("@")[0], "email": email, "password_hash": pw_hash},
+            )
+    db.engine.dispose()
+    return emails
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def _request(client, route):
+    if route == "GET /":
+        return await client.get("/")
+    if route == "GET /test":
+        return await client.get("/test")
+    if route == "GET /api/prompt":
+        return await client.get("/api/prompt", params={"words": 300, "source": random.choice(("1000", "5000"))})
+    if route == "POST /api/session_json":
+        return await client.post("/api/session_json", json={
+            "wpm": round(random.uniform(20, 140), 1),
+            "accuracy": round(random.uniform(0.85, 1.0), 3),
+            "duration_seconds": random.choice((15, 30, 60, 120)),
+            "prompt_id": 0,
+        })
+    if route == "GET /api/training_progress":
+        return await client.get("/api/training_progress")
+    if route == "POST /api/training_progress":
+        return await client.post("/api/training_progress", json={
+            "mode": random.choice(("easy", "advanced", "hard")),
+            "level": random.randint(1, 3),
+            "percent": random.randint(0, 100),
+        })
+    if route == "GET /leaderboard":
+        return await client.get("/leaderboard")
+    raise ValueError(route)
+
+
+async def login(client, email):
+    resp = await client.post("/login", data={"email": email, "password": PASSWORD}, follow_redirects=False)
+    if resp.status_code != 303 or "session_id" not in resp.cookies:
+        raise RuntimeError(f"login failed for {email}: {resp.status_code}")
+
+
+async def drive(make_client, emails, seconds, warmup, mix):
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    clients = [make_client() for _ in emails]
+    try:
+        await asyncio.gather(*(login(client, email) for client, email in zip(clients, emails)))
+        record_from = time.perf_counter() + warmup
+        stop_at = record_from + seconds
+
+        async def user_loop(client):
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    return
+                route = random.choices(names, weights)[0]
+                started = time.perf_counter()
+                try:
+                    resp = await _request(client, route)
+                    ok = resp.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                finished = time.perf_counter()
+                if started >= record_from:
+                    if ok:
+                        samples[route].append((finished - started) * 1000.0)
+                    else:
+                        errors[route] += 1
+
+        await asyncio.gather(*(user_loop(client) for client in clients))
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients))
+    return summarize(samples, errors, seconds)
+
+
+def summarize(samples, errors, seconds):
+    routes = {}
+    total = 0
+    for route, values in samples.items():
+        values.sort()
+        total += len(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "rps": round(len(values) / seconds, 2),
+            "p50_ms": _round(percentile(values, 50)),
+            "p95_ms": _round(percentile(values, 95)),
+            "p99_ms": _round(percentile(values, 99)),
+        }
+    return {"total_requests": total, "total_rps": round(total / seconds, 2), "routes": routes}
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+async def run_inprocess(emails, args):
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        return await drive(
+            lambda: httpx.AsyncClient(transport=transport, base_url="http://bench"),
+            emails, args.seconds, args.warmup, ROUTE_MIX,
+        )
+
+
+def start_server(server, port, workers, env):
+    if server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    elif server == "hypercorn":
+        cmd = [sys.executable, "-m", "hypercorn", "main:app", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(workers)]
+    elif server == "serve":
+        cmd = [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    else:
+        raise ValueError(server)
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"{server} exited early:\n{log.read().decode(errors='replace')}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/login", timeout=1.0).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"{server} did not become ready")
+
+
+async def run_server(emails, args, env, workers=None):
+    port = _free_port()
+    proc = start_server(args.target, port, workers or args.workers, env)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        return await drive(
+            lambda: httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30.0),
+            emails, args.seconds, args.warmup, ROUTE_MIX,
+        )
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def print_report(result):
+    print(f"\n{result['meta']['target']} / {result['meta']['backend']}  "
+          f"users={result['meta']['users']}  {result['total_rps']} req/s total")
+    print(f"{'route':<30}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}")
+    for route, stats in result["routes"].items():
+        print(f"{route:<30}{stats['rps']:>9}{_fmt(stats['p50_ms']):>9}{_fmt(stats['p95_ms']):>9}"
+              f"{_fmt(stats['p99_ms']):>9}{stats['errors']:>8}")
+
+
+def print_scaling(runs):
+    # speedup is relative to the first (usually single-worker) run
+    base = runs[0]["total_rps"] if runs else None
+    print(f"\n{'workers':>8}{'req/s':>10}{'speedup':>9}{'p99 worst ms':>14}")
+    for run in runs:
+        workers = run["meta"]["workers"]
+        speedup = run["total_rps"] / base if base else None
+        worst = max((r["p99_ms"] or 0.0) for r in run["routes"].values())
+        print(f"{workers:>8}{run['total_rps']:>10}{_fmt(speedup):>9}{worst:>14.1f}")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(base_path, new_path):
+    base = json.loads(Path(base_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{'route':<30}{'req/s':>18}{'p95 ms':>20}{'p99 ms':>20}")
+    for route, stats in new["routes"].items():
+        old = base["routes"].get(route)
+        if not old:
+            continue
+        print(f"{route:<30}{_delta(old['rps'], stats['rps']):>18}{_delta(old['p95_ms'], stats['p95_ms']):>20}"
+              f"{_delta(old['p99_ms'], stats['p99_ms']):>20}")
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return f"{_fmt(old)} -> {_fmt(new)}"
+    return f"{old:.1f}->{new:.1f} ({(new - old) / old * 100:+.0f}%)"
+
+
+def _meta(args, database_url, workers):
+    return {
+        "target": args.target,
+        "backend": database_url.split(":", 1)[0],
+        "users": args.users,
+        "workers": workers,
+        "seconds": args.seconds,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("inprocess", "uvicorn", "hypercorn", "serve"), default="inprocess")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users (one account each)")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--scale", help="comma-separated worker counts to run one after another, e.g. 1,2,4")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="Postgres URL; defaults to a temporary SQLite file")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two saved runs and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="typinglab-http-") as tmp:
+        database_url = args.database_url or f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ["DATABASE_URL"] = database_url
+        # match the seeded hashes so logins don't trigger a rehash to the production cost
+        os.environ.setdefault("TYPINGLAB_BCRYPT_ROUNDS", str(SEED_ROUNDS))
+        sys.path.insert(0, str(ROOT))
+        emails = seed_users(args.users)
+        if args.scale:
+            if args.target == "inprocess":
+                parser.error("--scale needs a server target")
+            runs = []
+            for workers in [int(n) for n in args.scale.split(",")]:
+                run = asyncio.run(run_server(emails, args, dict(os.environ), workers))
+                run["meta"] = _meta(args, database_url, workers)
+                print_report(run)
+                runs.append(run)
+        elif args.target == "inprocess":
+            result = asyncio.run(run_inprocess(emails, args))
+        else:
+            result = asyncio.run(run_server(emails, args, dict(os.environ)))
+
+    if args.scale:
+        print_scaling(runs)
+        if args.output:
+            Path(args.output).write_text(json.dumps({"runs": runs}, indent=2))
+        return
+    result["meta"] = _meta(args, database_url, args.workers)
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
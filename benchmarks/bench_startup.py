@@ -0,0 +1,152 @@
+"""Cold start time of a worker process.
+
+Each run is a fresh interpreter against a throwaway SQLite file (or
+DATABASE_URL with --postgres) and times the schema check in init_db() and
+the full `import main`, for three database states:
+
+    fresh     empty database, every migration runs
+    upgrade   populated database from before schema_version existed
+    current   schema up to date, the check is a single-row read
+
+    python benchmarks/bench_startup.py --runs 5 --sessions 20000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORKER = r"""
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, os.environ["TYPINGLAB_ROOT"])
+import db
+imported = time.perf_counter()
+db.init_db()
+checked = time.perf_counter()
+import main
+ready = time.perf_counter()
+print(json.dumps({
+    "import_db_ms": (imported - started) * 1000,
+    "init_db_ms": (checked - imported) * 1000,
+    "app_ms": (ready - started) * 1000,
+}))
+"""
+
+SEED = r"""
+import os, sys
+sys.path.insert(0, os.environ["TYPINGLAB_ROOT"])
+from sqlalchemy import text
+import db
+
+db.init_db()
+sessions = int(os.environ["BENCH_SESSIONS"])
+with db.engine.begin() as conn:
+    conn.execute(text("INSERT INTO users (email, password_hash) VALUES ('bench@startup', 'x') ON CONFLICT (email) DO NOTHING"))
+    user_id = conn.execute(text("SELECT id FROM users WHERE email = 'bench@startup'")).scalar()
+    conn.execute(
+        text("INSERT INTO typing_sessions (user_id, wpm, accuracy, duration_seconds, prompt_id) VALUES (:u, :w, 0.95, 60, 0)"),
+        [{"u": user_id, "w": 30.0 + i % 90} for i in range(sessions)],
+    )
+    # back to how a database looked before versioned migrations
+    for table in ("user_records", "global_records", "session_daily", "wpm_histogram"):
+        conn.execute(text(f"DELETE FROM {table}"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_typing_sessions_wpm"))
+    conn.execute(text("DROP TABLE schema_version"))
+"""
+
+RESET = r"""
+import os, sys
+sys.path.insert(0, os.environ["TYPINGLAB_ROOT"])
+from sqlalchemy import text
+import db
+with db.engine.begin() as conn:
+    conn.execute(text("DROP SCHEMA public CASCADE"))
+    conn.execute(text("CREATE SCHEMA public"))
+"""
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _python(script, env):
+    return subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def _start(env):
+    began = time.perf_counter()
+    out = _python(WORKER, env)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - began) * 1000
+    return result
+
+
+def run_state(state, runs, sessions, database_url=None):
+    """Start `runs` workers against a database prepared as `state` before each one."""
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="typinglab-bench-") as tmp:
+            env = dict(os.environ)
+            env["TYPINGLAB_ROOT"] = str(ROOT)
+            env["BENCH_SESSIONS"] = str(sessions)
+            env["DATABASE_URL"] = database_url or f"sqlite:///{Path(tmp) / 'bench.db'}"
+            if database_url:
+                _python(RESET, env)
+            if state == "upgrade":
+                _python(SEED, env)
+            elif state == "current":
+                _start(env)
+            samples.append(_start(env))
+    return {
+        key: round(statistics.median(sample[key] for sample in samples), 2)
+        for key in ("import_db_ms", "init_db_ms", "app_ms", "process_ms")
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--states", default="fresh,upgrade,current")
+    parser.add_argument("--runs", type=int, default=5, help="worker starts per state; medians are reported")
+    parser.add_argument("--sessions", type=int, default=20000, help="typing_sessions rows in the upgrade state")
+    parser.add_argument("--postgres", action="store_true", help="use DATABASE_URL (its public schema is dropped!)")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    database_url = os.environ.get("DATABASE_URL") if args.postgres else None
+    if args.postgres and not database_url:
+        parser.error("--postgres needs DATABASE_URL")
+
+    results = {
+        "_meta": {
+            "backend": (database_url or "sqlite").split(":", 1)[0],
+            "runs": args.runs,
+            "sessions": args.sessions,
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        }
+    }
+    for state in [s.strip() for s in args.states.split(",") if s.strip()]:
+        result = run_state(state, args.runs, args.sessions, database_url)
+        results[state] = result
+        print(
+            f"{state:<8} init_db {result['init_db_ms']:>9.2f} ms   import main {result['app_ms']:>8.1f} ms"
+            f"   process {result['process_ms']:>8.1f} ms"
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Write throughput of each storage profile.
+
+Runs every profile in a fresh subprocess (the engine is configured at import)
+against a throwaway SQLite file, or against DATABASE_URL when --postgres is
+given, and reports committed session writes per second.
+
+    python benchmarks/bench_storage.py --writers 8 --seconds 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+WORKER = r"""
+import json, os, sys, threading, time
+sys.path.insert(0, os.environ["TYPINGLAB_ROOT"])
+from sqlalchemy import text
+import db
+from ingest import save_sessions
+
+db.init_db()
+with db.engine.begin() as conn:
+    conn.execute(text("INSERT INTO users (email, password_hash) VALUES ('bench@storage', 'x') ON CONFLICT (email) DO NOTHING"))
+    user_id = conn.execute(text("SELECT id FROM users WHERE email = 'bench@storage'")).scalar()
+    conn.execute(text("INSERT INTO global_records (id, top_wpm) VALUES (1, NULL) ON CONFLICT (id) DO NOTHING"))
+
+writers = int(os.environ["BENCH_WRITERS"])
+seconds = float(os.environ["BENCH_SECONDS"])
+counts = [0] * writers
+errors = [0] * writers
+stop = time.monotonic() + seconds
+
+def run(i):
+    while time.monotonic() < stop:
+        try:
+            save_sessions([{"user_id": user_id, "wpm": 50.0 + i, "accuracy": 0.95, "duration_seconds": 60, "prompt_id": 0}])
+            counts[i] += 1
+        except Exception:
+            errors[i] += 1
+
+threads = [threading.Thread(target=run, args=(i,)) for i in range(writers)]
+started = time.monotonic()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.monotonic() - started
+print(json.dumps({
+    "profile": db.STORAGE_PROFILE,
+    "storage": db.describe_storage(),
+    "writes": sum(counts),
+    "errors": sum(errors),
+    "seconds": round(elapsed, 3),
+    "writes_per_second": round(sum(counts) / elapsed, 1),
+}))
+"""
+
+
+def run_profile(profile, writers, seconds, database_url=None):
+    env = dict(os.environ)
+    env.update({
+        "TYPINGLAB_ROOT": str(ROOT),
+        "TYPINGLAB_DB_PROFILE": profile,
+        "BENCH_WRITERS": str(writers),
+        "BENCH_SECONDS": str(seconds),
+    })
+    with tempfile.TemporaryDirectory(prefix="typinglab-bench-") as tmp:
+        if database_url:
+            env["DATABASE_URL"] = database_url
+        else:
+            env["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        out = subprocess.run([sys.executable, "-c", WORKER], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    sys.path.insert(0, str(ROOT))
+    from db import STORAGE_PROFILES
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", default=",".join(STORAGE_PROFILES))
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--postgres", action="store_true", help="use DATABASE_URL instead of a temporary SQLite file")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    database_url = os.environ.get("DATABASE_URL") if args.postgres else None
+    if args.postgres and not database_url:
+        parser.error("--postgres needs DATABASE_URL")
+
+    results = []
+    for profile in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+        result = run_profile(profile, args.writers, args.seconds, database_url)
+        results.append(result)
+        print(f"{profile:<12} {result['writes_per_second']:>10.1f} writes/s  ({result['writes']} ok, {result['errors']} errors)")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""WebSocket race benchmark.
+
+Starts a TypingLab server, logs in one account per virtual racer and keeps
+every racer connected to /ws/race: each one joins a room, types at its own
+pace once the race starts and rejoins when it ends. Reports connect latency,
+tick rate and spacing, races finished and the server's resident memory per
+open socket.
+
+    python benchmarks/bench_ws.py --sockets 200 --seconds 30
+    python benchmarks/bench_ws.py --sockets 2000 --workers 2 --output ws.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from bench_http import ROOT, SEED_ROUNDS, _free_port, _git_commit, _round, login, percentile, seed_users, start_server
+
+PROGRESS_INTERVAL = 0.2
+
+
+def _raise_fd_limit(needed: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, needed), hard))
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        print(f"warning: open file limit {soft} is below the {needed} this run needs", file=sys.stderr)
+
+
+def _rss_kb(pid: int) -> int:
+    """Resident memory of pid and all of its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{current}/task/{current}/children") as fh:
+                pending.extend(int(child) for child in fh.read().split())
+        except OSError:
+            continue
+    return total
+
+
+async def _cookies(base_url, emails):
+    cookies = []
+    # stay under the password hasher queue so logins are not shed
+    sem = asyncio.Semaphore(16)
+
+    async def one(email):
+        async with sem, httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+            await login(client, email)
+            cookies.append(f"session_id={client.cookies['session_id']}")
+
+    await asyncio.gather(*(one(email) for email in emails))
+    return cookies
+
+
+async def racer(url, cookie, stop_at, stats):
+    wpm = random.uniform(40, 120)
+    chars_per_second = wpm * 5 / 60.0
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        try:
+            async with connect(url, additional_headers={"Cookie": cookie}, open_timeout=30, ping_interval=None) as ws:
+                stats["connect_ms"].append((time.perf_counter() - started) * 1000.0)
+                typer = None
+                last_tick = None
+                async for raw in ws:
+                    msg = json.loads(raw)
+                    kind = msg["type"]
+                    if kind == "start":
+                        typer = asyncio.create_task(_type(ws, len(msg["text"]), msg["countdown"], chars_per_second))
+                    elif kind == "tick":
+                        now = time.perf_counter()
+                        stats["ticks"] += 1
+                        if last_tick is not None:
+                            stats["tick_gap_ms"].append((now - last_tick) * 1000.0)
+                        last_tick = now
+                    elif kind == "result":
+                        stats["results"] += 1
+                    elif kind == "end":
+                        stats["races"] += 1
+                if typer is not None:
+                    typer.cancel()
+                    await asyncio.gather(typer, return_exceptions=True)
+        except Exception:
+            stats["errors"] += 1
+            await asyncio.sleep(1.0)
+
+
+async def _type(ws, total, countdown, chars_per_second):
+    await asyncio.sleep(countdown)
+    started = time.perf_counter()
+    chars = 0
+    try:
+        while chars < total:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            chars = min(total, int((time.perf_counter() - started) * chars_per_second))
+            await ws.send(json.dumps({"type": "progress", "chars": chars, "accuracy": 0.97}))
+    except ConnectionClosed:
+        pass
+
+
+async def run(args, env):
+    port = _free_port()
+    proc = start_server(args.target, port, args.workers, env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        cookies = await _cookies(base_url, args.emails)
+        # after the logins, so the baseline includes session and hasher warm-up
+        idle_kb = _rss_kb(proc.pid)
+        stats = {"connect_ms": [], "tick_gap_ms": [], "ticks": 0, "results": 0, "races": 0, "errors": 0}
+        stop_at = time.perf_counter() + args.seconds
+        tasks = [asyncio.create_task(racer(f"ws://127.0.0.1:{port}/ws/race", c, stop_at, stats)) for c in cookies]
+        peak_kb = idle_kb
+        while time.perf_counter() < stop_at:
+            await asyncio.sleep(1.0)
+            peak_kb = max(peak_kb, _rss_kb(proc.pid))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    connect_ms = sorted(stats["connect_ms"])
+    gaps = sorted(stats["tick_gap_ms"])
+    return {
+        "sockets": len(cookies),
+        "connects": len(connect_ms),
+        "connect_p50_ms": _round(percentile(connect_ms, 50)),
+        "connect_p99_ms": _round(percentile(connect_ms, 99)),
+        "ticks_per_s": round(stats["ticks"] / args.seconds, 1),
+        "tick_gap_p50_ms": _round(percentile(gaps, 50)),
+        "tick_gap_p99_ms": _round(percentile(gaps, 99)),
+        "races": stats["races"],
+        "results": stats["results"],
+        "errors": stats["errors"],
+        "server_rss_idle_mb": round(idle_kb / 1024.0, 1),
+        "server_rss_peak_mb": round(peak_kb / 1024.0, 1),
+        "rss_per_socket_kb": round((peak_kb - idle_kb) / max(1, len(cookies)), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=("serve", "uvicorn", "hypercorn"), default="serve")
+    parser.add_argument("--sockets", type=int, default=200, help="concurrent racers (one account each)")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="Postgres URL; defaults to a temporary SQLite file")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    _raise_fd_limit(args.sockets * 2 + 256)
+    with tempfile.TemporaryDirectory(prefix="typinglab-ws-") as tmp:
+        database_url = args.database_url or f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ["DATABASE_URL"] = database_url
+        os.environ.setdefault("TYPINGLAB_BCRYPT_ROUNDS", str(SEED_ROUNDS))
+        os.environ.setdefault("TYPINGLAB_RACE_FILL_SECONDS", "1")
+        # short races so a run of a few seconds sees many of them finish
+        os.environ.setdefault("TYPINGLAB_RACE_WORDS", "15")
+        sys.path.insert(0, str(ROOT))
+        args.emails = seed_users(args.sockets, prefix="racer")
+        result = asyncio.run(run(args, dict(os.environ)))
+
+    result["meta"] = {
+        "target": args.target,
+        "backend": database_url.split(":", 1)[0],
+        "workers": args.workers,
+        "seconds": args.seconds,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
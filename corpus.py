@@ -0,0 +1,405 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+# Compiled files are mapped without further checks, so this must not be writable by anyone else.
+CORPUS_DIR = Path(os.environ.get("TYPINGLAB_CORPUS_DIR") or Path(__file__).with_name("corpus-cache"))
+# Word lists dropped here (one word per line, <name>.txt) are served as source=<name>.
+CORPORA_DIR = Path(os.environ.get("TYPINGLAB_CORPORA_DIR") or Path(__file__).with_name("corpora"))
+BUILTIN_CORPORA = {
+    "1000": Path(__file__).with_name("1000-common-english-words.txt"),
+    "5000": Path(__file__).with_name("5000_common_words.txt"),
+}
+DEFAULT_SOURCE = "1000"
+NAME_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+MAX_FILTER_CHARS = 64
+FILTER_CACHE_SIZE = 64
+
+# magic, word count, longest word (characters), alphabet size (bytes)
+_HEADER = struct.Struct("=8sIII4x")
+_MAGIC = b"TLWORDS2"
+# Characters beyond the 63 most frequent share the last mask bit.
+_MASK_BITS = 63
+_OTHER_BIT = np.uint64(1 << _MASK_BITS)
+
+
+def compile_words(words) -> bytes:
+    """Pack a word list with its length and character indexes.
+
+    Layout after the header, every section aligned for its element type:
+    uint64 character mask per word, uint32 offsets (count + 1), word ids
+    sorted by length, uint32 start of each length in that list
+    (max_len + 2), the mask alphabet and finally the UTF-8 blob.
+    """
+    words = list(words)
+    encoded = [w.encode("utf-8") for w in words]
+    lengths = [len(w) for w in words]
+    max_len = max(lengths, default=0)
+
+    frequency = Counter(ch for w in words for ch in set(w))
+    alphabet = "".join(sorted(frequency, key=lambda ch: (-frequency[ch], ch))[:_MASK_BITS])
+    bits = {ch: 1 << i for i, ch in enumerate(alphabet)}
+    masks = array("Q")
+    for w in words:
+        mask = 0
+        for ch in set(w):
+            mask |= bits.get(ch, 1 << _MASK_BITS)
+        masks.append(mask)
+
+    offsets = array("I", [0])
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    # stable sort keeps source order within a length
+    by_length = array("I", sorted(range(len(words)), key=lengths.__getitem__))
+    starts = array("I", [0] * (max_len + 2))
+    for n in lengths:
+        starts[n + 1] += 1
+    for n in range(1, max_len + 2):
+        starts[n] += starts[n - 1]
+
+    alphabet_bytes = alphabet.encode("utf-8")
+    return b"".join((
+        _HEADER.pack(_MAGIC, len(words), max_len, len(alphabet_bytes)),
+        masks.tobytes(),
+        offsets.tobytes(),
+        by_length.tobytes(),
+        starts.tobytes(),
+        alphabet_bytes,
+        b"".join(encoded),
+    ))
+
+
+class WordView:
+    """A filtered, read-only slice of a corpus: the words whose ids are in `ids`."""
+
+    __slots__ = ("_corpus", "_ids")
+
+    def __init__(self, corpus, ids):
+        self._corpus = corpus
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, index: int) -> str:
+        return self._corpus[self._ids[index]]
+
+
+class WordCorpus:
+    """Read-only word list backed by a memory-mapped compiled file.
+
+    Indexing and len() behave like the list it replaces. The pages belong to
+    the OS page cache, so every worker process mapping the same file shares
+    one copy instead of holding its own list of str objects. filter() uses
+    the length and character indexes stored alongside the words.
+    """
+
+    def __init__(self, path: Path, digest=None):
+        self.path = path
+        # of the source list; changes whenever the words do
+        self.digest = digest
+        with open(path, "rb") as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, max_len, alphabet_size = _HEADER.unpack_from(self._map)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a compiled word corpus")
+        self._count = count
+        self.max_len = max_len
+        view = memoryview(self._map)
+        pos = _HEADER.size
+        self._masks = np.frombuffer(self._map, dtype=np.uint64, count=count, offset=pos)
+        pos += 8 * count
+        self._offsets = view[pos:pos + 4 * (count + 1)].cast("I")
+        pos += 4 * (count + 1)
+        self._by_length = view[pos:pos + 4 * count].cast("I")
+        pos += 4 * count
+        self._length_starts = view[pos:pos + 4 * (max_len + 2)].cast("I")
+        pos += 4 * (max_len + 2)
+        self.alphabet = bytes(view[pos:pos + alphabet_size]).decode("utf-8")
+        self._bits = {ch: 1 << i for i, ch in enumerate(self.alphabet)}
+        self._blob = pos + alphabet_size
+        self._filters = OrderedDict()
+        self._filters_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += self._count
+            if index < 0:
+                raise IndexError("word index out of range")
+        # offsets has count + 1 entries, so index == count raises IndexError here
+        end = self._offsets[index + 1]
+        base = self._blob
+        return self._map[base + self._offsets[index]:base + end].decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._map)
+
+    def filter(self, min_len: int = 1, max_len: int = 0, chars: str = ""):
+        """Words of min_len..max_len characters (0 = no upper bound) made only of `chars`.
+
+        A length range is a slice of the length index and costs nothing. A
+        character filter is one vectorised mask test over that slice; its
+        result is cached per corpus.
+        """
+        max_len = self.max_len if max_len <= 0 else min(max_len, self.max_len)
+        min_len = max(0, min_len)
+        if min_len > max_len:
+            return WordView(self, ())
+        ids = self._by_length[self._length_starts[min_len]:self._length_starts[max_len + 1]]
+        if not chars:
+            return self if len(ids) == self._count else WordView(self, ids)
+        key = (min_len, max_len, chars)
+        with self._filters_lock:
+            cached = self._filters.get(key)
+            if cached is not None:
+                self._filters.move_to_end(key)
+                return cached
+        view = WordView(self, self._match_chars(ids, chars))
+        with self._filters_lock:
+            self._filters[key] = view
+            while len(self._filters) > FILTER_CACHE_SIZE:
+                self._filters.popitem(last=False)
+        return view
+
+    def _match_chars(self, ids, chars: str):
+        allowed = 0
+        outside = False
+        for ch in chars:
+            bit = self._bits.get(ch)
+            if bit is None:
+                outside = True
+            else:
+                allowed |= bit
+        if outside:
+            allowed |= 1 << _MASK_BITS
+        candidates = np.frombuffer(ids, dtype=np.uint32)
+        keep = candidates[(self._masks[candidates] & np.uint64(~allowed & (2 ** 64 - 1))) == 0]
+        if outside:
+            # the shared bit only says "some rare character"; check those words exactly
+            charset = set(chars)
+            rare = (self._masks[keep] & _OTHER_BIT) != 0
+            if rare.any():
+                exact = np.array([set(self[int(i)]) <= charset for i in keep[rare]], dtype=bool)
+                rare[rare] = ~exact
+                keep = keep[~rare]
+        return memoryview(np.ascontiguousarray(keep, dtype=np.uint32)).cast("B").cast("I")
+
+
+def _read_words(source: Path):
+    return [w.strip() for w in source.read_text(encoding="utf-8").splitlines() if w.strip()]
+
+
+def _check_private(path: Path, writable_mask: int = 0o022) -> None:
+    """Raise OSError unless `path` is ours and nobody else can write to it."""
+    if not hasattr(os, "getuid"):
+        return
+    st = path.stat()
+    if st.st_uid != os.getuid() or st.st_mode & writable_mask:
+        raise OSError(f"{path} is not private to this user")
+
+
+def load_words(source: Path):
+    """Compile `source` (one word per line) once and map it; [] if it is missing.
+
+    The compiled name carries a digest of the source and the format, so an
+    edited word list gets a new file and a stale one is never mapped. If the
+    corpus directory is not writable, or is not private to this user, the
+    words are returned as a plain list.
+    """
+    try:
+        raw = source.read_bytes()
+    except OSError:
+        return []
+    digest = hashlib.sha1(_MAGIC + raw).hexdigest()[:12]
+    target = CORPUS_DIR / f"{source.stem}.{digest}.words"
+    try:
+        CORPUS_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        _check_private(CORPUS_DIR)
+        if not target.exists():
+            tmp = target.with_suffix(f".tmp{os.getpid()}")
+            tmp.write_bytes(compile_words(_read_words(source)))
+            os.replace(tmp, target)
+        # the directory already keeps others out; the file only has to be ours
+        _check_private(target, 0)
+        return WordCorpus(target, digest)
+    except (OSError, ValueError):
+        return _read_words(source)
+
+
+def filter_words(words, min_len: int = 1, max_len: int = 0, chars: str = ""):
+    """filter() for any word list; plain lists are scanned."""
+    if isinstance(words, WordCorpus):
+        return words.filter(min_len, max_len, chars)
+    charset = set(chars)
+    return [
+        w for w in words
+        if len(w) >= min_len and (max_len <= 0 or len(w) <= max_len) and (not chars or set(w) <= charset)
+    ]
+
+
+def parse_source(spec):
+    """Split a source spec into (name, min_len, max_len, chars), or None if malformed.
+
+    A spec is a corpus name optionally followed by filters, e.g.
+    "5000;len=4-7" or "1000;len=3-0;chars=asdfghjkl". "chars" is always
+    last so it may contain any character, including ";".
+    """
+    if not spec:
+        return None
+    spec, _, chars = str(spec).partition(";chars=")
+    name, *options = spec.split(";")
+    if not NAME_PATTERN.match(name) or len(chars) > MAX_FILTER_CHARS:
+        return None
+    min_len, max_len = 1, 0
+    for option in options:
+        key, _, value = option.partition("=")
+        if key != "len":
+            return None
+        low, _, high = value.partition("-")
+        try:
+            min_len, max_len = int(low), int(high or 0)
+        except ValueError:
+            return None
+        if not (0 <= min_len <= 64 and 0 <= max_len <= 64):
+            return None
+    return name, min_len, max_len, "".join(sorted(set(chars)))
+
+
+def format_source(name: str, min_len: int = 1, max_len: int = 0, chars: str = "") -> str:
+    """The canonical spec for parse_source()'s fields."""
+    spec = name
+    if min_len != 1 or max_len:
+        spec += f";len={min_len}-{max_len}"
+    if chars:
+        spec += ";chars=" + "".join(sorted(set(chars)))
+    return spec
+
+
+class CorpusRegistry:
+    """Named word lists: the built-in ones plus every <name>.txt in CORPORA_DIR.
+
+    A corpus is compiled and mapped on first use; files added to the
+    directory are picked up without a restart.
+    """
+
+    def __init__(self, builtin=BUILTIN_CORPORA, directory=CORPORA_DIR):
+        self.builtin = dict(builtin)
+        self.directory = directory
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name: str):
+        if name in self.builtin:
+            return self.builtin[name]
+        if not NAME_PATTERN.match(name):
+            return None
+        path = self.directory / f"{name}.txt"
+        return path if path.is_file() else None
+
+    def get(self, name: str):
+        """The word list registered as `name`, or None."""
+        words = self._loaded.get(name)
+        if words is not None:
+            return words
+        path = self._path(name)
+        if path is None:
+            return None
+        with self._lock:
+            words = self._loaded.get(name)
+            if words is None:
+                words = self._loaded[name] = load_words(path)
+        return words
+
+    def names(self) -> list:
+        found = set(self.builtin)
+        try:
+            found.update(p.stem for p in self.directory.glob("*.txt") if NAME_PATTERN.match(p.stem))
+        except OSError:
+            pass
+        return sorted(found)
+
+    def resolve(self, spec):
+        """The canonical form of `spec` if it names a registered corpus, else None."""
+        parsed = parse_source(spec)
+        if parsed is None or self._path(parsed[0]) is None:
+            return None
+        return format_source(*parsed)
+
+    def pool(self, spec):
+        """The words a (resolved) source spec selects; [] if there are none."""
+        parsed = parse_source(spec)
+        if parsed is None:
+            return []
+        words = self.get(parsed[0])
+        if not words:
+            return []
+        name, min_len, max_len, chars = parsed
+        if min_len == 1 and not max_len and not chars:
+            return words
+        return filter_words(words, min_len, max_len, chars)
+
+    def digest(self, spec):
+        """Digest of the corpus behind a source spec, or None if it is not compiled."""
+        parsed = parse_source(spec)
+        if parsed is None:
+            return None
+        return getattr(self.get(parsed[0]), "digest", None)
+
+    def describe(self) -> list:
+        out = []
+        for name in self.names():
+            words = self.get(name)
+            out.append({
+                "name": name,
+                "words": len(words) if words else 0,
+                "max_length": getattr(words, "max_len", max((len(w) for w in words or ()), default=0)),
+            })
+        return out
+
+
+corpora = CorpusRegistry()
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["list"]:
+        for entry in corpora.describe():
+            print(f"{entry['name']:<20} {entry['words']:>8} words  longest {entry['max_length']}")
+        return 0
+    if len(argv) == 2 and argv[0] == "compile":
+        words = load_words(Path(argv[1]))
+        if not isinstance(words, WordCorpus):
+            print(f"could not compile {argv[1]}", file=sys.stderr)
+            return 1
+        print(f"{words.path} ({len(words)} words, {words.nbytes} bytes)")
+        return 0
+    if len(argv) in (2, 3) and argv[0] == "sample":
+        spec = corpora.resolve(argv[1])
+        pool = corpora.pool(spec) if spec else []
+        if not pool:
+            print(f"no words for {argv[1]!r}", file=sys.stderr)
+            return 1
+        count = int(argv[2]) if len(argv) == 3 else 20
+        from prompt_pool import generate_prompts
+        print(f"{spec}: {len(pool)} words")
+        print(generate_prompts(pool, 1, count)[0])
+        return 0
+    print("usage: python corpus.py list | compile <words.txt> | sample <source spec> [count]", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import os
 from pathlib import Path
 
-from sqlalchemy import create_engine, event, text
+from sqlalchemy import create_engine, event
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 if DATABASE_URL:
@@ -9,141 +9,111 @@ if DATABASE_URL:
 else:
     db_url = f"sqlite:///{Path(__file__).with_name('app.db')}"
 
-engine = create_engine(db_url, future=True, pool_pre_ping=True)
+# Storage profiles. SQLite keys become PRAGMAs on every new connection;
+# pool keys are passed to create_engine for either backend.
+STORAGE_PROFILES = {
+    "legacy": {
+        "sqlite": {},
+        "pool": {},
+    },
+    "balanced": {
+        "sqlite": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -64 * 1024,
+            "mmap_size": 256 * 1024 * 1024,
+        },
+        "pool": {"pool_size": 5, "max_overflow": 10, "pool_recycle": 1800},
+    },
+    "throughput": {
+        "sqlite": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 10000,
+            "cache_size": -256 * 1024,
+            "mmap_size": 1024 * 1024 * 1024,
+            "temp_store": "MEMORY",
+        },
+        "pool": {"pool_size": 20, "max_overflow": 20, "pool_recycle": 1800},
+    },
+    "durable": {
+        "sqlite": {
+            "journal_mode": "WAL",
+            "synchronous": "FULL",
+            "busy_timeout": 5000,
+            "cache_size": -64 * 1024,
+        },
+        "pool": {"pool_size": 5, "max_overflow": 5, "pool_recycle": 1800},
+    },
+}
+
+STORAGE_PROFILE = os.environ.get("TYPINGLAB_DB_PROFILE", "balanced").strip().lower()
+if STORAGE_PROFILE not in STORAGE_PROFILES:
+    STORAGE_PROFILE = "balanced"
+
+_ENV_OVERRIDES = {
+    "sqlite": {
+        "synchronous": "TYPINGLAB_SQLITE_SYNCHRONOUS",
+        "busy_timeout": "TYPINGLAB_SQLITE_BUSY_TIMEOUT_MS",
+        "cache_size": "TYPINGLAB_SQLITE_CACHE_SIZE",
+        "mmap_size": "TYPINGLAB_SQLITE_MMAP_SIZE",
+    },
+    "pool": {
+        "pool_size": "TYPINGLAB_DB_POOL_SIZE",
+        "max_overflow": "TYPINGLAB_DB_MAX_OVERFLOW",
+        "pool_recycle": "TYPINGLAB_DB_POOL_RECYCLE",
+    },
+}
+
+
+# Set by serve.py (or by hand for any multi-process server). The profile's
+# pool is a budget for the whole deployment, split across the workers.
+WORKERS = max(1, int(os.environ.get("TYPINGLAB_WORKERS", "1")))
+
+
+def _storage_settings(profile: str) -> dict:
+    settings = {key: dict(values) for key, values in STORAGE_PROFILES[profile].items()}
+    pool = settings["pool"]
+    if WORKERS > 1 and "pool_size" in pool:
+        pool["pool_size"] = max(2, -(-pool["pool_size"] // WORKERS))
+        pool["max_overflow"] = -(-pool.get("max_overflow", 0) // WORKERS)
+    for section, names in _ENV_OVERRIDES.items():
+        for key, env_name in names.items():
+            value = os.environ.get(env_name)
+            if value:
+                settings[section][key] = value if key == "synchronous" else int(value)
+    return settings
+
+
+storage = _storage_settings(STORAGE_PROFILE)
+
+engine = create_engine(db_url, future=True, pool_pre_ping=True, **storage["pool"])
 
 if engine.dialect.name == "sqlite":
     @event.listens_for(engine, "connect")
     def _set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON;")
+        for key, value in storage["sqlite"].items():
+            cursor.execute(f"PRAGMA {key}={value};")
         cursor.close()
 
 
+def describe_storage() -> str:
+    parts = [f"profile={STORAGE_PROFILE}", f"backend={engine.dialect.name}", f"workers={WORKERS}"]
+    if engine.dialect.name == "sqlite":
+        parts += [f"{key}={value}" for key, value in storage["sqlite"].items()]
+    parts += [f"{key}={value}" for key, value in storage["pool"].items()]
+    return " ".join(parts)
+
+
 def get_conn():
     return engine.connect()
 
 
 def init_db() -> None:
-    is_sqlite = engine.dialect.name == "sqlite"
-    with engine.begin() as conn:
-        if is_sqlite:
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                email TEXT UNIQUE NOT NULL,
-                rating INTEGER NOT NULL DEFAULT 1500,
-                password_hash BLOB NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
-            );
-            """))
-            # lightweight migration for existing DBs
-            cols = {row[1] for row in conn.execute(text("PRAGMA table_info(users)"))}
-            if "name" not in cols:
-                conn.execute(text("ALTER TABLE users ADD COLUMN name TEXT;"))
-            if "rating" not in cols:
-                conn.execute(text("ALTER TABLE users ADD COLUMN rating INTEGER NOT NULL DEFAULT 1500;"))
-        else:
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name TEXT,
-                email TEXT UNIQUE NOT NULL,
-                rating INTEGER NOT NULL DEFAULT 1500,
-                password_hash BYTEA NOT NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
-            );
-            """))
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS name TEXT;"))
-            conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS rating INTEGER NOT NULL DEFAULT 1500;"))
-
-        if is_sqlite:
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS auth_sessions (
-                session_id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS preferences (
-                user_id INTEGER PRIMARY KEY,
-                duration_seconds INTEGER NOT NULL DEFAULT 60,
-                theme TEXT NOT NULL DEFAULT 'light',
-                live_wpm INTEGER NOT NULL DEFAULT 1,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS typing_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                wpm REAL NOT NULL,
-                accuracy REAL NOT NULL,
-                duration_seconds INTEGER NOT NULL,
-                prompt_id INTEGER NOT NULL,
-                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS training_progress (
-                user_id INTEGER NOT NULL,
-                mode TEXT NOT NULL,
-                level INTEGER NOT NULL,
-                percent INTEGER NOT NULL DEFAULT 0,
-                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, mode, level),
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-        else:
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS auth_sessions (
-                session_id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS preferences (
-                user_id INTEGER PRIMARY KEY,
-                duration_seconds INTEGER NOT NULL DEFAULT 60,
-                theme TEXT NOT NULL DEFAULT 'light',
-                live_wpm INTEGER NOT NULL DEFAULT 1,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS typing_sessions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                wpm DOUBLE PRECISION NOT NULL,
-                accuracy DOUBLE PRECISION NOT NULL,
-                duration_seconds INTEGER NOT NULL,
-                prompt_id INTEGER NOT NULL,
-                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
-
-            conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS training_progress (
-                user_id INTEGER NOT NULL,
-                mode TEXT NOT NULL,
-                level INTEGER NOT NULL,
-                percent INTEGER NOT NULL DEFAULT 0,
-                updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (user_id, mode, level),
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-            """))
+    """Bring the schema up to date; a single-row read when it already is (see migrations.py)."""
+    from migrations import ensure_current
+
+    ensure_current()
@@ -0,0 +1,248 @@
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import text
+
+import history as session_history
+import rating
+from db import engine, get_conn
+
+FETCH_CHUNK = 100_000
+WRITE_CHUNK = 5_000
+
+
+def default_params() -> dict:
+    return {
+        "w0": rating.ELO_W0,
+        "k": rating.ELO_K,
+        "p": rating.ELO_P,
+        "loss_damping": rating.LOSS_DAMPING,
+        "duration_factors": dict(rating.DURATION_FACTORS),
+    }
+
+
+def load_history(conn=None) -> dict:
+    """Load every stored session in chronological order as flat NumPy arrays.
+
+    After retention compaction (see retention.py) this is only the sessions
+    that were kept, so a replay no longer matches the ratings users earned.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    result = conn.execution_options(stream_results=True).execute(text("""
+        SELECT user_id, wpm, duration_seconds
+        FROM typing_sessions
+        ORDER BY created_at, id
+    """))
+    users, wpms, durations = [], [], []
+    while True:
+        rows = result.fetchmany(FETCH_CHUNK)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.float64)
+        users.append(chunk[:, 0].astype(np.int64))
+        wpms.append(chunk[:, 1])
+        durations.append(chunk[:, 2].astype(np.int16))
+    if own_conn:
+        conn.close()
+    if not users:
+        return prepare_history(np.zeros(0, np.int64), np.zeros(0), np.zeros(0, np.int16))
+    return prepare_history(np.concatenate(users), np.concatenate(wpms), np.concatenate(durations))
+
+
+def prepare_history(user_ids, wpm, duration) -> dict:
+    """Precompute the per-step session layout used by replay().
+
+    Sessions are regrouped so that step k holds every user's k-th session.
+    Each step touches each user at most once, so a step is one vectorized
+    update and only the steps themselves run in sequence.
+    """
+    uniq, user_idx = np.unique(user_ids, return_inverse=True)
+    n = len(user_idx)
+    by_user = np.argsort(user_idx, kind="stable")
+    counts = np.bincount(user_idx, minlength=len(uniq))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    nth = np.empty(n, dtype=np.int64)
+    nth[by_user] = np.arange(n) - np.repeat(starts, counts)
+    order = np.lexsort((np.arange(n), nth))
+    step_sizes = np.bincount(nth, minlength=int(nth.max()) + 1 if n else 0)
+    return {
+        "user_ids": uniq,
+        "user_idx": user_idx[order].astype(np.int32),
+        "wpm": np.asarray(wpm, dtype=np.float64)[order],
+        "duration": np.asarray(duration, dtype=np.int16)[order],
+        "step_bounds": np.concatenate(([0], np.cumsum(step_sizes))),
+    }
+
+
+def _factor_table(duration_factors) -> np.ndarray:
+    table = np.ones(max(duration_factors, default=0) + 1, dtype=np.float64)
+    for seconds, factor in duration_factors.items():
+        table[seconds] = factor
+    return table
+
+
+def replay(history: dict, params=None, initial=rating.DEFAULT_RATING):
+    """Replay all sessions; returns (final ratings per user, calibration loss).
+
+    Ratings are rounded to integers after every session, matching what the
+    live path stores in users.rating. The loss is the mean squared log ratio
+    between actual and expected WPM, measured before each update.
+    """
+    p = default_params() if params is None else {**default_params(), **params}
+    user_idx = history["user_idx"]
+    wpm = history["wpm"]
+    bounds = history["step_bounds"]
+    table = _factor_table(p["duration_factors"])
+    duration = history["duration"]
+    factor = np.where(duration < len(table), table[np.minimum(duration, len(table) - 1)], 1.0)
+
+    ratings = np.full(len(history["user_ids"]), float(initial))
+    loss_sum = 0.0
+    loss_n = 0
+    for step in range(len(bounds) - 1):
+        lo, hi = bounds[step], bounds[step + 1]
+        users = user_idx[lo:hi]
+        perf = wpm[lo:hi]
+        current = ratings[users]
+        expected = p["w0"] * np.power(10.0, (current - 1500.0) / 400.0)
+        ratio = perf / expected
+        positive = ratio > 0
+        with np.errstate(divide="ignore"):
+            score = np.where(positive, 1.0 / (1.0 + np.power(1.0 / np.where(positive, ratio, 1.0), p["p"])), 0.0)
+            log_ratio = np.log(ratio[positive])
+        loss_sum += float(np.dot(log_ratio, log_ratio))
+        loss_n += int(log_ratio.size)
+        delta = p["k"] * (score - 0.5) * factor[lo:hi]
+        delta = np.where(delta < 0, delta * p["loss_damping"], delta)
+        ratings[users] = np.rint(np.clip(current + delta, rating.RATING_MIN, rating.RATING_MAX))
+    loss = loss_sum / loss_n if loss_n else None
+    return ratings, loss
+
+
+def write_ratings(user_ids, ratings) -> int:
+    rows = [{"id": int(u), "rating": int(r)} for u, r in zip(user_ids, ratings)]
+    with engine.begin() as conn:
+        for i in range(0, len(rows), WRITE_CHUNK):
+            conn.execute(text("UPDATE users SET rating = :rating WHERE id = :id"), rows[i:i + WRITE_CHUNK])
+    return len(rows)
+
+
+_worker_history = None
+
+
+def _init_worker(directory) -> None:
+    global _worker_history
+    # memory-mapped so workers share the page cache instead of copying arrays
+    _worker_history = {
+        name: np.load(Path(directory) / f"{name}.npy", mmap_mode="r")
+        for name in ("user_ids", "user_idx", "wpm", "duration", "step_bounds")
+    }
+
+
+def _score_params(params):
+    _, loss = replay(_worker_history, params)
+    return params, loss
+
+
+def sweep(history: dict, grid, jobs=None):
+    """Replay history once per parameter set in parallel; returns [(params, loss)] sorted by loss."""
+    with tempfile.TemporaryDirectory(prefix="elo-sweep-") as directory:
+        for name, arr in history.items():
+            np.save(Path(directory) / f"{name}.npy", arr)
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(directory,)) as pool:
+            results = list(pool.map(_score_params, grid))
+    return sorted(results, key=lambda item: float("inf") if item[1] is None else item[1])
+
+
+def build_grid(w0_values, k_values, p_values):
+    return [{"w0": w0, "k": k, "p": p} for w0, k, p in itertools.product(w0_values, k_values, p_values)]
+
+
+def synthetic_history(sessions: int, users: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    user_ids = rng.integers(1, users + 1, size=sessions)
+    skill = rng.lognormal(np.log(55), 0.35, size=users + 1)
+    wpm = np.clip(skill[user_ids] * rng.normal(1.0, 0.1, size=sessions), 0, 400)
+    duration = rng.choice(np.array([15, 30, 60, 120], dtype=np.int16), size=sessions)
+    return prepare_history(user_ids, wpm, duration)
+
+
+def _floats(value: str):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay and calibrate the ELO rating model over typing history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_replay = sub.add_parser("replay", help="recompute every rating from history")
+    p_replay.add_argument("--w0", type=float, default=rating.ELO_W0)
+    p_replay.add_argument("--k", type=float, default=rating.ELO_K)
+    p_replay.add_argument("--p", type=float, default=rating.ELO_P)
+    p_replay.add_argument("--write", action="store_true", help="store the recalculated ratings in users.rating")
+
+    p_sweep = sub.add_parser("sweep", help="score a parameter grid by calibration loss")
+    p_sweep.add_argument("--w0", type=_floats, default=[rating.ELO_W0])
+    p_sweep.add_argument("--k", type=_floats, default=[rating.ELO_K])
+    p_sweep.add_argument("--p", type=_floats, default=[rating.ELO_P])
+    p_sweep.add_argument("--jobs", type=int, default=os.cpu_count())
+    p_sweep.add_argument("--top", type=int, default=10)
+
+    p_bench = sub.add_parser("bench", help="time a replay over synthetic history")
+    p_bench.add_argument("--sessions", type=int, default=10_000_000)
+    p_bench.add_argument("--users", type=int, default=100_000)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        started = time.perf_counter()
+        history = synthetic_history(args.sessions, args.users)
+        prepared = time.perf_counter()
+        _, loss = replay(history)
+        done = time.perf_counter()
+        print(f"{args.sessions} sessions / {args.users} users: prepare {prepared - started:.2f}s, replay {done - prepared:.2f}s, loss {loss:.4f}")
+        return 0
+
+    conn = get_conn()
+    compacted = session_history.compacted_before(conn)
+    conn.close()
+    if compacted is not None:
+        if args.command == "replay" and args.write:
+            print(f"sessions before {compacted} were compacted; refusing to overwrite ratings from partial history",
+                  file=sys.stderr)
+            return 1
+        print(f"WARNING: sessions before {compacted} were compacted; replaying only the sessions that were kept",
+              file=sys.stderr)
+
+    started = time.perf_counter()
+    history = load_history()
+    loaded = time.perf_counter()
+    print(f"loaded {len(history['wpm'])} sessions for {len(history['user_ids'])} users in {loaded - started:.2f}s")
+
+    if args.command == "replay":
+        ratings, loss = replay(history, {"w0": args.w0, "k": args.k, "p": args.p})
+        print(f"replayed in {time.perf_counter() - loaded:.2f}s, calibration loss {loss}")
+        if args.write:
+            written = write_ratings(history["user_ids"], ratings)
+            print(f"updated {written} user ratings")
+        return 0
+
+    grid = build_grid(args.w0, args.k, args.p)
+    results = sweep(history, grid, jobs=args.jobs)
+    print(f"swept {len(grid)} parameter sets in {time.perf_counter() - loaded:.2f}s")
+    for params, loss in results[:args.top]:
+        print(f"w0={params['w0']:g} k={params['k']:g} p={params['p']:g} loss={loss}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import text
+
+from db import engine, get_conn, init_db
+
+CHUNK_ROWS = 5000
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Exportable tables in foreign-key order; imports run in the same order.
+TABLES = {
+    "users": ("id", "name", "email", "rating", "password_hash", "created_at"),
+    "typing_sessions": ("id", "user_id", "wpm", "accuracy", "duration_seconds", "prompt_id", "created_at"),
+    "training_progress": ("user_id", "mode", "level", "percent", "updated_at"),
+    # rollups and histogram counts of compacted days exist nowhere else (see retention.py)
+    "session_daily": ("user_id", "day", "session_count", "wpm_sum", "best_wpm", "accuracy_sum"),
+    "wpm_histogram": ("duration_seconds", "bucket", "count"),
+    "retention_state": ("id", "sessions_compacted_before"),
+}
+ORDER_BY = {
+    "users": "id",
+    "typing_sessions": "id",
+    "training_progress": "user_id, mode, level",
+    "session_daily": "user_id, day",
+    "wpm_histogram": "duration_seconds, bucket",
+    "retention_state": "id",
+}
+# tables whose id comes from a sequence that must be moved past imported ids on Postgres
+SERIAL_TABLES = ("users", "typing_sessions")
+
+INT_COLUMNS = {
+    "id", "user_id", "rating", "duration_seconds", "prompt_id", "level", "percent", "session_count", "bucket", "count",
+}
+FLOAT_COLUMNS = {"wpm", "accuracy", "wpm_sum", "best_wpm", "accuracy_sum"}
+BLOB_COLUMNS = {"password_hash"}
+
+# the columns a user gets in their own export
+HISTORY_COLUMNS = ("id", "wpm", "accuracy", "duration_seconds", "prompt_id", "created_at")
+# keyset chunks over the (user_id, created_at, id) index, oldest first; each
+# chunk uses its own short-lived connection, so a slow download pins nothing
+HISTORY_FIRST_QUERY = text(f"""
+    SELECT {", ".join(HISTORY_COLUMNS)}
+    FROM typing_sessions
+    WHERE user_id = :user_id
+    ORDER BY created_at, id
+    LIMIT :limit
+""")
+HISTORY_NEXT_QUERY = text(f"""
+    SELECT {", ".join(HISTORY_COLUMNS)}
+    FROM typing_sessions
+    WHERE user_id = :user_id
+      AND (created_at, id) > (:created_at, :id)
+    ORDER BY created_at, id
+    LIMIT :limit
+""")
+
+_is_sqlite = engine.dialect.name == "sqlite"
+
+
+def _timestamp(value):
+    """Timestamps travel as UTC 'YYYY-MM-DD HH:MM:SS[.ffffff]', the form SQLite stores."""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _export_value(column, value):
+    if value is None:
+        return None
+    if column in BLOB_COLUMNS:
+        return (value.encode("utf-8") if isinstance(value, str) else bytes(value)).hex()
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    return _timestamp(value)
+
+
+def _import_value(column, value):
+    if value is None or value == "":
+        return None
+    if column in BLOB_COLUMNS:
+        return bytes.fromhex(value)
+    if column in INT_COLUMNS:
+        return int(value)
+    if column in FLOAT_COLUMNS:
+        return float(value)
+    return value
+
+
+def iter_table(table: str, chunk_rows: int = CHUNK_ROWS):
+    """Yield a table as lists of export-ready tuples, read through a server-side cursor."""
+    columns = TABLES[table]
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(
+            text(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {ORDER_BY[table]}")
+        )
+        for partition in result.partitions(chunk_rows):
+            yield [tuple(_export_value(c, v) for c, v in zip(columns, row)) for row in partition]
+
+
+def iter_history(user_id: int, chunk_rows: int = CHUNK_ROWS):
+    """Yield one user's typing sessions, oldest first, in keyset chunks."""
+    params = {"user_id": user_id, "limit": chunk_rows}
+    query = HISTORY_FIRST_QUERY
+    while True:
+        conn = get_conn()
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+        if not rows:
+            return
+        yield [tuple(_export_value(c, v) for c, v in zip(HISTORY_COLUMNS, row)) for row in rows]
+        if len(rows) < chunk_rows:
+            return
+        params["created_at"], params["id"] = rows[-1].created_at, rows[-1].id
+        query = HISTORY_NEXT_QUERY
+
+
+def encode(fmt: str, columns, chunks):
+    """Turn row chunks into NDJSON or CSV text, one string per chunk."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for rows in chunks:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            yield "".join(json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n" for row in rows)
+
+
+def read_rows(table: str, path: Path):
+    """Yield import-ready tuples from an NDJSON or CSV export of `table`."""
+    columns = TABLES[table]
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.suffix == ".csv":
+            reader = csv.reader(handle)
+            header = next(reader, None)
+            if header is None:
+                return
+            missing = set(columns) - set(header)
+            if missing:
+                raise ValueError(f"{path}: missing columns {', '.join(sorted(missing))}")
+            positions = [header.index(c) for c in columns]
+            for record in reader:
+                yield tuple(_import_value(c, record[i]) for c, i in zip(columns, positions))
+        else:
+            for line in handle:
+                if line.strip():
+                    record = json.loads(line)
+                    yield tuple(_import_value(c, record.get(c)) for c in columns)
+
+
+def _chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_rows(table: str, rows, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Bulk insert into `table` in one transaction: executemany on SQLite, COPY on Postgres.
+
+    Meant for an empty install; conflicting rows abort the whole table.
+    """
+    columns = TABLES[table]
+    count = 0
+    with engine.begin() as conn:
+        if _is_sqlite:
+            insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            for chunk in _chunked(rows, chunk_rows):
+                conn.exec_driver_sql(insert, chunk)
+                count += len(chunk)
+        else:
+            # exported timestamps carry no zone and are UTC
+            conn.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+            cursor = conn.connection.cursor()
+            with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    count += 1
+            if table in SERIAL_TABLES:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}"
+                ))
+    return count
+
+
+def rebuild_aggregates() -> None:
+    """Derive the records, rollups and histograms from freshly imported sessions."""
+    import history
+    import records
+    import wpm_histogram
+
+    records.rebuild()
+    history.rebuild()
+    conn = get_conn()
+    compacted = history.compacted_before(conn)
+    conn.close()
+    # after compaction the imported histogram is the only count of the deleted sessions
+    if compacted is None:
+        wpm_histogram.rebuild()
+    else:
+        wpm_histogram.reload()
+
+
+def dump(directory: Path, fmt: str, tables) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for table in tables:
+        path = directory / f"{table}.{fmt}"
+        counted = [0]
+
+        def chunks():
+            for rows in iter_table(table):
+                counted[0] += len(rows)
+                yield rows
+
+        with open(path, "w", newline="", encoding="utf-8") as out:
+            out.writelines(encode(fmt, TABLES[table], chunks()))
+        print(f"{table}: {counted[0]} rows -> {path}")
+
+
+def load(directory: Path, tables) -> None:
+    for table in tables:
+        found = [directory / f"{table}.{fmt}" for fmt in FORMATS if (directory / f"{table}.{fmt}").exists()]
+        if not found:
+            print(f"{table}: no export in {directory}, skipped")
+            continue
+        rows = import_rows(table, read_rows(table, found[0]))
+        print(f"{table}: {rows} rows <- {found[0]}")
+    rebuild_aggregates()
+    print("records, daily rollups and WPM histograms rebuilt")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and bulk-import users, typing history and training progress.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_dump = sub.add_parser("dump", help="write every table to DIR/<table>.<format>")
+    p_dump.add_argument("directory", type=Path)
+    p_dump.add_argument("--format", choices=FORMATS, default="ndjson")
+    p_dump.add_argument("--tables", default=",".join(TABLES))
+
+    p_export = sub.add_parser("export", help="stream one table to stdout")
+    p_export.add_argument("table", choices=TABLES)
+    p_export.add_argument("--format", choices=FORMATS, default="ndjson")
+
+    p_load = sub.add_parser("load", help="import DIR/<table>.ndjson or .csv into an empty install")
+    p_load.add_argument("directory", type=Path)
+    p_load.add_argument("--tables", default=",".join(TABLES))
+
+    args = parser.parse_args(argv)
+    init_db()
+    if args.command == "export":
+        for part in encode(args.format, TABLES[args.table], iter_table(args.table)):
+            sys.stdout.write(part)
+        return 0
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+    # keep foreign-key order whatever order they were listed in
+    tables = [t for t in TABLES if t in tables]
+    if args.command == "dump":
+        dump(args.directory, args.format, tables)
+    else:
+        load(args.directory, tables)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import base64
+import sys
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import inspect, text
+
+from db import engine, get_conn, init_db
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_SUMMARY_DAYS = 3660
+
+_is_sqlite = engine.dialect.name == "sqlite"
+
+# created_at defaults to CURRENT_TIMESTAMP (UTC), so rollup days are UTC days too.
+if _is_sqlite:
+    TODAY_SQL = "date('now')"
+    SESSION_DAY_SQL = "date(created_at)"
+else:
+    TODAY_SQL = "(CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::date"
+    SESSION_DAY_SQL = "(created_at AT TIME ZONE 'UTC')::date"
+
+# Served by the (user_id, created_at, id) index: each page is one range scan,
+# however deep into the history it starts.
+FIRST_PAGE_QUERY = text("""
+    SELECT id, wpm, accuracy, duration_seconds, created_at
+    FROM typing_sessions
+    WHERE user_id = :user_id
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit
+""")
+NEXT_PAGE_QUERY = text("""
+    SELECT id, wpm, accuracy, duration_seconds, created_at
+    FROM typing_sessions
+    WHERE user_id = :user_id
+      AND (created_at, id) < (:created_at, :id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit
+""")
+
+ROLLUP_UPSERT = text(f"""
+    INSERT INTO session_daily (user_id, day, session_count, wpm_sum, best_wpm, accuracy_sum)
+    VALUES (:user_id, {TODAY_SQL}, :count, :wpm_sum, :best_wpm, :accuracy_sum)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        session_count = session_daily.session_count + excluded.session_count,
+        wpm_sum = session_daily.wpm_sum + excluded.wpm_sum,
+        best_wpm = CASE
+            WHEN excluded.best_wpm > session_daily.best_wpm
+            THEN excluded.best_wpm ELSE session_daily.best_wpm END,
+        accuracy_sum = session_daily.accuracy_sum + excluded.accuracy_sum
+""")
+
+ROLLUP_QUERY = text("""
+    SELECT day, session_count, wpm_sum, best_wpm, accuracy_sum
+    FROM session_daily
+    WHERE user_id = :user_id AND day >= :since
+    ORDER BY day
+""")
+
+
+def encode_cursor(created_at, session_id: int) -> str:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = f"{created_at}|{session_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (created_at, id) from a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, session_id = raw.rsplit("|", 1)
+        session_id = int(session_id)
+        if not _is_sqlite:
+            created_at = datetime.fromisoformat(created_at)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return created_at, session_id
+
+
+def session_page(user_id: int, limit: int = PAGE_SIZE, cursor=None):
+    """Return (sessions, next_cursor); next_cursor is None on the last page."""
+    params = {"user_id": user_id, "limit": limit + 1}
+    query = FIRST_PAGE_QUERY
+    if cursor is not None:
+        params["created_at"], params["id"] = cursor
+        query = NEXT_PAGE_QUERY
+    conn = get_conn()
+    rows = conn.execute(query, params).mappings().fetchall()
+    conn.close()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+
+def apply_sessions(conn, sessions) -> None:
+    """Fold new (user_id, wpm, accuracy) sessions into today's rollups; runs inside the caller's transaction."""
+    per_user = {}
+    for user_id, wpm, accuracy in sessions:
+        count, wpm_sum, best, acc_sum = per_user.get(user_id, (0, 0.0, None, 0.0))
+        per_user[user_id] = (count + 1, wpm_sum + wpm, wpm if best is None or wpm > best else best, acc_sum + accuracy)
+    if not per_user:
+        return
+    conn.execute(ROLLUP_UPSERT, [
+        {"user_id": u, "count": count, "wpm_sum": wpm_sum, "best_wpm": best, "accuracy_sum": acc_sum}
+        for u, (count, wpm_sum, best, acc_sum) in per_user.items()
+    ])
+
+
+def _as_date(value) -> date:
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def summary(user_id: int, period: str = "day", days: int = 30, today=None):
+    """Per-day or per-week (ISO, Monday-start) aggregates over the last `days` days."""
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    if period == "week":
+        since -= timedelta(days=since.weekday())
+    conn = get_conn()
+    rows = conn.execute(
+        ROLLUP_QUERY, {"user_id": user_id, "since": since if not _is_sqlite else since.isoformat()}
+    ).mappings().fetchall()
+    conn.close()
+
+    buckets = {}
+    for row in rows:
+        day = _as_date(row["day"])
+        start = day - timedelta(days=day.weekday()) if period == "week" else day
+        count, wpm_sum, best, acc_sum = buckets.get(start, (0, 0.0, None, 0.0))
+        row_best = float(row["best_wpm"])
+        buckets[start] = (
+            count + int(row["session_count"]),
+            wpm_sum + float(row["wpm_sum"]),
+            row_best if best is None or row_best > best else best,
+            acc_sum + float(row["accuracy_sum"]),
+        )
+    return [
+        {
+            "start": start.isoformat(),
+            "sessions": count,
+            "mean_wpm": round(wpm_sum / count, 2),
+            "best_wpm": round(best, 2),
+            "mean_accuracy": round(acc_sum / count, 4),
+        }
+        for start, (count, wpm_sum, best, acc_sum) in sorted(buckets.items())
+    ]
+
+
+def day_param(day: date):
+    """A date bound as session_daily.day is stored."""
+    return day.isoformat() if _is_sqlite else day
+
+
+def day_start_param(day: date):
+    """UTC midnight starting `day`, bound for comparison with created_at."""
+    return day.isoformat() if _is_sqlite else datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def compacted_before(conn):
+    """First day whose raw sessions are all still kept, or None if nothing was compacted.
+
+    Raw sessions before it were rolled into session_daily and deleted (see
+    retention.py), so those rollups can no longer be derived again.
+    """
+    if not inspect(conn).has_table("retention_state"):
+        return None
+    row = conn.execute(text("SELECT sessions_compacted_before FROM retention_state WHERE id = 1")).fetchone()
+    return _as_date(row[0]) if row and row[0] is not None else None
+
+
+def rebuild() -> None:
+    with engine.begin() as conn:
+        since = compacted_before(conn)
+        if since is None:
+            conn.execute(text("DELETE FROM session_daily"))
+            where, params = "", {}
+        else:
+            conn.execute(text("DELETE FROM session_daily WHERE day >= :day"), {"day": day_param(since)})
+            where, params = "WHERE created_at >= :start", {"start": day_start_param(since)}
+        conn.execute(text(f"""
+            INSERT INTO session_daily (user_id, day, session_count, wpm_sum, best_wpm, accuracy_sum)
+            SELECT user_id, {SESSION_DAY_SQL}, COUNT(*), SUM(wpm), MAX(wpm), SUM(accuracy)
+            FROM typing_sessions
+            {where}
+            GROUP BY user_id, {SESSION_DAY_SQL}
+        """), params)
+
+
+def ensure_initialized() -> None:
+    # First start after upgrading: backfill the rollups from existing sessions once.
+    conn = get_conn()
+    have_rollups = conn.execute(text("SELECT 1 FROM session_daily LIMIT 1")).fetchone()
+    have_sessions = conn.execute(text("SELECT 1 FROM typing_sessions LIMIT 1")).fetchone()
+    conn.close()
+    if have_sessions and not have_rollups:
+        rebuild()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python history.py rebuild")
+        sys.exit(2)
+    init_db()
+    rebuild()
+    print("daily session rollups rebuilt")
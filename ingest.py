@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import bindparam, text
+
+import history
+import leaderboard
+import records
+import wpm_histogram
+from db import get_conn
+from rating import DEFAULT_RATING, update_rating
+from rating_index import rating_index
+
+logger = logging.getLogger(__name__)
+
+INGEST_MODE = os.environ.get("TYPINGLAB_INGEST_MODE", "direct").strip().lower()
+INGEST_WINDOW_MS = float(os.environ.get("TYPINGLAB_INGEST_WINDOW_MS", "25"))
+INGEST_BATCH_SIZE = int(os.environ.get("TYPINGLAB_INGEST_BATCH_SIZE", "200"))
+INGEST_MAX_QUEUE = int(os.environ.get("TYPINGLAB_INGEST_MAX_QUEUE", "10000"))
+
+SESSION_COLUMNS = ("user_id", "wpm", "accuracy", "duration_seconds", "prompt_id")
+
+RATINGS_QUERY = text("SELECT id, rating FROM users WHERE id IN :ids").bindparams(
+    bindparam("ids", expanding=True)
+)
+
+
+def write_sessions(conn, submissions):
+    """Insert sessions and apply rating updates in one transaction.
+
+    Submissions are dicts with SESSION_COLUMNS keys. Ratings are chained in list
+    order per user, exactly as if each had been saved on its own. Returns one
+    (rating, delta) pair per submission.
+    """
+    params = {}
+    rows = []
+    for i, sub in enumerate(submissions):
+        rows.append("(" + ", ".join(f":{col}_{i}" for col in SESSION_COLUMNS) + ")")
+        for col in SESSION_COLUMNS:
+            params[f"{col}_{i}"] = sub[col]
+    conn.execute(
+        text(f"INSERT INTO typing_sessions ({', '.join(SESSION_COLUMNS)}) VALUES {', '.join(rows)}"),
+        params,
+    )
+
+    user_ids = sorted({sub["user_id"] for sub in submissions})
+    current = {uid: float(DEFAULT_RATING) for uid in user_ids}
+    for row in conn.execute(RATINGS_QUERY, {"ids": user_ids}).mappings():
+        if row["rating"] is not None:
+            current[row["id"]] = float(row["rating"])
+
+    results = []
+    for sub in submissions:
+        before = current[sub["user_id"]]
+        new_rating_int = int(round(update_rating(before, sub["wpm"], sub["duration_seconds"])))
+        results.append((new_rating_int, new_rating_int - int(round(before))))
+        current[sub["user_id"]] = float(new_rating_int)
+
+    cases = []
+    params = {}
+    for i, uid in enumerate(user_ids):
+        cases.append(f"WHEN :uid_{i} THEN :rating_{i}")
+        params[f"uid_{i}"] = uid
+        params[f"rating_{i}"] = int(current[uid])
+    conn.execute(
+        text(f"UPDATE users SET rating = CASE id {' '.join(cases)} END WHERE id IN :ids").bindparams(
+            bindparam("ids", expanding=True)
+        ),
+        {**params, "ids": user_ids},
+    )
+    records.apply_sessions(conn, [(sub["user_id"], sub["wpm"]) for sub in submissions])
+    history.apply_sessions(conn, [(sub["user_id"], sub["wpm"], sub["accuracy"]) for sub in submissions])
+    wpm_histogram.apply_sessions(conn, [(sub["duration_seconds"], sub["wpm"]) for sub in submissions])
+    return results
+
+
+def after_commit(submissions, results) -> None:
+    for sub, (new_rating, _) in zip(submissions, results):
+        records.after_commit(sub["user_id"], sub["wpm"])
+        wpm_histogram.after_commit(sub["duration_seconds"], sub["wpm"])
+        rating_index.set(sub["user_id"], new_rating)
+    leaderboard.invalidate()
+
+
+def save_sessions(submissions):
+    conn = get_conn()
+    try:
+        results = write_sessions(conn, submissions)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    after_commit(submissions, results)
+    return results
+
+
+class QueueFull(Exception):
+    pass
+
+
+# queued by stop(): the writer flushes what it holds and exits
+_STOP = object()
+
+
+class IngestQueue:
+    """Groups concurrent submissions into one transaction per window or batch size."""
+
+    def __init__(self, window_ms=INGEST_WINDOW_MS, batch_size=INGEST_BATCH_SIZE, max_queue=INGEST_MAX_QUEUE):
+        self.window = window_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self.rejected = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_batch = 0
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Let the writer finish everything queued before the call, then wait for it to exit."""
+        if self._task is None:
+            return
+        task = self._task
+        await self._queue.put(_STOP)
+        await task
+        self._task = None
+        # submitted while stopping: nothing will write these any more
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP and not item[1].done():
+                item[1].set_exception(RuntimeError("ingest queue stopped"))
+
+    async def submit(self, submission):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((submission, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull()
+        return await future
+
+    async def _collect(self):
+        """The next batch, and whether stop() was reached while collecting it."""
+        item = await self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        # A single writer keeps batches, and therefore per-user rating order, sequential.
+        while True:
+            batch, stopping = await self._collect()
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch) -> None:
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(save_sessions, [sub for sub, _ in batch])
+            outcomes = [(future, result, None) for (_, future), result in zip(batch, results)]
+        except Exception:
+            logger.exception("batched session write failed; retrying one by one")
+            self.errors += 1
+            outcomes = await asyncio.to_thread(self._save_individually, batch)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self.total_flush_ms += elapsed_ms
+        for future, result, exc in outcomes:
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _save_individually(batch):
+        outcomes = []
+        for sub, future in batch:
+            try:
+                outcomes.append((future, save_sessions([sub])[0], None))
+            except Exception as exc:
+                outcomes.append((future, None, exc))
+        return outcomes
+
+    def stats(self) -> dict:
+        return {
+            "mode": INGEST_MODE,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "max_batch": self.max_batch,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 3) if self.batches else None,
+        }
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,315 @@
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import text
+
+from db import engine, get_conn
+
+KEYS = "abcdefghijklmnopqrstuvwxyz"
+KEY_INDEX = {ch: i for i, ch in enumerate(KEYS)}
+N_KEYS = len(KEYS)
+# one column per key, then one per ordered key pair
+N_FEATURES = N_KEYS + N_KEYS * N_KEYS
+HITS, ERRORS, LATENCY = 0, 1, 2
+
+REBUILD_SAMPLES = int(os.environ.get("TYPINGLAB_KEYSTATS_REBUILD_SAMPLES", "300"))
+CHECK_SECONDS = 30.0
+MAX_SUBMISSION_KEYS = 5000
+MAX_LATENCY_MS = 2000
+# Past this many keystrokes every count is halved, so recent typing dominates
+# and the uint32 vectors can never overflow.
+DECAY_SAMPLES = 50_000
+PRIOR = 10.0
+SHARPNESS = 3.0
+UNIFORM_SHARE = 0.3
+USER_CACHE_SIZE = 2048
+FEATURE_CACHE_SIZE = 16
+
+_is_sqlite = engine.dialect.name == "sqlite"
+
+STATS_QUERY = text("SELECT samples, stats FROM user_keystats WHERE user_id = :user_id")
+# Two results saved at once must not drop each other's counts. The row is
+# created first, so there is always something to lock: FOR UPDATE on
+# Postgres; on SQLite, record() takes the write lock before reading.
+LOCKED_STATS_QUERY = text(STATS_QUERY.text + ("" if _is_sqlite else " FOR UPDATE"))
+SAMPLES_QUERY = text("SELECT samples FROM user_keystats WHERE user_id = :user_id")
+CREATE_QUERY = text("""
+    INSERT INTO user_keystats (user_id, samples, stats)
+    VALUES (:user_id, 0, :stats)
+    ON CONFLICT (user_id) DO NOTHING
+""")
+UPDATE_QUERY = text("""
+    UPDATE user_keystats
+    SET samples = :samples, stats = :stats, updated_at = CURRENT_TIMESTAMP
+    WHERE user_id = :user_id
+""")
+_EMPTY_STATS = np.zeros((3, N_FEATURES), dtype=np.uint32).tobytes()
+
+_lock = threading.Lock()
+_users = OrderedDict()
+_features = OrderedDict()
+
+
+def feature_index(key: str):
+    """Column for a key ("a") or bigram ("th"), or None if it is not tracked."""
+    if len(key) == 1:
+        return KEY_INDEX.get(key)
+    if len(key) == 2 and key[0] in KEY_INDEX and key[1] in KEY_INDEX:
+        return N_KEYS + KEY_INDEX[key[0]] * N_KEYS + KEY_INDEX[key[1]]
+    return None
+
+
+def parse_submission(payload):
+    """Turn {"chars": {"a": [hits, errors, latency_ms]}, "bigrams": {"th": [...]}} into
+    (delta, keystrokes), or None if it is malformed or implausible. Untracked keys are skipped.
+    """
+    if not isinstance(payload, dict):
+        return None
+    delta = np.zeros((3, N_FEATURES), dtype=np.int64)
+    keystrokes = 0
+    for group, width in (("chars", 1), ("bigrams", 2)):
+        entries = payload.get(group) or {}
+        if not isinstance(entries, dict):
+            return None
+        for key, value in entries.items():
+            key = str(key).lower()
+            column = feature_index(key) if len(key) == width else None
+            if column is None:
+                continue
+            try:
+                hits, errors, latency = (int(v) for v in value)
+            except (TypeError, ValueError):
+                return None
+            if not (0 <= errors <= hits <= MAX_SUBMISSION_KEYS and 0 <= latency <= hits * MAX_LATENCY_MS):
+                return None
+            delta[:, column] += (hits, errors, latency)
+            if width == 1:
+                keystrokes += hits
+    if keystrokes > MAX_SUBMISSION_KEYS:
+        return None
+    return delta, keystrokes
+
+
+def _decode(blob) -> np.ndarray:
+    return np.frombuffer(bytes(blob), dtype=np.uint32).reshape(3, N_FEATURES).astype(np.int64)
+
+
+def _encode(stats: np.ndarray) -> bytes:
+    return stats.astype(np.uint32).tobytes()
+
+
+def record(user_id: int, payload) -> bool:
+    """Add one result's per-key counts to the user's vectors; False if the payload is rejected."""
+    parsed = parse_submission(payload)
+    if parsed is None:
+        return False
+    delta, keystrokes = parsed
+    if not keystrokes:
+        return True
+    conn = get_conn()
+    try:
+        if _is_sqlite:
+            # the driver would only begin at the first write, after the read
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        conn.execute(CREATE_QUERY, {"user_id": user_id, "stats": _EMPTY_STATS})
+        row = conn.execute(LOCKED_STATS_QUERY, {"user_id": user_id}).mappings().fetchone()
+        stats = _decode(row["stats"]) + delta
+        if stats[HITS, :N_KEYS].sum() > DECAY_SAMPLES:
+            stats //= 2
+        samples = int(row["samples"]) + keystrokes
+        conn.execute(UPDATE_QUERY, {"user_id": user_id, "samples": samples, "stats": _encode(stats)})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    with _lock:
+        for entry in _users.get(user_id, {}).values():
+            entry["pending"] += keystrokes
+    return True
+
+
+def weakness(stats: np.ndarray):
+    """Per-feature weakness, about 1.0 on average; None without any data.
+
+    Error rate and mean latency are each taken relative to the user's own
+    overall rate and shrunk toward it by PRIOR keystrokes, so a bigram seen
+    twice does not dominate.
+    """
+    hits, errors, latency = stats.astype(np.float64)
+    key_hits = hits[:N_KEYS].sum()
+    if key_hits <= 0:
+        return None
+    error_rate = max(errors[:N_KEYS].sum() / key_hits, 0.01)
+    mean_latency = max(latency[:N_KEYS].sum() / key_hits, 1.0)
+    feature_error = (errors + PRIOR * error_rate) / (hits + PRIOR)
+    feature_latency = (latency + PRIOR * mean_latency) / (hits + PRIOR)
+    return 0.5 * feature_error / error_rate + 0.5 * feature_latency / mean_latency
+
+
+class CorpusFeatures:
+    """The tracked keys and bigrams of every word in a pool, as flat row/column arrays."""
+
+    def __init__(self, pool):
+        rows = array("I")
+        columns = array("I")
+        for i in range(len(pool)):
+            word = pool[i].lower()
+            found = {KEY_INDEX[ch] for ch in word if ch in KEY_INDEX}
+            found.update(
+                N_KEYS + KEY_INDEX[a] * N_KEYS + KEY_INDEX[b]
+                for a, b in zip(word, word[1:])
+                if a in KEY_INDEX and b in KEY_INDEX
+            )
+            columns.extend(found)
+            rows.extend([i] * len(found))
+        self.size = len(pool)
+        self.rows = np.frombuffer(rows, dtype=np.uint32)
+        self.columns = np.frombuffer(columns, dtype=np.uint32)
+        self.counts = np.bincount(self.rows, minlength=self.size)
+
+    def word_weights(self, feature_weakness: np.ndarray) -> np.ndarray:
+        sums = np.bincount(self.rows, weights=feature_weakness[self.columns], minlength=self.size)
+        scores = np.where(self.counts > 0, sums / np.maximum(self.counts, 1), 1.0)
+        weights = scores ** SHARPNESS
+        # keep some uniform mass so every word still turns up now and then
+        return (1.0 - UNIFORM_SHARE) * weights / weights.sum() + UNIFORM_SHARE / self.size
+
+
+class AliasTable:
+    """Weighted word pool: Vose alias tables give O(1) draws from one 64-bit hash.
+
+    It is indexable like the pool it wraps; seeded_words() calls pick(), so
+    seeded prompts and chunk requests use the weights.
+    """
+
+    __slots__ = ("pool", "size", "threshold", "alias")
+
+    def __init__(self, pool, weights):
+        n = len(weights)
+        scaled = (np.asarray(weights, dtype=np.float64) * (n / float(np.sum(weights)))).tolist()
+        threshold = array("Q", [1 << 32]) * n
+        alias = array("I", range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large[-1]
+            threshold[s] = int(scaled[s] * 4294967296.0)
+            alias[s] = g
+            scaled[g] += scaled[s] - 1.0
+            if scaled[g] < 1.0:
+                small.append(large.pop())
+        self.pool = pool
+        self.size = n
+        self.threshold = threshold
+        self.alias = alias
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> str:
+        return self.pool[index]
+
+    def pick(self, h: int) -> str:
+        i = (h & 0xFFFFFFFF) % self.size
+        if (h >> 32) >= self.threshold[i]:
+            i = self.alias[i]
+        return self.pool[i]
+
+
+def _corpus_features(source: str, pool) -> CorpusFeatures:
+    # Keyed on the source spec, not the pool object: a filtered spec gets a
+    # fresh view of the same words on every call (see corpus.CorpusRegistry).
+    with _lock:
+        cached = _features.get(source)
+        if cached is not None and cached.size == len(pool):
+            _features.move_to_end(source)
+            return cached
+    features = CorpusFeatures(pool)
+    with _lock:
+        _features[source] = features
+        while len(_features) > FEATURE_CACHE_SIZE:
+            _features.popitem(last=False)
+    return features
+
+
+def _build(user_id: int, source: str, pool):
+    conn = get_conn()
+    row = conn.execute(STATS_QUERY, {"user_id": user_id}).mappings().fetchone()
+    conn.close()
+    if row is None:
+        return None, 0
+    feature_weakness = weakness(_decode(row["stats"]))
+    if feature_weakness is None:
+        return None, int(row["samples"])
+    weights = _corpus_features(source, pool).word_weights(feature_weakness)
+    return AliasTable(pool, weights), int(row["samples"])
+
+
+def weighted_pool(user_id: int, source: str, pool):
+    """`pool` weighted toward the user's weak keys and bigrams, or `pool` itself without data.
+
+    Tables are cached per (user, source spec). They are rebuilt once REBUILD_SAMPLES
+    new keystrokes have arrived: from this worker immediately, and from other
+    workers when the stored sample count is checked every CHECK_SECONDS.
+    """
+    if not pool:
+        return pool
+    now = time.monotonic()
+    with _lock:
+        sources = _users.get(user_id)
+        entry = sources.get(source) if sources else None
+        if sources is not None:
+            _users.move_to_end(user_id)
+    if entry is not None and entry["size"] == len(pool) and entry["pending"] < REBUILD_SAMPLES:
+        if now - entry["checked_at"] < CHECK_SECONDS:
+            return entry["table"] or pool
+        conn = get_conn()
+        row = conn.execute(SAMPLES_QUERY, {"user_id": user_id}).mappings().fetchone()
+        conn.close()
+        samples = int(row["samples"]) if row else 0
+        entry["checked_at"] = now
+        entry["pending"] = max(entry["pending"], samples - entry["samples"])
+        if entry["pending"] < REBUILD_SAMPLES:
+            return entry["table"] or pool
+    table, samples = _build(user_id, source, pool)
+    with _lock:
+        sources = _users.setdefault(user_id, {})
+        sources[source] = {"size": len(pool), "table": table, "samples": samples, "pending": 0, "checked_at": now}
+        _users.move_to_end(user_id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return table or pool
+
+
+def weakest(user_id: int, limit: int = 10) -> list:
+    """The user's weakest keys and bigrams with their counts, weakest first."""
+    conn = get_conn()
+    row = conn.execute(STATS_QUERY, {"user_id": user_id}).mappings().fetchone()
+    conn.close()
+    if row is None:
+        return []
+    stats = _decode(row["stats"])
+    feature_weakness = weakness(stats)
+    if feature_weakness is None:
+        return []
+    seen = np.flatnonzero(stats[HITS] > 0)
+    order = seen[np.argsort(-feature_weakness[seen], kind="stable")][:limit]
+    out = []
+    for column in order.tolist():
+        key = KEYS[column] if column < N_KEYS else KEYS[(column - N_KEYS) // N_KEYS] + KEYS[(column - N_KEYS) % N_KEYS]
+        hits, errors, latency = (int(v) for v in stats[:, column])
+        out.append({
+            "key": key,
+            "hits": hits,
+            "error_rate": round(errors / hits, 4),
+            "mean_ms": round(latency / hits, 1),
+            "weakness": round(float(feature_weakness[column]), 3),
+        })
+    return out
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from markupsafe import Markup
+from sqlalchemy import text
+
+from db import get_conn
+
+CACHE_SECONDS = float(os.environ.get("TYPINGLAB_LEADERBOARD_CACHE_SECONDS", "5"))
+TOP_WPM_LIMIT = 10
+TOP_ELO_LIMIT = 25
+
+TOP_WPM_QUERY = text("""
+    SELECT u.name as name, u.email as email, ts.wpm as wpm, ts.accuracy as accuracy, ts.created_at as created_at
+    FROM typing_sessions ts
+    JOIN users u ON u.id = ts.user_id
+    ORDER BY ts.wpm DESC
+    LIMIT :limit
+""")
+
+TOP_ELO_QUERY = text("""
+    SELECT name, email, rating
+    FROM users
+    ORDER BY rating DESC
+    LIMIT :limit
+""")
+
+FRAGMENTS = {
+    "top": "partials/leaderboard_top.html",
+    "elo": "partials/leaderboard_elo.html",
+}
+
+
+class Snapshot:
+    __slots__ = ("version", "etag", "last_modified", "top", "elo", "fragments", "loaded_at")
+
+    def __init__(self, version, etag, last_modified, top, elo, fragments, loaded_at):
+        self.version = version
+        self.etag = etag
+        self.last_modified = last_modified
+        self.top = top
+        self.elo = elo
+        self.fragments = fragments
+        self.loaded_at = loaded_at
+
+    @property
+    def last_modified_header(self) -> str:
+        return formatdate(self.last_modified, usegmt=True)
+
+    def as_dict(self) -> dict:
+        return {"version": self.version, "top": self.top, "elo": self.elo}
+
+
+_lock = threading.Lock()
+_state = {"snapshot": None, "dirty": True, "version": 0}
+_listeners = []
+
+
+def on_invalidate(callback) -> None:
+    """Register callback() to run (in the writer's thread) after every invalidate()."""
+    _listeners.append(callback)
+
+
+def invalidate() -> None:
+    """Called after session writes; the next reader reloads the lists."""
+    _state["dirty"] = True
+    for callback in _listeners:
+        callback()
+
+
+def display_name(name, email) -> str:
+    """Public label for a user: the display name, else a masked email (never the address itself)."""
+    if name:
+        return name
+    local = (email or "").split("@", 1)[0]
+    return f"{local[:1]}***" if local else "anonymous"
+
+
+def _load():
+    conn = get_conn()
+    top = conn.execute(TOP_WPM_QUERY, {"limit": TOP_WPM_LIMIT}).mappings().fetchall()
+    elo = conn.execute(TOP_ELO_QUERY, {"limit": TOP_ELO_LIMIT}).mappings().fetchall()
+    conn.close()
+    top = [
+        {
+            "display": display_name(row["name"], row["email"]),
+            "wpm": float(row["wpm"]),
+            "accuracy": float(row["accuracy"]),
+            "created_at": str(row["created_at"]),
+        }
+        for row in top
+    ]
+    elo = [{"display": display_name(row["name"], row["email"]), "rating": row["rating"]} for row in elo]
+    return top, elo
+
+
+def get_snapshot(env) -> Snapshot:
+    """Return the current snapshot, reloading it when dirty or older than CACHE_SECONDS.
+
+    The ETag is a digest of the list contents, so every worker hands out the
+    same tag for the same data and a reload that finds nothing new keeps the
+    previous version and fragments.
+    """
+    snapshot = _state["snapshot"]
+    if snapshot is not None and not _state["dirty"] and time.monotonic() - snapshot.loaded_at < CACHE_SECONDS:
+        return snapshot
+    with _lock:
+        snapshot = _state["snapshot"]
+        if snapshot is not None and not _state["dirty"] and time.monotonic() - snapshot.loaded_at < CACHE_SECONDS:
+            return snapshot
+        _state["dirty"] = False
+        top, elo = _load()
+        digest = hashlib.sha1(json.dumps([top, elo], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        now = time.monotonic()
+        if snapshot is not None and snapshot.etag == f'"{digest}"':
+            snapshot.loaded_at = now
+            return snapshot
+        _state["version"] += 1
+        fragments = {
+            name: Markup(env.get_template(path).render(top=top, elo=elo))
+            for name, path in FRAGMENTS.items()
+        }
+        snapshot = Snapshot(_state["version"], f'"{digest}"', time.time(), top, elo, fragments, now)
+        _state["snapshot"] = snapshot
+        return snapshot
+
+
+def not_modified(request, etag: str, last_modified=None) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since as RFC 9110 specifies."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
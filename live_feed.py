@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import leaderboard
+import records
+from db import WORKERS
+
+PUSH_INTERVAL_MS = float(os.environ.get("TYPINGLAB_LIVE_PUSH_MS", "1000"))
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 5000
+
+
+def _frame(event: str, seq: int, data) -> bytes:
+    payload = json.dumps(data, separators=(",", ":"))
+    return f"id: {seq}\nevent: {event}\ndata: {payload}\n\n".encode("utf-8")
+
+
+class LiveFeed:
+    """Server-Sent Events fan-out of the leaderboard lists and the global record.
+
+    Writers only call notify(). One task per worker coalesces notifications
+    into at most one reload per PUSH_INTERVAL_MS, encodes each changed section
+    once and wakes every subscriber through a single shared future. An idle
+    subscriber is a suspended generator; a slow one skips straight to the
+    latest frame of each section instead of queueing the ones it missed.
+    """
+
+    def __init__(self, env, interval_ms=PUSH_INTERVAL_MS, heartbeat=HEARTBEAT_SECONDS):
+        self.env = env
+        self.interval = interval_ms / 1000.0
+        self.heartbeat = heartbeat
+        # With several workers, other processes' results only show up when
+        # the leaderboard snapshot expires, so poll at that rate as well.
+        self.poll = min(heartbeat, leaderboard.CACHE_SECONDS) if WORKERS > 1 else heartbeat
+        self._loop = None
+        self._wake = None
+        self._next = None
+        self._task = None
+        self._collect_lock = threading.Lock()
+        self._frames = {}
+        self._versions = {}
+        self._seq = 0
+        self._stale = True
+        self.subscribers = 0
+        self.notifies = 0
+        self.reloads = 0
+        self.pushes = 0
+
+    def notify(self) -> None:
+        """Mark the lists as changed; safe to call from any thread."""
+        self.notifies += 1
+        self._stale = True
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake.set)
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._next = self._loop.create_future()
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+
+    def _collect(self) -> None:
+        """Reload the sections and re-encode the ones that changed; runs in a thread."""
+        with self._collect_lock:
+            self._stale = False
+            self.reloads += 1
+            snapshot = leaderboard.get_snapshot(self.env)
+            top_wpm, trophy = records.get_top_wpm_and_trophy()
+            sections = {
+                "leaderboard": (snapshot.version, lambda: {
+                    "version": snapshot.version,
+                    "top": snapshot.top,
+                    "elo": snapshot.elo,
+                    "html": {name: str(fragment) for name, fragment in snapshot.fragments.items()},
+                }),
+                "record": ((top_wpm, trophy), lambda: {"top_wpm": top_wpm, "trophy": trophy}),
+            }
+            frames = dict(self._frames)
+            seq = self._seq
+            for event, (version, build) in sections.items():
+                if self._versions.get(event) == version and event in frames:
+                    continue
+                self._versions[event] = version
+                seq += 1
+                frames[event] = (seq, _frame(event, seq, build()))
+            # frames before seq: a reader that sees the new seq also sees its frames
+            self._frames = frames
+            self._seq = seq
+
+    def _publish(self) -> None:
+        waiting, self._next = self._next, self._loop.create_future()
+        waiting.set_result(None)
+
+    async def _run(self) -> None:
+        last_push = 0.0
+        last_sent = time.monotonic()
+        published = self._seq
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll)
+            except asyncio.TimeoutError:
+                pass
+            woken = self._wake.is_set()
+            if woken:
+                # merge a burst of writes into one push per interval
+                delay = last_push + self.interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._wake.clear()
+            if not self.subscribers:
+                continue
+            if woken or WORKERS > 1:
+                await asyncio.to_thread(self._collect)
+            now = time.monotonic()
+            # compare seqs rather than trusting this reload: a new subscriber's
+            # own reload may already have picked the change up
+            if self._seq != published:
+                published = self._seq
+                last_push = last_sent = now
+                self.pushes += 1
+                self._publish()
+            elif now - last_sent >= self.heartbeat:
+                # resolving without a new seq makes every subscriber send a comment line
+                last_sent = now
+                self._publish()
+
+    async def subscribe(self):
+        """Yield SSE chunks for one client: current state first, then changes.
+
+        Every (re)connect starts with the full state. It is a few KB, and
+        event ids are per worker, so Last-Event-ID could not be trusted anyway.
+        """
+        self._ensure_started()
+        self.subscribers += 1
+        try:
+            if self._stale or not self._frames:
+                await asyncio.to_thread(self._collect)
+            current = self._seq
+            yield f"retry: {RETRY_MS}\n\n".encode("ascii") + self._pending(0)
+            seen = current
+            while True:
+                if self._seq == seen:
+                    await asyncio.shield(self._next)
+                    if self._seq == seen:
+                        yield b": keepalive\n\n"
+                        continue
+                current = self._seq
+                chunk = self._pending(seen)
+                seen = current
+                yield chunk
+        finally:
+            self.subscribers -= 1
+
+    def _pending(self, seen: int) -> bytes:
+        return b"".join(frame for seq, frame in sorted(self._frames.values()) if seq > seen)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "notifies": self.notifies,
+            "reloads": self.reloads,
+            "pushes": self.pushes,
+        }
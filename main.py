@@ -1,20 +1,45 @@
-import secrets
-import bcrypt
-from urllib.parse import urlparse
-from pathlib import Path
-from fastapi import FastAPI, Request, Form, Response
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+import asyncio
+import hashlib
+import json
+from fastapi import BackgroundTasks, Depends, FastAPI, Request, Form, Response, WebSocket
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import text
 
-from db import get_conn, init_db
+import export
+import history
+import keystats
+import leaderboard as leaderboard_cache
+import metrics
+import rating_index
+import records
+import wpm_histogram
+from corpus import DEFAULT_SOURCE, MAX_FILTER_CHARS, corpora, format_source, parse_source
+from db import describe_storage, engine, get_conn, init_db
+from ingest import INGEST_MODE, QueueFull, ingest_queue, save_sessions
+from live_feed import LiveFeed
+from passwords import HasherBusy, hasher, needs_rehash
+from prompt_pool import PromptPool, generate_prompts, new_prompt_seed, parse_prompt_seed, seeded_words
+from races import RaceHub
+from retention import retention_job
+from rating import DEFAULT_RATING
+from sessions import SESSION_MAX_AGE, create_session, resolve_session, revocation_sync, revoke_session
+from static_assets import PrecompressedStaticFiles, static_url
 
 app = FastAPI()
 init_db()
+wpm_histogram.reload()
+rating_index.rebuild()
+metrics.instrument_engine(engine)
+# the event stream stays open for minutes; keep it out of the latency histograms
+app.add_middleware(metrics.MetricsMiddleware, skip_paths=("/metrics", "/api/leaderboard/stream"))
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
+
+live_feed = LiveFeed(templates.env)
+leaderboard_cache.on_invalidate(live_feed.notify)
 
 COOKIE_NAME = "session_id"
 
@@ -26,71 +51,157 @@ PROMPTS = [
     "MIT students learn by building and shipping projects.",
 ]
 
-ELO_W0 = 40.0
-ELO_K = 32.0
-ELO_P = 4.0
-
-WORDS_PATH = Path(__file__).with_name("1000-common-english-words.txt")
-WORDS_PATH_5000 = Path(__file__).with_name("5000_common_words.txt")
-try:
-    COMMON_WORDS = [w.strip() for w in WORDS_PATH.read_text().splitlines() if w.strip()]
-except Exception:
-    COMMON_WORDS = []
-try:
-    COMMON_WORDS_5000 = [w.strip() for w in WORDS_PATH_5000.read_text().splitlines() if w.strip()]
-except Exception:
-    COMMON_WORDS_5000 = []
+# memory-mapped, so pre-forked workers share one copy of each list
+for _name in corpora.builtin:
+    corpora.get(_name)
+
+def get_word_pool(source: str = DEFAULT_SOURCE):
+    """Words for a source spec; see corpus.parse_source. Unknown specs get the default corpus."""
+    return corpora.pool(corpora.resolve(source) or DEFAULT_SOURCE)
+
+def resolve_source(source) -> str:
+    return corpora.resolve(source) or DEFAULT_SOURCE
+
+def source_from_query(params) -> str:
+    """`source`, narrowed by the optional min_len / max_len / chars query parameters."""
+    source = params.get("source", DEFAULT_SOURCE)
+    if not any(key in params for key in ("min_len", "max_len", "chars")):
+        return resolve_source(source)
+    parsed = parse_source(resolve_source(source))
+    name, min_len, max_len, chars = parsed
+    try:
+        min_len = max(0, min(64, int(params.get("min_len", min_len))))
+        max_len = max(0, min(64, int(params.get("max_len", max_len))))
+    except ValueError:
+        pass
+    chars = params.get("chars", chars)[:MAX_FILTER_CHARS]
+    return resolve_source(format_source(name, min_len, max_len, chars))
+
+prompt_pool = PromptPool(get_word_pool)
+race_hub = RaceHub(get_word_pool)
+
+PROMPT_CHUNK_WORDS = 40
+PROMPT_MAX_CHUNK_WORDS = 200
 
 def make_word_prompt(words: int = 300, source: str = "1000", number_rate: float = 0.0) -> str:
-    pool = COMMON_WORDS
-    if source == "5000":
-        pool = COMMON_WORDS_5000
+    pool = get_word_pool(source)
     if not pool:
         return " ".join(PROMPTS)
-    out = []
-    for _ in range(words):
-        if number_rate > 0 and secrets.randbelow(1000) < int(number_rate * 1000):
-            out.append(str(secrets.randbelow(10000)))
-        else:
-            out.append(secrets.choice(pool))
-    return " ".join(out)
+    prompt = prompt_pool.take(source, number_rate, words)
+    if prompt is None:
+        prompt = generate_prompts(pool, 1, words, number_rate)[0]
+    return prompt
 
-def get_current_user_id(request: Request):
-    sid = request.cookies.get(COOKIE_NAME)
-    if not sid:
-        return None
-    conn = get_conn()
-    row = conn.execute(
-        text("SELECT user_id FROM auth_sessions WHERE session_id = :sid"),
-        {"sid": sid},
-    ).fetchone()
-    conn.close()
-    return row["user_id"] if row else None
+def prompt_profile(source, number_rate):
+    source = resolve_source(source)
+    try:
+        number_rate = float(number_rate)
+    except (TypeError, ValueError):
+        number_rate = 0.0
+    return source, round(max(0.0, min(0.5, number_rate)), 2)
 
-def get_user_summary(user_id: int):
-    conn = get_conn()
-    row = conn.execute(
-        text("SELECT id, name, email, rating FROM users WHERE id = :user_id"),
-        {"user_id": user_id},
-    ).fetchone()
-    conn.close()
-    return row
+def prompt_chunk(seed: int, source: str, number_rate: float, offset: int, count: int, user_id=None) -> str:
+    """Words offset..offset+count of a seeded prompt; weighted toward user_id's weak keys if given."""
+    pool = get_word_pool(source)
+    if pool and user_id is not None:
+        pool = keystats.weighted_pool(user_id, source, pool)
+    if not pool:
+        return " ".join(PROMPTS) if offset == 0 else ""
+    return " ".join(seeded_words(pool, seed, offset, count, number_rate))
+
+def issue_prompt(source: str = "1000", number_rate: float = 0.0, total=None, user_id=None):
+    """A fresh seeded prompt: (first chunk, descriptor the client uses to fetch more).
+
+    `total` caps the prompt length in words (ranked tests); None streams indefinitely.
+    With `user_id` the prompt is adaptive (see keystats.weighted_pool).
+    """
+    source, number_rate = prompt_profile(source, number_rate)
+    seed = new_prompt_seed()
+    first = PROMPT_CHUNK_WORDS if total is None else min(total, PROMPT_CHUNK_WORDS)
+    descriptor = {
+        "seed": seed,
+        "source": source,
+        "numberRate": number_rate,
+        "total": total,
+        "chunkWords": PROMPT_CHUNK_WORDS,
+        "offset": first,
+    }
+    digest = corpora.digest(source)
+    if digest is not None:
+        descriptor["corpus"] = digest
+    if user_id is not None:
+        descriptor["adaptive"] = True
+    return prompt_chunk(int(seed, 16), source, number_rate, 0, first, user_id), descriptor
+
+@app.on_event("startup")
+def report_storage_profile():
+    print(f"TypingLab storage: {describe_storage()}", flush=True)
+
+@app.on_event("startup")
+def warm_prompt_pool():
+    prompt_pool.register("1000")
+    prompt_pool.register("5000")
+    prompt_pool.register("5000", 0.15)
+
+@app.on_event("startup")
+async def start_ingest_queue():
+    if INGEST_MODE == "batched":
+        ingest_queue.start()
+
+@app.on_event("startup")
+def start_password_hasher():
+    hasher.start()
+
+@app.on_event("startup")
+def start_retention_job():
+    retention_job.start()
+
+@app.on_event("startup")
+def start_revocation_sync():
+    revocation_sync.start()
+
+@app.on_event("shutdown")
+def stop_retention_job():
+    retention_job.stop()
+
+@app.on_event("shutdown")
+def stop_revocation_sync():
+    revocation_sync.stop()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    hasher.stop()
+
+@app.on_event("shutdown")
+def stop_prompt_pool():
+    prompt_pool.stop()
+
+@app.on_event("shutdown")
+async def stop_race_hub():
+    await race_hub.stop()
+
+@app.on_event("shutdown")
+async def stop_live_feed():
+    await live_feed.stop()
+
+@app.on_event("shutdown")
+async def drain_ingest_queue():
+    await ingest_queue.stop()
 
-def get_user_best_wpm(user_id: int):
-    conn = get_conn()
-    row = conn.execute(
-        text("SELECT MAX(wpm) as wpm FROM typing_sessions WHERE user_id = :user_id"),
-        {"user_id": user_id},
-    ).fetchone()
-    conn.close()
-    return row["wpm"] if row and row["wpm"] is not None else None
+def get_current_user_id(request: Request):
+    # memoized per request; require_login and handlers may both ask
+    if hasattr(request.state, "user_id"):
+        return request.state.user_id
+    user_id = resolve_session(request.cookies.get(COOKIE_NAME))
+    request.state.user_id = user_id
+    return user_id
 
 def get_training_progress(user_id: int):
     conn = get_conn()
     rows = conn.execute(
         text("SELECT mode, level, percent FROM training_progress WHERE user_id = :user_id"),
         {"user_id": user_id},
-    ).fetchall()
+    ).mappings().fetchall()
     conn.close()
     progress = {
         "easy": {1: 0, 2: 0, 3: 0},
@@ -104,31 +215,52 @@ def get_training_progress(user_id: int):
             progress[mode][level] = int(row["percent"])
     return progress
 
-def expected_wpm(rating: float) -> float:
-    return ELO_W0 * (10 ** ((rating - 1500.0) / 400.0))
-
-def score_from_performance(perf: float, expected: float) -> float:
-    if expected <= 0:
-        return 0.5
-    ratio = perf / expected
-    if ratio <= 0:
-        return 0.0
-    return 1.0 / (1.0 + (1.0 / ratio) ** ELO_P)
-
-def update_rating(current: float, perf: float, duration_seconds: int) -> float:
-    exp_wpm = expected_wpm(current)
-    s = score_from_performance(perf, exp_wpm)
-    duration_factor = {
-        15: 0.85,
-        30: 0.95,
-        60: 1.0,
-        120: 1.1,
-    }.get(duration_seconds, 1.0)
-    delta = ELO_K * (s - 0.5) * duration_factor
-    if delta < 0:
-        delta *= 0.85
-    new_rating = current + delta
-    return max(0.0, min(3000.0, new_rating))
+TRAINING_MODES = ("easy", "advanced", "hard")
+TRAINING_LEVELS = (1, 2, 3)
+TRAINING_BATCH_MAX = 100
+
+def training_progress_etag(user_id: int, progress) -> str:
+    body = json.dumps([user_id, progress], sort_keys=True).encode("utf-8")
+    return f'W/"tp-{hashlib.sha1(body).hexdigest()[:16]}"'
+
+def parse_training_update(item):
+    """Return (mode, level, percent) or None if the update is invalid."""
+    try:
+        mode = str(item.get("mode", ""))
+        level = int(item.get("level", 0))
+        percent = int(item.get("percent", 0))
+    except Exception:
+        return None
+    if mode not in TRAINING_MODES or level not in TRAINING_LEVELS:
+        return None
+    return mode, level, max(0, min(100, percent))
+
+def save_training_progress(user_id: int, updates) -> None:
+    """Upsert (mode, level, percent) updates in one statement; stored percents never go down."""
+    best = {}
+    for mode, level, percent in updates:
+        best[(mode, level)] = max(percent, best.get((mode, level), 0))
+    if not best:
+        return
+    rows = []
+    params = {"user_id": user_id}
+    for i, ((mode, level), percent) in enumerate(best.items()):
+        rows.append(f"(:user_id, :mode_{i}, :level_{i}, :percent_{i})")
+        params.update({f"mode_{i}": mode, f"level_{i}": level, f"percent_{i}": percent})
+    conn = get_conn()
+    conn.execute(
+        text(f"""
+        INSERT INTO training_progress (user_id, mode, level, percent)
+        VALUES {', '.join(rows)}
+        ON CONFLICT (user_id, mode, level) DO UPDATE SET
+          percent = excluded.percent,
+          updated_at = CURRENT_TIMESTAMP
+        WHERE excluded.percent > training_progress.percent
+        """),
+        params,
+    )
+    conn.commit()
+    conn.close()
 
 def require_login(request: Request):
     uid = get_current_user_id(request)
@@ -136,8 +268,12 @@ def require_login(request: Request):
         return RedirectResponse("/", status_code=303)
     return uid
 
-def ensure_preferences(user_id: int):
-    conn = get_conn()
+DEFAULT_PREFS = {"duration_seconds": 60, "theme": "dark", "live_wpm": 1}
+
+def ensure_preferences(user_id: int, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     row = conn.execute(
         text("SELECT user_id FROM preferences WHERE user_id = :user_id"),
         {"user_id": user_id},
@@ -148,82 +284,102 @@ def ensure_preferences(user_id: int):
             {"user_id": user_id},
         )
         conn.commit()
-    conn.close()
+    if own_conn:
+        conn.close()
 
-def get_preferences(user_id: int):
-    ensure_preferences(user_id)
+VIEWER_QUERY = text("""
+    SELECT u.id AS id, u.name AS name, u.email AS email, u.rating AS rating,
+           p.user_id AS prefs_user_id, p.duration_seconds AS duration_seconds, p.live_wpm AS live_wpm,
+           r.best_wpm AS best_wpm, r.session_count AS session_count
+    FROM users u
+    LEFT JOIN preferences p ON p.user_id = u.id
+    LEFT JOIN user_records r ON r.user_id = u.id
+    WHERE u.id = :user_id
+""")
+
+def load_viewer(user_id):
+    viewer = {
+        "user_id": user_id,
+        "logged_in": user_id is not None,
+        "name": None,
+        "email": None,
+        "display_name": None,
+        "rating": 1500,
+        "best_wpm": None,
+        "session_count": 0,
+        "prefs": dict(DEFAULT_PREFS),
+    }
+    if user_id is None:
+        return viewer
     conn = get_conn()
-    prefs = conn.execute(
-        text("SELECT duration_seconds, theme, live_wpm FROM preferences WHERE user_id = :user_id"),
-        {"user_id": user_id},
-    ).fetchone()
+    row = conn.execute(VIEWER_QUERY, {"user_id": user_id}).mappings().fetchone()
+    if row is not None and row["prefs_user_id"] is None:
+        ensure_preferences(user_id, conn)
     conn.close()
-    if not prefs:
-        return {"duration_seconds": 60, "theme": "dark", "live_wpm": 1}
-    return {
-        "duration_seconds": int(prefs["duration_seconds"]),
-        "theme": "dark",
-        "live_wpm": int(prefs["live_wpm"]),
+    if row is None:
+        viewer["display_name"] = "User"
+        return viewer
+    viewer["name"] = row["name"]
+    viewer["email"] = row["email"]
+    viewer["display_name"] = row["name"] or row["email"] or "User"
+    if row["rating"] is not None:
+        viewer["rating"] = int(row["rating"])
+    if row["best_wpm"] is not None:
+        viewer["best_wpm"] = float(row["best_wpm"])
+    if row["session_count"] is not None:
+        viewer["session_count"] = int(row["session_count"])
+    if row["prefs_user_id"] is not None:
+        viewer["prefs"]["duration_seconds"] = int(row["duration_seconds"])
+        viewer["prefs"]["live_wpm"] = int(row["live_wpm"])
+    return viewer
+
+def get_viewer(request: Request) -> dict:
+    # request-scoped: one query for user, preferences, rating and best WPM
+    viewer = getattr(request.state, "viewer", None)
+    if viewer is None:
+        viewer = load_viewer(get_current_user_id(request))
+        request.state.viewer = viewer
+    return viewer
+
+def page_context(request: Request, viewer: dict, **extra) -> dict:
+    ctx = {
+        "request": request,
+        "viewer": viewer,
+        "theme": viewer["prefs"]["theme"],
+        "user_name": viewer["display_name"],
+        "user_id": viewer["user_id"],
+        "logged_in": viewer["logged_in"],
     }
+    ctx.update(extra)
+    return ctx
 
 def get_top_wpm_and_trophy():
-    conn = get_conn()
-    row = conn.execute(text("SELECT MAX(wpm) as max_wpm FROM typing_sessions")).fetchone()
-    conn.close()
-    top_wpm = float(row["max_wpm"]) if row and row["max_wpm"] is not None else None
-
-    trophy = None
-    if top_wpm is not None:
-        if 40 <= top_wpm <= 59:
-            trophy = "🥉"
-        elif 60 <= top_wpm <= 79:
-            trophy = "🥈"
-        elif 80 <= top_wpm <= 99:
-            trophy = "🥇"
-        elif top_wpm >= 100:
-            trophy = "🏆"
-        else:
-            trophy = "—"
-    return top_wpm, trophy
+    return records.get_top_wpm_and_trophy()
 
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request):
-    user_id = get_current_user_id(request)
-    logged_in = user_id is not None
-    if logged_in:
-        prefs = get_preferences(user_id)
-        user = get_user_summary(user_id)
-        display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-        user_rating = user["rating"] if user and user["rating"] is not None else 1500
-        user_best_wpm = get_user_best_wpm(user_id)
-    else:
-        prefs = {"duration_seconds": 60, "theme": "dark", "live_wpm": 1}
-        display_name = None
-        user_rating = 1500
-        user_best_wpm = None
-    prompt_text = make_word_prompt(words=300, source="1000")
+def home(request: Request, viewer: dict = Depends(get_viewer)):
+    prefs = viewer["prefs"]
+    prompt_text, prompt_seed = issue_prompt(source="1000")
     prompt_id = 0
     top_wpm, top_trophy = get_top_wpm_and_trophy()
 
     return templates.TemplateResponse(
         "index.html",
-        {
-            "request": request,
-            "prompt_text": prompt_text,
-            "prompt_id": prompt_id,
-            "duration_seconds": int(prefs["duration_seconds"]),
-            "theme": prefs["theme"],
-            "live_wpm": int(prefs["live_wpm"]),
-            "user_name": display_name,
-            "show_home": True,
-            "ranked": False,
-            "top_wpm": top_wpm,
-            "user_best_wpm": user_best_wpm,
-            "top_trophy": top_trophy,
-            "user_rating": user_rating,
-            "user_id": user_id,
-            "logged_in": logged_in,
-        },
+        page_context(
+            request,
+            viewer,
+            prompt_text=prompt_text,
+            prompt_seed=prompt_seed,
+            prompt_id=prompt_id,
+            duration_seconds=int(prefs["duration_seconds"]),
+            live_wpm=int(prefs["live_wpm"]),
+            show_home=True,
+            ranked=False,
+            top_wpm=top_wpm,
+            user_best_wpm=viewer["best_wpm"],
+            top_trophy=top_trophy,
+            user_rating=viewer["rating"],
+        ),
     )
 
 @app.get("/api/prompt")
@@ -232,9 +388,7 @@ def api_prompt(request: Request):
         words = int(request.query_params.get("words", "300"))
     except Exception:
         words = 300
-    source = request.query_params.get("source", "1000")
-    if source not in ("1000", "5000"):
-        source = "1000"
+    source = source_from_query(request.query_params)
     try:
         number_rate = float(request.query_params.get("number_rate", "0"))
     except Exception:
@@ -243,6 +397,197 @@ def api_prompt(request: Request):
     words = max(5, min(1000, words))
     return JSONResponse({"prompt": make_word_prompt(words=words, source=source, number_rate=number_rate)})
 
+def adaptive_user(request: Request):
+    """The logged-in user if the request asks for an adaptive prompt (adaptive=1)."""
+    if request.query_params.get("adaptive") != "1":
+        return None
+    return get_current_user_id(request)
+
+@app.get("/api/prompt/seed")
+def api_prompt_seed(request: Request):
+    try:
+        total = int(request.query_params.get("words", "0")) or None
+    except Exception:
+        total = None
+    if total is not None:
+        total = max(5, min(1000, total))
+    prompt_text, prompt_seed = issue_prompt(
+        source=source_from_query(request.query_params),
+        number_rate=request.query_params.get("number_rate", "0"),
+        total=total,
+        user_id=adaptive_user(request),
+    )
+    return JSONResponse({**prompt_seed, "text": prompt_text}, headers={"Cache-Control": "no-store"})
+
+@app.get("/api/prompt/chunk")
+def api_prompt_chunk(request: Request):
+    seed = parse_prompt_seed(request.query_params.get("seed", ""))
+    if seed is None:
+        return JSONResponse({"error": "bad_seed"}, status_code=400)
+    source, number_rate = prompt_profile(
+        request.query_params.get("source", "1000"), request.query_params.get("number_rate", "0")
+    )
+    try:
+        offset = max(0, int(request.query_params.get("offset", "0")))
+        count = max(1, min(PROMPT_MAX_CHUNK_WORDS, int(request.query_params.get("count", str(PROMPT_CHUNK_WORDS)))))
+    except Exception:
+        return JSONResponse({"error": "bad_range"}, status_code=400)
+    user_id = adaptive_user(request)
+    text_chunk = prompt_chunk(seed, source, number_rate, offset, count, user_id)
+    # the URL fully determines the words once it names the corpus digest, since an
+    # edited word list gets a new one; adaptive chunks follow the user's current weights
+    digest = corpora.digest(source)
+    if user_id is not None:
+        cache_control = "private, no-store"
+    elif digest is not None and request.query_params.get("corpus") == digest:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "no-cache"
+    return JSONResponse(
+        {"text": text_chunk, "offset": offset, "next": offset + count},
+        headers={"Cache-Control": cache_control},
+    )
+
+@app.get("/api/keystats")
+def api_keystats(request: Request):
+    uid = get_current_user_id(request)
+    if uid is None:
+        return JSONResponse({"error": "not_authenticated"}, status_code=401)
+    return JSONResponse({"weakest": keystats.weakest(uid)})
+
+@app.post("/api/keystats")
+async def save_keystats(request: Request, background: BackgroundTasks):
+    # the session lookup may query auth_sessions; keep it off the loop
+    uid = await asyncio.to_thread(get_current_user_id, request)
+    if uid is None:
+        return JSONResponse({"error": "not_authenticated"}, status_code=401)
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    if keystats.parse_submission(payload) is None:
+        return JSONResponse({"error": "bad_payload"}, status_code=400)
+    background.add_task(keystats.record, uid, payload)
+    return JSONResponse({"ok": True})
+
+@app.get("/api/corpora")
+def api_corpora():
+    return JSONResponse({"corpora": corpora.describe()})
+
+@app.get("/api/prompt/stats")
+def api_prompt_stats():
+    return JSONResponse(prompt_pool.stats())
+
+@app.get("/api/ingest/stats")
+def api_ingest_stats():
+    return JSONResponse(ingest_queue.stats())
+
+metrics.registry.add_stats("typinglab_prompt_pool", prompt_pool.stats)
+metrics.registry.add_stats("typinglab_ingest", ingest_queue.stats)
+metrics.registry.add_stats("typinglab_password_hasher", hasher.stats)
+metrics.registry.add_stats("typinglab_races", race_hub.stats)
+metrics.registry.add_stats("typinglab_live_feed", live_feed.stats)
+metrics.registry.add_stats("typinglab_retention", retention_job.stats)
+hasher.wait_histogram = metrics.registry.histogram(
+    "typinglab_password_hash_wait_seconds", "Time password hashing jobs wait for a pool process."
+)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/rating/standing")
+def api_rating_standing(request: Request):
+    user_id = get_current_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False}, status_code=401)
+    try:
+        around = max(0, min(25, int(request.query_params.get("around", "5"))))
+    except Exception:
+        around = 5
+    standing = rating_index.user_standing(user_id, around=around)
+    if standing is None:
+        return JSONResponse({"ok": False}, status_code=404)
+    return JSONResponse({"ok": True, **standing})
+
+@app.get("/api/history")
+def api_history(request: Request):
+    user_id = get_current_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False}, status_code=401)
+    try:
+        limit = max(1, min(history.MAX_PAGE_SIZE, int(request.query_params.get("limit", str(history.PAGE_SIZE)))))
+    except Exception:
+        limit = history.PAGE_SIZE
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        cursor = history.decode_cursor(cursor)
+        if cursor is None:
+            return JSONResponse({"ok": False, "error": "bad_cursor"}, status_code=400)
+    rows, next_cursor = history.session_page(user_id, limit, cursor or None)
+    sessions = [
+        {
+            "id": row["id"],
+            "wpm": row["wpm"],
+            "accuracy": row["accuracy"],
+            "duration_seconds": row["duration_seconds"],
+            "created_at": str(row["created_at"]),
+        }
+        for row in rows
+    ]
+    return JSONResponse({"ok": True, "sessions": sessions, "next_cursor": next_cursor})
+
+@app.get("/api/history/summary")
+def api_history_summary(request: Request):
+    user_id = get_current_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False}, status_code=401)
+    period = request.query_params.get("period", "day")
+    if period not in ("day", "week"):
+        return JSONResponse({"ok": False, "error": "bad_period"}, status_code=400)
+    try:
+        days = max(1, min(history.MAX_SUMMARY_DAYS, int(request.query_params.get("days", "30"))))
+    except Exception:
+        days = 30
+    buckets = history.summary(user_id, period, days)
+    return JSONResponse({"ok": True, "period": period, "days": days, "buckets": buckets})
+
+@app.get("/api/history/export")
+def api_history_export(request: Request):
+    user_id = get_current_user_id(request)
+    if not user_id:
+        return JSONResponse({"ok": False}, status_code=401)
+    fmt = request.query_params.get("format", "ndjson")
+    if fmt not in export.FORMATS:
+        return JSONResponse({"ok": False, "error": "bad_format"}, status_code=400)
+    # rows are read and encoded a chunk at a time while the body is sent
+    return StreamingResponse(
+        export.encode(fmt, export.HISTORY_COLUMNS, export.iter_history(user_id)),
+        media_type=export.FORMATS[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="typinglab-history.{fmt}"',
+            "Cache-Control": "private, no-store",
+        },
+    )
+
+@app.get("/api/wpm/percentile")
+def api_wpm_percentile(request: Request):
+    try:
+        duration_seconds = int(request.query_params.get("duration", "60"))
+        wpm = float(request.query_params["wpm"])
+    except Exception:
+        return JSONResponse({"ok": False, "error": "bad_query"}, status_code=400)
+    if not (0 <= wpm <= wpm_histogram.WPM_MAX):
+        return JSONResponse({"ok": False, "error": "bad_wpm"}, status_code=400)
+    percentile, tests = wpm_histogram.percentile(duration_seconds, wpm)
+    return JSONResponse({
+        "ok": True,
+        "duration_seconds": duration_seconds,
+        "wpm": wpm,
+        "percentile": percentile,
+        "tests": tests,
+    })
+
 @app.get("/api/training_progress")
 def api_training_progress(request: Request):
     uid_or_redirect = require_login(request)
@@ -250,248 +595,224 @@ def api_training_progress(request: Request):
         return JSONResponse({"ok": False}, status_code=401)
     user_id = uid_or_redirect
     progress = get_training_progress(user_id)
-    return JSONResponse({"ok": True, "progress": progress})
+    headers = {"ETag": training_progress_etag(user_id, progress), "Cache-Control": "private, no-cache"}
+    if leaderboard_cache.not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"ok": True, "progress": progress}, headers=headers)
 
 @app.post("/api/training_progress")
 async def api_training_progress_update(request: Request):
-    uid_or_redirect = require_login(request)
+    uid_or_redirect = await asyncio.to_thread(require_login, request)
     if isinstance(uid_or_redirect, RedirectResponse):
         return JSONResponse({"ok": False}, status_code=401)
     user_id = uid_or_redirect
     payload = await request.json()
+    update = parse_training_update(payload) if isinstance(payload, dict) else None
+    if update is None:
+        return JSONResponse({"ok": False}, status_code=400)
+    await asyncio.to_thread(save_training_progress, user_id, [update])
+    return JSONResponse({"ok": True})
+
+def save_and_reload_training_progress(user_id: int, updates):
+    save_training_progress(user_id, updates)
+    return get_training_progress(user_id)
+
+@app.post("/api/training_progress/batch")
+async def api_training_progress_batch(request: Request):
+    # async only to read the body; the session lookup and the writes run in threads
+    uid_or_redirect = await asyncio.to_thread(require_login, request)
+    if isinstance(uid_or_redirect, RedirectResponse):
+        return JSONResponse({"ok": False}, status_code=401)
+    user_id = uid_or_redirect
     try:
-        mode = str(payload.get("mode", ""))
-        level = int(payload.get("level", 0))
-        percent = int(payload.get("percent", 0))
+        items = (await request.json())["updates"]
     except Exception:
         return JSONResponse({"ok": False}, status_code=400)
-    if mode not in ("easy", "advanced", "hard"):
+    if not isinstance(items, list) or len(items) > TRAINING_BATCH_MAX:
         return JSONResponse({"ok": False}, status_code=400)
-    if level not in (1, 2, 3):
+    updates = [parse_training_update(item) if isinstance(item, dict) else None for item in items]
+    if None in updates:
         return JSONResponse({"ok": False}, status_code=400)
-    percent = max(0, min(100, percent))
-
-    conn = get_conn()
-    conn.execute(
-        text("""
-        INSERT INTO training_progress (user_id, mode, level, percent)
-        VALUES (:user_id, :mode, :level, :percent)
-        ON CONFLICT (user_id, mode, level) DO UPDATE SET
-          percent = excluded.percent,
-          updated_at = CURRENT_TIMESTAMP
-        """),
-        {"user_id": user_id, "mode": mode, "level": level, "percent": percent},
+    progress = await asyncio.to_thread(save_and_reload_training_progress, user_id, updates)
+    return JSONResponse(
+        {"ok": True, "progress": progress},
+        headers={"ETag": training_progress_etag(user_id, progress), "Cache-Control": "no-store"},
     )
-    conn.commit()
-    conn.close()
-    return JSONResponse({"ok": True})
 
 @app.get("/training", response_class=HTMLResponse)
-def training(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    return templates.TemplateResponse(
-        "training.html",
-        {"request": request, "theme": prefs["theme"], "user_name": display_name, "user_id": user_id, "logged_in": True},
-    )
+def training(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    return templates.TemplateResponse("training.html", page_context(request, viewer))
 
 @app.get("/training/easy", response_class=HTMLResponse)
-def training_easy(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    prompt_text = make_word_prompt(words=300, source="1000")
+def training_easy(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    prefs = viewer["prefs"]
+    prompt_text, prompt_seed = issue_prompt(source="1000")
     return templates.TemplateResponse(
         "training_easy.html",
-        {
-            "request": request,
-            "prompt_text": prompt_text,
-            "prompt_id": 0,
-            "duration_seconds": int(prefs["duration_seconds"]),
-            "theme": prefs["theme"],
-            "live_wpm": int(prefs["live_wpm"]),
-            "user_name": display_name,
-            "user_id": user_id,
-            "logged_in": True,
-        },
+        page_context(
+            request,
+            viewer,
+            prompt_text=prompt_text,
+            prompt_seed=prompt_seed,
+            prompt_id=0,
+            duration_seconds=int(prefs["duration_seconds"]),
+            live_wpm=int(prefs["live_wpm"]),
+        ),
     )
 
 @app.get("/training/advanced", response_class=HTMLResponse)
-def training_advanced(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    prompt_text = make_word_prompt(words=20, source="5000")
+def training_advanced(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    prompt_text, prompt_seed = issue_prompt(source="5000")
     return templates.TemplateResponse(
         "training_advanced.html",
-        {
-            "request": request,
-            "prompt_text": prompt_text,
-            "prompt_id": 0,
-            "duration_seconds": 30,
-            "theme": prefs["theme"],
-            "live_wpm": int(prefs["live_wpm"]),
-            "user_name": display_name,
-            "user_id": user_id,
-            "logged_in": True,
-        },
+        page_context(
+            request,
+            viewer,
+            prompt_text=prompt_text,
+            prompt_seed=prompt_seed,
+            prompt_id=0,
+            duration_seconds=30,
+            live_wpm=int(viewer["prefs"]["live_wpm"]),
+        ),
     )
 
 @app.get("/training/hard", response_class=HTMLResponse)
-def training_hard(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    prompt_text = make_word_prompt(words=50, source="5000", number_rate=0.15)
+def training_hard(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    prompt_text, prompt_seed = issue_prompt(source="5000", number_rate=0.15)
     return templates.TemplateResponse(
         "training_hard.html",
-        {
-            "request": request,
-            "prompt_text": prompt_text,
-            "prompt_id": 0,
-            "duration_seconds": 60,
-            "theme": prefs["theme"],
-            "live_wpm": int(prefs["live_wpm"]),
-            "user_name": display_name,
-            "user_id": user_id,
-            "logged_in": True,
-        },
+        page_context(
+            request,
+            viewer,
+            prompt_text=prompt_text,
+            prompt_seed=prompt_seed,
+            prompt_id=0,
+            duration_seconds=60,
+            live_wpm=int(viewer["prefs"]["live_wpm"]),
+        ),
     )
 
-@app.get("/test", response_class=HTMLResponse)
-def typing_test(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
+@app.get("/race", response_class=HTMLResponse)
+def race(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    return templates.TemplateResponse("race.html", page_context(request, viewer))
+
+@app.websocket("/ws/race")
+async def race_socket(websocket: WebSocket):
+    # the session lookup is a blocking query; keep it off the loop running the races
+    user_id = await asyncio.to_thread(get_current_user_id, websocket)
+    if not user_id:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    await race_hub.serve(websocket, user_id)
 
-    prefs = get_preferences(user_id)
+@app.get("/test", response_class=HTMLResponse)
+def typing_test(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    prefs = viewer["prefs"]
 
-    prompt_text = make_word_prompt(words=300)
+    prompt_text, prompt_seed = issue_prompt(source="1000", total=300)
     prompt_id = 0
 
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    user_rating = user["rating"] if user and user["rating"] is not None else 1500
-    conn = get_conn()
-    elo_rankings = conn.execute(
-        text("SELECT name, email, rating FROM users ORDER BY rating DESC LIMIT 25")
-    ).fetchall()
-    conn.close()
+    elo_rankings = leaderboard_cache.get_snapshot(templates.env).elo
     if not elo_rankings:
-        elo_rankings = [{
-            "name": user["name"] if user else None,
-            "email": user["email"] if user else None,
-            "rating": user_rating,
-        }]
+        elo_rankings = [{"display": viewer["display_name"], "rating": viewer["rating"]}]
     return templates.TemplateResponse(
         "index.html",
-        {
-            "request": request,
-            "prompt_text": prompt_text,
-            "prompt_id": prompt_id,
-            "duration_seconds": int(prefs["duration_seconds"]),
-            "theme": prefs["theme"],
-            "live_wpm": int(prefs["live_wpm"]),
-            "user_name": display_name,
-            "user_rating": user_rating,
-            "show_home": False,
-            "ranked": True,
-            "user_id": user_id,
-            "elo_rankings": elo_rankings,
-            "logged_in": True,
-        },
+        page_context(
+            request,
+            viewer,
+            prompt_text=prompt_text,
+            prompt_seed=prompt_seed,
+            prompt_id=prompt_id,
+            duration_seconds=int(prefs["duration_seconds"]),
+            live_wpm=int(prefs["live_wpm"]),
+            user_rating=viewer["rating"],
+            show_home=False,
+            ranked=True,
+            elo_rankings=elo_rankings,
+        ),
+    )
+
+def _viewer_etag(snapshot, viewer: dict) -> str:
+    # Personal parts of the page: header, own history and rank.
+    if not viewer["logged_in"]:
+        return snapshot.etag
+    standing = rating_index.rating_index.standing(viewer["user_id"]) or {}
+    personal = (
+        viewer["user_id"], viewer["display_name"], viewer["rating"], viewer["session_count"],
+        standing.get("rank"), standing.get("players"), sorted(viewer["prefs"].items()),
     )
+    digest = hashlib.sha1(repr(personal).encode("utf-8")).hexdigest()[:12]
+    return f'W/{snapshot.etag[:-1]}-{digest}"'
+
+def _cache_headers(etag: str, snapshot) -> dict:
+    return {
+        "ETag": etag,
+        "Last-Modified": snapshot.last_modified_header,
+        "Cache-Control": "no-cache",
+    }
 
 @app.get("/leaderboard", response_class=HTMLResponse)
 def leaderboard(request: Request):
-    user_id = get_current_user_id(request)
-    logged_in = user_id is not None
-    if logged_in:
-        prefs = get_preferences(user_id)
-        user = get_user_summary(user_id)
-        display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
-    else:
-        prefs = {"duration_seconds": 60, "theme": "dark", "live_wpm": 1}
-        display_name = None
-    conn = get_conn()
-    top = conn.execute(text("""
-        SELECT u.name as name, u.email as email, ts.wpm as wpm, ts.accuracy as accuracy, ts.created_at as created_at
-        FROM typing_sessions ts
-        JOIN users u ON u.id = ts.user_id
-        ORDER BY ts.wpm DESC
-        LIMIT 10
-    """)).fetchall()
-
-    elo = conn.execute(text("""
-        SELECT name, email, rating
-        FROM users
-        ORDER BY rating DESC
-        LIMIT 25
-    """)).fetchall()
-    if logged_in:
-        mine = conn.execute(text("""
-            SELECT wpm, accuracy, duration_seconds, created_at
-            FROM typing_sessions
-            WHERE user_id = :user_id
-            ORDER BY created_at DESC
-            LIMIT 50
-        """), {"user_id": user_id}).fetchall()
-    else:
-        mine = []
-    conn.close()
+    snapshot = leaderboard_cache.get_snapshot(templates.env)
+    if not get_current_user_id(request):
+        # anonymous viewers see only global data: answer revalidations without touching the DB
+        headers = _cache_headers(snapshot.etag, snapshot)
+        if leaderboard_cache.not_modified(request, snapshot.etag, snapshot.last_modified):
+            return Response(status_code=304, headers=headers)
+    viewer = get_viewer(request)
+    rating_index.ensure_fresh()
+    etag = _viewer_etag(snapshot, viewer)
+    headers = _cache_headers(etag, snapshot)
+    if viewer["logged_in"] and leaderboard_cache.not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    user_id = viewer["user_id"]
+    mine = history.session_page(user_id)[0] if viewer["logged_in"] else []
+    standing = rating_index.user_standing(user_id) if viewer["logged_in"] else None
 
     return templates.TemplateResponse(
         "leaderboard.html",
-        {
-            "request": request,
-            "top": top,
-            "elo": elo,
-            "mine": mine,
-            "theme": prefs["theme"],
-            "user_name": display_name,
-            "logged_in": logged_in,
-            "user_id": user_id,
-        },
+        page_context(request, viewer, fragments=snapshot.fragments, mine=mine, standing=standing),
+        headers=headers,
     )
 
-@app.get("/settings", response_class=HTMLResponse)
-def settings(request: Request):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
+@app.get("/api/leaderboard")
+def api_leaderboard(request: Request):
+    snapshot = leaderboard_cache.get_snapshot(templates.env)
+    headers = _cache_headers(snapshot.etag, snapshot)
+    if leaderboard_cache.not_modified(request, snapshot.etag, snapshot.last_modified):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(snapshot.as_dict(), headers=headers)
+
+@app.get("/api/leaderboard/stream")
+async def leaderboard_stream():
+    return StreamingResponse(
+        live_feed.subscribe(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    user = get_user_summary(user_id)
-    display_name = user["name"] if user and user["name"] else (user["email"] if user else "User")
+@app.get("/settings", response_class=HTMLResponse)
+def settings(request: Request, viewer: dict = Depends(get_viewer)):
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
     return templates.TemplateResponse(
         "settings.html",
-        {"request": request, "prefs": prefs, "theme": prefs["theme"], "user_name": display_name, "logged_in": True},
+        page_context(request, viewer, prefs=viewer["prefs"]),
     )
 
 @app.post("/settings")
@@ -500,13 +821,12 @@ def save_settings(
     duration_seconds: str = Form(None),
     theme: str = Form(None),
     live_wpm: str = Form(...),
+    viewer: dict = Depends(get_viewer),
 ):
-    uid_or_redirect = require_login(request)
-    if isinstance(uid_or_redirect, RedirectResponse):
-        return uid_or_redirect
-    user_id = uid_or_redirect
-
-    prefs = get_preferences(user_id)
+    if not viewer["logged_in"]:
+        return RedirectResponse("/", status_code=303)
+    user_id = viewer["user_id"]
+    prefs = viewer["prefs"]
 
     if duration_seconds is None:
         duration_seconds = prefs["duration_seconds"]
@@ -547,8 +867,9 @@ def save_typing_session(request: Request):
     return JSONResponse({"error": "use_json"}, status_code=400)
 
 @app.post("/api/session_json")
-async def save_typing_session_json(request: Request):
-    uid = get_current_user_id(request)
+async def save_typing_session_json(request: Request, background: BackgroundTasks):
+    # async for the batched queue; every blocking lookup and write runs in a thread
+    uid = await asyncio.to_thread(get_current_user_id, request)
     if uid is None:
         return JSONResponse({"error": "not_authenticated"}, status_code=401)
 
@@ -572,28 +893,27 @@ async def save_typing_session_json(request: Request):
     if not (0 <= prompt_id < len(PROMPTS)):
         prompt_id = 0
 
-    conn = get_conn()
-    conn.execute(text("""
-        INSERT INTO typing_sessions (user_id, wpm, accuracy, duration_seconds, prompt_id)
-        VALUES (:user_id, :wpm, :accuracy, :duration_seconds, :prompt_id)
-    """), {"user_id": uid, "wpm": wpm, "accuracy": accuracy, "duration_seconds": duration_seconds, "prompt_id": prompt_id})
-    # update rating based on performance
-    row = conn.execute(
-        text("SELECT rating FROM users WHERE id = :user_id"),
-        {"user_id": uid},
-    ).fetchone()
-    current_rating = float(row["rating"]) if row and row["rating"] is not None else 1500.0
-    new_rating = update_rating(current_rating, wpm, duration_seconds)
-    new_rating_int = int(round(new_rating))
-    delta = new_rating_int - int(round(current_rating))
-    conn.execute(
-        text("UPDATE users SET rating = :rating WHERE id = :user_id"),
-        {"rating": new_rating_int, "user_id": uid},
-    )
-    conn.commit()
-    conn.close()
+    submission = {
+        "user_id": uid,
+        "wpm": wpm,
+        "accuracy": accuracy,
+        "duration_seconds": duration_seconds,
+        "prompt_id": prompt_id,
+    }
+    if INGEST_MODE == "batched":
+        try:
+            new_rating_int, delta = await ingest_queue.submit(submission)
+        except QueueFull:
+            return JSONResponse({"error": "busy"}, status_code=503, headers={"Retry-After": "1"})
+        except Exception:
+            return JSONResponse({"error": "save_failed"}, status_code=500)
+    else:
+        new_rating_int, delta = (await asyncio.to_thread(save_sessions, [submission]))[0]
 
-    return JSONResponse({"ok": True, "rating": new_rating_int, "delta": delta})
+    if payload.get("keystats") is not None:
+        background.add_task(keystats.record, uid, payload["keystats"])
+    percentile, _ = await asyncio.to_thread(wpm_histogram.percentile, duration_seconds, wpm)
+    return JSONResponse({"ok": True, "rating": new_rating_int, "delta": delta, "percentile": percentile})
 
 @app.get("/signup", response_class=HTMLResponse)
 def signup_page(request: Request):
@@ -602,25 +922,18 @@ def signup_page(request: Request):
     {"request": request, "error": None, "auth_page": True},
 )
 
-@app.post("/signup")
-def signup(
-    request: Request,
-    email: str = Form(...),
-    password: str = Form(...),
-    name: str | None = Form(None),
-):
-    email = email.strip().lower()
-    if name:
-        name = name.strip()
-    if not name:
-        name = None
-    if len(email) < 3 or "@" not in email:
-        return templates.TemplateResponse("signup.html", {"request": request, "error": "Enter a valid email."})
-    if len(password) < 6:
-        return templates.TemplateResponse("signup.html", {"request": request, "error": "Password must be at least 6 characters."})
+AUTH_BUSY_MESSAGE = "Too many sign-ins right now. Please try again in a moment."
 
-    pw_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+def auth_busy(request: Request, template: str):
+    return templates.TemplateResponse(
+        template,
+        {"request": request, "error": AUTH_BUSY_MESSAGE, "auth_page": True},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
 
+def create_user(name, email: str, pw_hash):
+    """Insert the user with default preferences; (False, None) if the email is taken."""
     conn = get_conn()
     try:
         conn.execute(
@@ -630,16 +943,47 @@ def signup(
         row = conn.execute(
             text("SELECT id FROM users WHERE email = :email"),
             {"email": email},
-        ).fetchone()
+        ).mappings().fetchone()
         user_id = row["id"] if row else None
         conn.commit()
     except Exception:
         conn.close()
-        return templates.TemplateResponse("signup.html", {"request": request, "error": "Email already in use."})
+        return False, None
     conn.close()
 
     # create default preferences
     ensure_preferences(user_id)
+    return True, user_id
+
+@app.post("/signup")
+async def signup(
+    request: Request,
+    email: str = Form(...),
+    password: str = Form(...),
+    name: str | None = Form(None),
+):
+    email = email.strip().lower()
+    if name:
+        name = name.strip()
+    if not name:
+        name = None
+    if len(email) < 3 or "@" not in email:
+        return templates.TemplateResponse("signup.html", {"request": request, "error": "Enter a valid email."})
+    if len(password) < 6:
+        return templates.TemplateResponse("signup.html", {"request": request, "error": "Password must be at least 6 characters."})
+
+    try:
+        pw_hash = await hasher.hash(password)
+    except HasherBusy:
+        return auth_busy(request, "signup.html")
+
+    # the handler is async to await the hasher; database work stays off the event loop
+    created, user_id = await asyncio.to_thread(create_user, name, email, pw_hash)
+    if not created:
+        return templates.TemplateResponse("signup.html", {"request": request, "error": "Email already in use."})
+    if user_id:
+        rating_index.rating_index.set(user_id, DEFAULT_RATING)
+        leaderboard_cache.invalidate()
 
     return RedirectResponse("/login", status_code=303)
 
@@ -651,36 +995,59 @@ def login_page(request: Request):
 )
 
 
+async def rehash_password(user_id: int, old_hash, password: str) -> None:
+    # Runs after the response; the WHERE on the old hash skips users who changed it meanwhile.
+    try:
+        new_hash = await hasher.hash(password)
+    except HasherBusy:
+        return
+    await asyncio.to_thread(store_rehash, user_id, old_hash, new_hash)
+    hasher.rehashed += 1
+
+def store_rehash(user_id: int, old_hash, new_hash) -> None:
+    conn = get_conn()
+    conn.execute(
+        text("UPDATE users SET password_hash = :new WHERE id = :id AND password_hash = :old"),
+        {"new": new_hash, "id": user_id, "old": old_hash},
+    )
+    conn.commit()
+    conn.close()
+
+def get_credentials(email: str):
+    conn = get_conn()
+    row = conn.execute(
+        text("SELECT id, password_hash FROM users WHERE email = :email"),
+        {"email": email},
+    ).mappings().fetchone()
+    conn.close()
+    return row
+
 @app.post("/login")
-def login(
+async def login(
     response: Response,
     request: Request,
+    background: BackgroundTasks,
     email: str = Form(...),
     password: str = Form(...),
 ):
     email = email.strip().lower()
-    conn = get_conn()
-    row = conn.execute(
-        text("SELECT id, password_hash FROM users WHERE email = :email"),
-        {"email": email},
-    ).fetchone()
-    conn.close()
+    # async to await the hasher; the queries run in threads so the loop keeps serving races and SSE
+    row = await asyncio.to_thread(get_credentials, email)
 
     if not row:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid email or password."})
 
-    if not bcrypt.checkpw(password.encode("utf-8"), row["password_hash"]):
+    try:
+        valid = await hasher.verify(password, row["password_hash"])
+    except HasherBusy:
+        return auth_busy(request, "login.html")
+    if not valid:
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid email or password."})
+    if needs_rehash(row["password_hash"]):
+        background.add_task(rehash_password, row["id"], row["password_hash"], password)
 
     # create session
-    sid = secrets.token_urlsafe(32)
-    conn = get_conn()
-    conn.execute(
-        text("INSERT INTO auth_sessions (session_id, user_id) VALUES (:session_id, :user_id)"),
-        {"session_id": sid, "user_id": row["id"]},
-    )
-    conn.commit()
-    conn.close()
+    sid = await asyncio.to_thread(create_session, row["id"])
 
     resp = RedirectResponse("/", status_code=303)
     resp.set_cookie(
@@ -689,21 +1056,13 @@ def login(
         httponly=True,
         samesite="lax",
         secure=False,  # set True on HTTPS deploy
-        max_age=60 * 60 * 24 * 7,
+        max_age=SESSION_MAX_AGE,
     )
     return resp
 
 @app.post("/logout")
 def logout(request: Request, next: str = Form(None)):
-    sid = request.cookies.get(COOKIE_NAME)
-    if sid:
-        conn = get_conn()
-        conn.execute(
-            text("DELETE FROM auth_sessions WHERE session_id = :session_id"),
-            {"session_id": sid},
-        )
-        conn.commit()
-        conn.close()
+    revoke_session(request.cookies.get(COOKIE_NAME))
 
     target = "/"
     if next and isinstance(next, str) and next.startswith("/"):
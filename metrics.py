@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+_request_stats = contextvars.ContextVar("typinglab_request_stats", default=None)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class RouteStats:
+    __slots__ = ("latency", "queries", "connections", "db_seconds", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.connections = 0
+        self.db_seconds = 0.0
+        self.statuses = {}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.queries_total = 0
+        self.connections_total = 0
+        self.db_seconds_total = 0.0
+        self.collectors = []
+        self.histograms = {}
+
+    def histogram(self, name, help_text, bounds=LATENCY_BUCKETS) -> Histogram:
+        """An unlabelled histogram owned by another subsystem, exported as-is."""
+        hist = Histogram(bounds)
+        self.histograms[name] = (help_text, hist)
+        return hist
+
+    def record_request(self, method, route, status, seconds, stats) -> None:
+        key = (method, route)
+        with self._lock:
+            entry = self.routes.get(key)
+            if entry is None:
+                entry = self.routes[key] = RouteStats()
+            entry.latency.observe(seconds)
+            entry.queries.observe(stats[1])
+            entry.connections += stats[0]
+            entry.db_seconds += stats[2]
+            bucket = f"{status // 100}xx"
+            entry.statuses[bucket] = entry.statuses.get(bucket, 0) + 1
+
+    def record_connection(self, stats) -> None:
+        # handlers run in threadpool threads; an unlocked += can lose counts
+        with self._lock:
+            self.connections_total += 1
+            if stats is not None:
+                stats[0] += 1
+
+    def record_query(self, elapsed, stats) -> None:
+        with self._lock:
+            self.queries_total += 1
+            self.db_seconds_total += elapsed
+            if stats is not None:
+                stats[1] += 1
+                stats[2] += elapsed
+
+    def snapshot(self, stats) -> list:
+        with self._lock:
+            return list(stats)
+
+    def add_stats(self, prefix, fn) -> None:
+        """Export the numeric fields of an existing stats() dict as gauges, read at scrape time."""
+        self.collectors.append((prefix, fn))
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            routes = sorted(self.routes.items())
+            lines += _histogram_lines(
+                "typinglab_request_duration_seconds", "Request latency by route.",
+                [(labels, stats.latency) for labels, stats in routes],
+            )
+            lines += _histogram_lines(
+                "typinglab_request_db_queries", "Database queries per request by route.",
+                [(labels, stats.queries) for labels, stats in routes],
+            )
+            lines.append("# HELP typinglab_request_db_connections_total Pool checkouts made while serving the route.")
+            lines.append("# TYPE typinglab_request_db_connections_total counter")
+            for (method, route), stats in routes:
+                lines.append(f'typinglab_request_db_connections_total{{method="{method}",route="{route}"}} {stats.connections}')
+            lines.append("# HELP typinglab_request_db_seconds_total Time spent in database calls while serving the route.")
+            lines.append("# TYPE typinglab_request_db_seconds_total counter")
+            for (method, route), stats in routes:
+                lines.append(f'typinglab_request_db_seconds_total{{method="{method}",route="{route}"}} {stats.db_seconds:.6f}')
+            lines.append("# HELP typinglab_responses_total Responses by route and status class.")
+            lines.append("# TYPE typinglab_responses_total counter")
+            for (method, route), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'typinglab_responses_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            for name, (help_text, hist) in sorted(self.histograms.items()):
+                lines += _plain_histogram_lines(name, help_text, hist)
+            lines.append("# TYPE typinglab_db_queries_total counter")
+            lines.append(f"typinglab_db_queries_total {self.queries_total}")
+            lines.append("# TYPE typinglab_db_connections_total counter")
+            lines.append(f"typinglab_db_connections_total {self.connections_total}")
+            lines.append("# TYPE typinglab_db_seconds_total counter")
+            lines.append(f"typinglab_db_seconds_total {self.db_seconds_total:.6f}")
+        for prefix, fn in self.collectors:
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name, help_text, series):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), hist in series:
+        labels = f'method="{method}",route="{route}"'
+        running = 0
+        for bound, count in zip(hist.bounds, hist.counts):
+            running += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+        lines.append(f"{name}_sum{{{labels}}} {hist.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {hist.count}")
+    return lines
+
+
+def _plain_histogram_lines(name, help_text, hist):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    running = 0
+    for bound, count in zip(hist.bounds, hist.counts):
+        running += count
+        lines.append(f'{name}_bucket{{le="{bound}"}} {running}')
+    lines.append(f'{name}_bucket{{le="+Inf"}} {hist.count}')
+    lines.append(f"{name}_sum {hist.total:.6f}")
+    lines.append(f"{name}_count {hist.count}")
+    return lines
+
+
+registry = Registry()
+
+
+def instrument_engine(engine) -> None:
+    # Per-request numbers live in a contextvar list that threadpool handlers share.
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        registry.record_connection(_request_stats.get())
+
+    # The start time rides on the execution context, which is dropped with the
+    # statement; a failed query never reaches after_cursor_execute.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._typinglab_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_typinglab_start", None)
+        if started is None:
+            return
+        registry.record_query(time.perf_counter() - started, _request_stats.get())
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: one contextvar set and a histogram update per request."""
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        stats = [0, 0, 0.0]
+        token = _request_stats.set(stats)
+        status = [500]
+        # set when the last body chunk is sent: background tasks run after
+        # that and are not part of the request's latency or database work
+        done = [None, None]
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                done[0] = time.perf_counter()
+                done[1] = registry.snapshot(stats)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finished, counted = done
+            elapsed = (finished if finished is not None else time.perf_counter()) - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or ("/static" if scope["path"].startswith("/static/") else "unmatched")
+            registry.record_request(scope["method"], path, status[0], elapsed, counted or stats)
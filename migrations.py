@@ -0,0 +1,279 @@
+import os
+import sys
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from db import engine, get_conn
+
+# Set to 0 in deployments where schema changes are a release step of their own:
+# startup then refuses to run against an old schema instead of altering it.
+AUTO_MIGRATE = os.environ.get("TYPINGLAB_AUTO_MIGRATE", "1") != "0"
+
+_is_sqlite = engine.dialect.name == "sqlite"
+
+# Column types that differ between the backends; DDL below uses them as {placeholders}.
+TYPES = {
+    "serial_pk": "INTEGER PRIMARY KEY AUTOINCREMENT" if _is_sqlite else "SERIAL PRIMARY KEY",
+    "blob": "BLOB" if _is_sqlite else "BYTEA",
+    "timestamp": "TEXT" if _is_sqlite else "TIMESTAMPTZ",
+    "real": "REAL" if _is_sqlite else "DOUBLE PRECISION",
+    "bigint": "INTEGER" if _is_sqlite else "BIGINT",
+    "date": "TEXT" if _is_sqlite else "DATE",
+}
+
+# any constant works; it only has to match between processes migrating the same database
+LOCK_KEY = 7_260_112
+
+VERSION_QUERY = text("SELECT version FROM schema_version WHERE id = 1")
+SET_VERSION_QUERY = text("""
+    INSERT INTO schema_version (id, version, updated_at)
+    VALUES (1, :version, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE SET version = excluded.version, updated_at = CURRENT_TIMESTAMP
+""")
+
+BASELINE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id {serial_pk},
+        name TEXT,
+        email TEXT UNIQUE NOT NULL,
+        rating INTEGER NOT NULL DEFAULT 1500,
+        password_hash {blob} NOT NULL,
+        created_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS auth_sessions (
+        session_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        created_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS preferences (
+        user_id INTEGER PRIMARY KEY,
+        duration_seconds INTEGER NOT NULL DEFAULT 60,
+        theme TEXT NOT NULL DEFAULT 'light',
+        live_wpm INTEGER NOT NULL DEFAULT 1,
+        updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS typing_sessions (
+        id {serial_pk},
+        user_id INTEGER NOT NULL,
+        wpm {real} NOT NULL,
+        accuracy {real} NOT NULL,
+        duration_seconds INTEGER NOT NULL,
+        prompt_id INTEGER NOT NULL,
+        created_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS training_progress (
+        user_id INTEGER NOT NULL,
+        mode TEXT NOT NULL,
+        level INTEGER NOT NULL,
+        percent INTEGER NOT NULL DEFAULT 0,
+        updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, mode, level),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_records (
+        user_id INTEGER PRIMARY KEY,
+        best_wpm {real},
+        session_count INTEGER NOT NULL DEFAULT 0,
+        updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS global_records (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        top_wpm {real},
+        updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS session_daily (
+        user_id INTEGER NOT NULL,
+        day {date} NOT NULL,
+        session_count INTEGER NOT NULL DEFAULT 0,
+        wpm_sum {real} NOT NULL DEFAULT 0,
+        best_wpm {real} NOT NULL DEFAULT 0,
+        accuracy_sum {real} NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wpm_histogram (
+        duration_seconds INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count {bigint} NOT NULL DEFAULT 0,
+        PRIMARY KEY (duration_seconds, bucket)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_keystats (
+        user_id INTEGER PRIMARY KEY,
+        samples {bigint} NOT NULL DEFAULT 0,
+        stats {blob} NOT NULL,
+        updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+
+def _execute(conn, *statements) -> None:
+    for statement in statements:
+        conn.execute(text(statement.format(**TYPES)))
+
+
+def _baseline(conn) -> None:
+    """Everything the old create-on-import init_db() made, so existing databases adopt version 1 as is."""
+    _execute(conn, *BASELINE_TABLES)
+    # databases from before users had a display name or a rating
+    if _is_sqlite:
+        cols = {row[1] for row in conn.execute(text("PRAGMA table_info(users)"))}
+        if "name" not in cols:
+            _execute(conn, "ALTER TABLE users ADD COLUMN name TEXT")
+        if "rating" not in cols:
+            _execute(conn, "ALTER TABLE users ADD COLUMN rating INTEGER NOT NULL DEFAULT 1500")
+    else:
+        _execute(
+            conn,
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS name TEXT",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS rating INTEGER NOT NULL DEFAULT 1500",
+        )
+    # keyset paging over a user's history (see history.py)
+    _execute(conn, """
+    CREATE INDEX IF NOT EXISTS idx_typing_sessions_user_created
+    ON typing_sessions (user_id, created_at, id)
+    """)
+
+
+def _wpm_index(conn) -> None:
+    # TOP_WPM_QUERY and the records rebuild sort or aggregate on wpm alone
+    _execute(conn, "CREATE INDEX IF NOT EXISTS idx_typing_sessions_wpm ON typing_sessions (wpm)")
+
+
+def _backfill_aggregates(conn) -> None:
+    """Derive records, daily rollups and WPM histograms from sessions saved before they existed."""
+    import history
+    import records
+    import wpm_histogram
+
+    # the rebuilds write through their own connections
+    records.ensure_initialized()
+    history.ensure_initialized()
+    wpm_histogram.ensure_initialized()
+
+
+def _retention(conn) -> None:
+    """State and indexes for retention.py: expiring auth sessions and compacting old typing sessions."""
+    _execute(
+        conn,
+        "CREATE INDEX IF NOT EXISTS idx_auth_sessions_created ON auth_sessions (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_typing_sessions_created ON typing_sessions (created_at)",
+        """
+        CREATE TABLE IF NOT EXISTS retention_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            sessions_compacted_before {date}
+        )
+        """,
+    )
+
+
+# (version, description, step) in the order they are applied. Never edit or
+# reorder a step that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "index typing_sessions by wpm", _wpm_index),
+    (3, "backfill derived aggregates", _backfill_aggregates),
+    (4, "retention indexes and state", _retention),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version() -> int:
+    """The stored schema version, or 0 for a database that predates schema_version."""
+    conn = get_conn()
+    try:
+        row = conn.execute(VERSION_QUERY).fetchone()
+    except DBAPIError:
+        return 0
+    finally:
+        conn.close()
+    return row[0] if row else 0
+
+
+def migrate(verbose: bool = False) -> list:
+    """Apply pending steps in order, each in its own transaction with the version bump.
+
+    Returns the versions applied. On Postgres an advisory lock serialises
+    workers starting together; the version is re-read under it, so only one
+    of them runs each step.
+    """
+    with engine.begin() as conn:
+        _execute(conn, """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at {timestamp} NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        with engine.begin() as conn:
+            if not _is_sqlite:
+                conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+            row = conn.execute(VERSION_QUERY).fetchone()
+            if row is not None and row[0] >= version:
+                continue
+            if verbose:
+                print(f"applying {version}: {description}")
+            step(conn)
+            conn.execute(SET_VERSION_QUERY, {"version": version})
+        applied.append(version)
+    return applied
+
+
+def ensure_current() -> None:
+    """Startup check: a single-row read when the schema is current, migrations otherwise."""
+    version = current_version()
+    if version >= LATEST:
+        return
+    if not AUTO_MIGRATE:
+        raise RuntimeError(
+            f"database schema is at version {version}, this build needs {LATEST}; "
+            "run `python migrations.py migrate` first"
+        )
+    migrate()
+
+
+def status() -> None:
+    version = current_version()
+    for number, description, _ in MIGRATIONS:
+        state = "applied" if number <= version else "pending"
+        print(f"{number:>4}  {state:<8} {description}")
+    print(f"schema version {version}, latest {LATEST}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1:] or ["status"]
+    if command == ["status"]:
+        status()
+    elif command == ["migrate"]:
+        applied = migrate(verbose=True)
+        print(f"schema at version {current_version()}" + ("" if applied else " (nothing to do)"))
+    else:
+        print("usage: python migrations.py [status|migrate]")
+        sys.exit(2)
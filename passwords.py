@@ -0,0 +1,166 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from db import WORKERS
+
+BCRYPT_ROUNDS = int(os.environ.get("TYPINGLAB_BCRYPT_ROUNDS", "12"))
+# Half the CPUs for the whole deployment, split across the server processes like the DB pool.
+HASH_WORKERS = int(os.environ.get(
+    "TYPINGLAB_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2 // WORKERS))
+))
+HASH_MAX_QUEUE = int(os.environ.get("TYPINGLAB_HASH_MAX_QUEUE", "32"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _as_bytes(value) -> bytes:
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    return bytes(value)
+
+
+def hash_rounds(pw_hash) -> int | None:
+    """Work factor encoded in a bcrypt hash ($2b$12$...)."""
+    try:
+        return int(_as_bytes(pw_hash).split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(pw_hash, rounds: int = BCRYPT_ROUNDS) -> bool:
+    return hash_rounds(pw_hash) != rounds
+
+
+# Run inside the pool processes; they return when they started so the parent
+# can tell queue wait apart from hashing time.
+
+def _hash(password: bytes, rounds: int):
+    started = time.time()
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)), started
+
+
+def _check(password: bytes, pw_hash: bytes):
+    started = time.time()
+    return bcrypt.checkpw(password, pw_hash), started
+
+
+def _warm():
+    return os.getpid()
+
+
+class PasswordHasher:
+    """bcrypt on a dedicated process pool, so password bursts cannot starve request threads.
+
+    At most `workers + max_queue` jobs are accepted; beyond that callers get
+    HasherBusy and should shed the request.
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_queue=HASH_MAX_QUEUE, rounds=BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.rounds = rounds
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.last_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+        self.wait_histogram = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    # spawn: fresh interpreters, so no forked copies of the app's open connections.
+                    # They still re-import the parent's __main__ file (without running its
+                    # __main__ block), so the server cannot be started from a script piped to stdin.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def start(self) -> None:
+        pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_warm)
+
+    def _discard_pool(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self) -> None:
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise HasherBusy()
+            self.in_flight += 1
+        submitted = time.time()
+        try:
+            try:
+                result, started = await asyncio.wrap_future(self._pool().submit(fn, *args))
+            except BrokenProcessPool:
+                # a worker died (OOM killer, signal); start a fresh pool and retry once
+                self._discard_pool()
+                result, started = await asyncio.wrap_future(self._pool().submit(fn, *args))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        finished = time.time()
+        wait_ms = max(0.0, (started - submitted) * 1000.0)
+        with self._lock:
+            self.completed += 1
+            self.last_wait_ms = wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.total_wait_ms += wait_ms
+            self.total_run_ms += (finished - started) * 1000.0
+        if self.wait_histogram is not None:
+            self.wait_histogram.observe(wait_ms / 1000.0)
+        return result
+
+    async def hash(self, password: str) -> bytes:
+        return await self._run(_hash, password.encode("utf-8"), self.rounds)
+
+    async def verify(self, password: str, pw_hash) -> bool:
+        return await self._run(_check, password.encode("utf-8"), _as_bytes(pw_hash))
+
+    def stats(self) -> dict:
+        done = self.completed
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "in_flight": self.in_flight,
+            "completed": done,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "last_wait_ms": round(self.last_wait_ms, 3),
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "avg_wait_ms": round(self.total_wait_ms / done, 3) if done else None,
+            "avg_hash_ms": round(self.total_run_ms / done, 3) if done else None,
+        }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,218 @@
+import os
+import secrets
+import threading
+from array import array
+from collections import deque
+
+POOL_PROMPT_WORDS = int(os.environ.get("TYPINGLAB_PROMPT_POOL_WORDS", "300"))
+POOL_DEPTH = int(os.environ.get("TYPINGLAB_PROMPT_POOL_DEPTH", "64"))
+POOL_MAX_BYTES = int(os.environ.get("TYPINGLAB_PROMPT_POOL_MAX_BYTES", str(8 * 1024 * 1024)))
+POOL_MAX_PROFILES = 16
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+REFILL_INTERVAL_SECONDS = 1.0
+
+
+def _random_u32(count: int):
+    # One urandom call per batch instead of one secrets call per word.
+    return memoryview(secrets.token_bytes(count * 4)).cast("I")
+
+
+def generate_prompts(pool, count: int, words: int, number_rate: float = 0.0) -> list[str]:
+    n = count * words
+    size = len(pool)
+    picks = _random_u32(n)
+    threshold = int(number_rate * 1000)
+    if threshold > 0:
+        gates = _random_u32(n)
+        numbers = _random_u32(n)
+    out = []
+    for p in range(count):
+        base = p * words
+        prompt = []
+        for i in range(base, base + words):
+            if threshold > 0 and gates[i] % 1000 < threshold:
+                prompt.append(str(numbers[i] % 10000))
+            else:
+                prompt.append(pool[picks[i] % size])
+        out.append(" ".join(prompt))
+    return out
+
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def _mix64(x: int) -> int:
+    # splitmix64 finalizer
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK64
+    return x ^ (x >> 31)
+
+
+def new_prompt_seed() -> str:
+    return secrets.token_hex(8)
+
+
+def parse_prompt_seed(seed: str):
+    """Return the seed as an int, or None unless it is 1-16 hex digits."""
+    # int(seed, 16) alone would also take "-1", "0x10", "1_0" and surrounding spaces
+    if not seed or len(seed) > 16 or not _HEX_DIGITS.issuperset(seed):
+        return None
+    return int(seed, 16)
+
+
+def seeded_words(pool, seed: int, start: int, count: int, number_rate: float = 0.0) -> list[str]:
+    """Words start..start+count of the prompt identified by seed.
+
+    Every word is a pure function of (seed, index), so any chunk can be
+    regenerated on its own and nothing about issued prompts is stored. A
+    pool with a pick(hash) method (a weighted pool) chooses its own word.
+    """
+    size = len(pool)
+    pick = getattr(pool, "pick", None)
+    threshold = int(number_rate * 1000)
+    out = []
+    for i in range(start, start + count):
+        h = _mix64((seed + (i + 1) * _GOLDEN) & _MASK64)
+        if threshold > 0:
+            g = _mix64(h)
+            if g % 1000 < threshold:
+                out.append(str((g >> 20) % 10000))
+                continue
+        out.append(pick(h) if pick is not None else pool[h % size])
+    return out
+
+
+def _word_ends(prompt: str) -> array:
+    ends = array("I")
+    pos = prompt.find(" ")
+    while pos != -1:
+        ends.append(pos)
+        pos = prompt.find(" ", pos + 1)
+    ends.append(len(prompt))
+    return ends
+
+
+class PromptPool:
+    def __init__(self, word_source, prompt_words=POOL_PROMPT_WORDS, depth=POOL_DEPTH, max_bytes=POOL_MAX_BYTES):
+        self._word_source = word_source
+        self.prompt_words = prompt_words
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._rings = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.dropped = 0
+
+    @staticmethod
+    def profile_key(source: str, number_rate: float):
+        return (source, round(float(number_rate), 3))
+
+    def register(self, source: str, number_rate: float = 0.0) -> None:
+        """Keep prompts ready for this profile. Only the app's fixed profiles
+        are registered; take() on any other profile is a plain miss."""
+        key = self.profile_key(source, number_rate)
+        with self._lock:
+            if key not in self._rings and len(self._rings) < POOL_MAX_PROFILES:
+                self._rings[key] = deque()
+        self._ensure_started()
+        self._wake.set()
+
+    def take(self, source: str, number_rate: float, words: int):
+        """Return a ready-made prompt of `words` words, or None on a miss."""
+        if words > self.prompt_words:
+            self.misses += 1
+            return None
+        key = self.profile_key(source, number_rate)
+        entry = None
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring:
+                entry = ring.popleft()
+                self._bytes -= len(entry[0])
+                low = len(ring) < self.depth // 2
+            else:
+                low = True
+        if ring is not None and low:
+            self._ensure_started()
+            self._wake.set()
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        prompt, ends = entry
+        return prompt[:ends[words - 1]]
+
+    def refill(self) -> None:
+        with self._lock:
+            wanted = [(key, self.depth - len(ring)) for key, ring in self._rings.items() if len(ring) < self.depth]
+        for (source, number_rate), missing in wanted:
+            pool = self._word_source(source)
+            # rough size guess so a full cap doesn't generate prompts only to drop them
+            budget = (self.max_bytes - self._bytes) // max(1, self.prompt_words * 8)
+            missing = min(missing, budget)
+            if not pool or missing <= 0:
+                continue
+            batch = generate_prompts(pool, missing, self.prompt_words, number_rate)
+            entries = [(prompt, _word_ends(prompt)) for prompt in batch]
+            with self._lock:
+                ring = self._rings.get((source, number_rate))
+                if ring is None:
+                    continue
+                for entry in entries:
+                    if self._bytes + len(entry[0]) > self.max_bytes:
+                        self.dropped += 1
+                        continue
+                    ring.append(entry)
+                    self._bytes += len(entry[0])
+            self.refills += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(REFILL_INTERVAL_SECONDS)
+            self._wake.clear()
+            try:
+                self.refill()
+            except Exception:
+                # never let a bad refill kill the thread; requests fall back to inline generation
+                pass
+
+    def _ensure_started(self) -> None:
+        # threads do not survive fork, so restart per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="prompt-pool-refill", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            profiles = {f"{source}:{rate}": len(ring) for (source, rate), ring in self._rings.items()}
+            used = self._bytes
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "refills": self.refills,
+            "dropped": self.dropped,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "depth": self.depth,
+            "profiles": profiles,
+        }
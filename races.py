@@ -0,0 +1,422 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from itertools import count
+
+from sqlalchemy import text
+from starlette.websockets import WebSocketDisconnect
+
+from db import get_conn
+from ingest import INGEST_MODE, ingest_queue, save_sessions
+from leaderboard import display_name
+from prompt_pool import new_prompt_seed, parse_prompt_seed, seeded_words
+from rating import DEFAULT_RATING, standard_duration
+from rating_index import ensure_fresh
+
+logger = logging.getLogger(__name__)
+
+RACE_SIZE = int(os.environ.get("TYPINGLAB_RACE_SIZE", "4"))
+RACE_WORDS = int(os.environ.get("TYPINGLAB_RACE_WORDS", "40"))
+RACE_TICK_MS = float(os.environ.get("TYPINGLAB_RACE_TICK_MS", "200"))
+RACE_FILL_SECONDS = float(os.environ.get("TYPINGLAB_RACE_FILL_SECONDS", "5"))
+RACE_COUNTDOWN_SECONDS = 3.0
+# Races end after this long; racers still typing are scored on what they typed by then.
+RACE_SECONDS = 60
+RACE_SOURCE = "1000"
+MATCH_WINDOW = 100.0
+MATCH_WIDEN_PER_SECOND = 25.0
+MAX_MESSAGE_BYTES = 256
+CONTROL_BACKLOG = 8
+MAX_WPM = 400
+
+NAME_QUERY = text("SELECT name, email FROM users WHERE id = :user_id")
+
+
+def _dumps(message) -> str:
+    return json.dumps(message, separators=(",", ":"))
+
+
+class Racer:
+    """One socket. Outgoing messages are coalesced: a slow reader only ever
+    has the newest tick plus a few control messages waiting for it."""
+
+    __slots__ = ("user_id", "name", "rating", "socket", "room", "chars", "accuracy",
+                 "finished_at", "elapsed", "wpm", "closing", "_control", "_tick", "_wake")
+
+    def __init__(self, socket, user_id: int, name: str, rating: int):
+        self.socket = socket
+        self.user_id = user_id
+        self.name = name
+        self.rating = rating
+        self.room = None
+        self.chars = 0
+        self.accuracy = 1.0
+        self.finished_at = None
+        self.elapsed = None
+        self.wpm = None
+        self.closing = False
+        self._control = deque(maxlen=CONTROL_BACKLOG)
+        self._tick = None
+        self._wake = asyncio.Event()
+
+    def send(self, message: str) -> None:
+        self._control.append(message)
+        self._wake.set()
+
+    def send_tick(self, message: str) -> None:
+        self._tick = message
+        self._wake.set()
+
+    def close(self) -> None:
+        self.closing = True
+        self._wake.set()
+
+    async def writer(self) -> None:
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                while self._control:
+                    await self.socket.send_text(self._control.popleft())
+                if self._tick is not None:
+                    message, self._tick = self._tick, None
+                    await self.socket.send_text(message)
+                if self.closing:
+                    await self.socket.close()
+                    return
+        except Exception:
+            # the peer went away; the reader notices and cleans up
+            return
+
+
+class RaceRoom:
+    def __init__(self, room_id: int, anchor: float):
+        self.id = room_id
+        self.anchor = anchor
+        self.racers = {}
+        self.created = time.monotonic()
+        self.filled_at = None
+        self.state = "waiting"
+        self.seed = None
+        self.text = ""
+        self.started_at = None
+        self.ends_at = None
+        self.finishers = 0
+        self.dirty = False
+        self.saves = []
+
+    def window(self, now: float) -> float:
+        return MATCH_WINDOW + MATCH_WIDEN_PER_SECOND * (now - self.created)
+
+    def lobby_message(self) -> str:
+        return _dumps({
+            "type": "lobby",
+            "room": self.id,
+            "size": RACE_SIZE,
+            "players": [{"id": r.user_id, "name": r.name, "rating": r.rating} for r in self.racers.values()],
+        })
+
+    def tick_message(self, now: float) -> str:
+        total = max(1, len(self.text))
+        elapsed = max(1e-6, now - self.started_at)
+        racers = []
+        for r in self.racers.values():
+            racers.append({
+                "id": r.user_id,
+                "progress": round(min(r.chars, total) / total, 3),
+                "wpm": r.wpm if r.wpm is not None else round(r.chars / 5.0 / (elapsed / 60.0), 1),
+                "done": r.finished_at is not None,
+            })
+        return _dumps({"type": "tick", "t": round(now - self.started_at, 1), "racers": racers})
+
+
+class RaceHub:
+    """Matchmaking and race state for this worker process.
+
+    Players are grouped into rooms by rating; a room's acceptable rating
+    window widens the longer it waits. One loop drives every room: it starts
+    rooms that are full (or have waited long enough), and once per tick
+    sends each changed room one snapshot, shared by all of its racers.
+    """
+
+    def __init__(self, word_source):
+        self._word_source = word_source
+        self._rooms = {}
+        self._by_user = {}
+        self._ids = count(1)
+        self._task = None
+        self._saving = set()
+        self.sockets = 0
+        self.races_started = 0
+        self.races_finished = 0
+        self.results_saved = 0
+        self.results_rejected = 0
+        self.ticks_sent = 0
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # -- matchmaking -------------------------------------------------------
+
+    def _join(self, racer: Racer) -> RaceRoom:
+        now = time.monotonic()
+        best = None
+        for room in self._rooms.values():
+            if room.state != "waiting" or len(room.racers) >= RACE_SIZE:
+                continue
+            gap = abs(room.anchor - racer.rating)
+            if gap <= room.window(now) and (best is None or gap < abs(best.anchor - racer.rating)):
+                best = room
+        if best is None:
+            best = RaceRoom(next(self._ids), racer.rating)
+            self._rooms[best.id] = best
+        n = len(best.racers)
+        best.anchor = (best.anchor * n + racer.rating) / (n + 1)
+        best.racers[racer.user_id] = racer
+        if len(best.racers) == 2:
+            best.filled_at = now
+        racer.room = best
+        self._broadcast(best, best.lobby_message())
+        return best
+
+    def _leave(self, racer: Racer) -> None:
+        room = racer.room
+        racer.room = None
+        if room is None:
+            return
+        if room.state == "waiting":
+            room.racers.pop(racer.user_id, None)
+            if len(room.racers) < 2:
+                room.filled_at = None
+            if room.racers:
+                self._broadcast(room, room.lobby_message())
+            else:
+                self._rooms.pop(room.id, None)
+        elif racer.finished_at is None:
+            # stays listed for the others but can no longer finish
+            room.dirty = True
+
+    # -- race lifecycle ----------------------------------------------------
+
+    def _start(self, room: RaceRoom, now: float) -> None:
+        room.state = "running"
+        room.seed = new_prompt_seed()
+        pool = self._word_source(RACE_SOURCE)
+        room.text = " ".join(seeded_words(pool, parse_prompt_seed(room.seed), 0, RACE_WORDS))
+        room.started_at = now + RACE_COUNTDOWN_SECONDS
+        room.ends_at = room.started_at + RACE_SECONDS
+        self.races_started += 1
+        self._broadcast(room, _dumps({
+            "type": "start",
+            "room": room.id,
+            "seed": room.seed,
+            "source": RACE_SOURCE,
+            "words": RACE_WORDS,
+            "text": room.text,
+            "countdown": RACE_COUNTDOWN_SECONDS,
+            "seconds": RACE_SECONDS,
+            "players": [{"id": r.user_id, "name": r.name, "rating": r.rating} for r in room.racers.values()],
+        }))
+
+    def progress(self, racer: Racer, chars, accuracy) -> None:
+        room = racer.room
+        now = time.monotonic()
+        if room is None or room.state != "running" or now < room.started_at or racer.finished_at is not None:
+            return
+        try:
+            chars = int(chars)
+        except (TypeError, ValueError):
+            return
+        if accuracy is not None:
+            try:
+                racer.accuracy = max(0.0, min(1.0, float(accuracy)))
+            except (TypeError, ValueError):
+                pass
+        total = len(room.text)
+        # progress only moves forward and never past the prompt
+        racer.chars = max(racer.chars, min(chars, total))
+        room.dirty = True
+        if racer.chars >= total:
+            racer.finished_at = now
+            racer.elapsed = now - room.started_at
+            racer.wpm = round(total / 5.0 / (racer.elapsed / 60.0), 1)
+            room.finishers += 1
+            self._record(racer, room.finishers)
+
+    def _finish(self, room: RaceRoom, now: float) -> None:
+        room.state = "finished"
+        for racer in room.racers.values():
+            if racer.finished_at is None and racer.room is room and racer.chars > 0:
+                # out of time: scored on what was typed, like a timed test
+                racer.elapsed = RACE_SECONDS
+                racer.wpm = round(racer.chars / 5.0 / (RACE_SECONDS / 60.0), 1)
+                self._record(racer, None)
+        standings = sorted(
+            room.racers.values(),
+            key=lambda r: (r.finished_at is None, r.finished_at or 0.0, -r.chars),
+        )
+        end = _dumps({
+            "type": "end",
+            "standings": [
+                {"id": r.user_id, "name": r.name, "wpm": r.wpm, "done": r.finished_at is not None}
+                for r in standings
+            ],
+        })
+        self._rooms.pop(room.id, None)
+        self.races_finished += 1
+        self._track(asyncio.get_running_loop().create_task(self._close_room(room, end)))
+
+    async def _close_room(self, room: RaceRoom, end: str) -> None:
+        # results carry the rating change; they must reach the socket before it closes
+        if room.saves:
+            await asyncio.gather(*room.saves, return_exceptions=True)
+        for racer in room.racers.values():
+            if racer.room is room:
+                racer.send(end)
+                racer.close()
+
+    def _record(self, racer: Racer, place) -> None:
+        task = asyncio.get_running_loop().create_task(self._save(racer, place))
+        racer.room.saves.append(task)
+        self._track(task)
+
+    def _track(self, task) -> None:
+        self._saving.add(task)
+        task.add_done_callback(self._saving.discard)
+
+    async def _save(self, racer: Racer, place) -> None:
+        if not racer.wpm or racer.wpm > MAX_WPM:
+            self.results_rejected += 1
+            racer.send(_dumps({"type": "result", "place": place, "wpm": racer.wpm, "rated": False}))
+            return
+        submission = {
+            "user_id": racer.user_id,
+            "wpm": racer.wpm,
+            "accuracy": racer.accuracy,
+            # the standard test length nearest the time actually raced: histograms
+            # and rating factors are keyed on those, and a 20 s race is no 60 s test
+            "duration_seconds": standard_duration(racer.elapsed),
+            "prompt_id": 0,
+        }
+        try:
+            if INGEST_MODE == "batched":
+                new_rating, delta = await ingest_queue.submit(submission)
+            else:
+                new_rating, delta = (await asyncio.to_thread(save_sessions, [submission]))[0]
+        except Exception:
+            logger.exception("could not save race result")
+            racer.send(_dumps({"type": "result", "place": place, "wpm": racer.wpm, "rated": False}))
+            return
+        self.results_saved += 1
+        racer.send(_dumps({
+            "type": "result", "place": place, "wpm": racer.wpm, "rated": True, "rating": new_rating, "delta": delta,
+        }))
+
+    def _broadcast(self, room: RaceRoom, message: str) -> None:
+        for racer in room.racers.values():
+            if racer.room is room:
+                racer.send(message)
+
+    async def _run(self) -> None:
+        interval = RACE_TICK_MS / 1000.0
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for room in list(self._rooms.values()):
+                try:
+                    self._advance(room, now)
+                except Exception:
+                    logger.exception("race room %s failed", room.id)
+                    self._rooms.pop(room.id, None)
+
+    def _advance(self, room: RaceRoom, now: float) -> None:
+        if room.state == "waiting":
+            if len(room.racers) >= RACE_SIZE or (
+                room.filled_at is not None and now - room.filled_at >= RACE_FILL_SECONDS
+            ):
+                self._start(room, now)
+            return
+        if room.state != "running":
+            return
+        connected = [r for r in room.racers.values() if r.room is room]
+        if now >= room.ends_at or all(r.finished_at is not None for r in connected):
+            self._finish(room, now)
+            return
+        if room.dirty and now >= room.started_at:
+            room.dirty = False
+            message = room.tick_message(now)
+            for racer in connected:
+                racer.send_tick(message)
+            self.ticks_sent += 1
+
+    # -- sockets -----------------------------------------------------------
+
+    async def serve(self, socket, user_id: int) -> None:
+        """Run one accepted WebSocket until the race ends or the peer leaves."""
+        previous = self._by_user.get(user_id)
+        # a racer whose race just ended may still be draining its close; a
+        # quick "race again" replaces it instead of counting as a second tab
+        if previous is not None and not previous.closing:
+            await socket.close(code=4409)
+            return
+        # both may hit the database (the rating index resyncs with a full scan)
+        name, rating = await asyncio.to_thread(_profile, user_id)
+        racer = Racer(socket, user_id, name, rating)
+        self._by_user[user_id] = racer
+        self.sockets += 1
+        self._ensure_started()
+        writer = asyncio.get_running_loop().create_task(racer.writer())
+        try:
+            self._join(racer)
+            while not racer.closing:
+                raw = await socket.receive_text()
+                if len(raw) > MAX_MESSAGE_BYTES:
+                    break
+                try:
+                    message = json.loads(raw)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and message.get("type") == "progress":
+                    self.progress(racer, message.get("chars"), message.get("accuracy"))
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            self._leave(racer)
+            if self._by_user.get(user_id) is racer:
+                del self._by_user[user_id]
+            self.sockets -= 1
+            racer.close()
+            try:
+                await asyncio.wait_for(writer, 1.0)
+            except Exception:
+                writer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "sockets": self.sockets,
+            "rooms": len(self._rooms),
+            "waiting_rooms": sum(1 for room in self._rooms.values() if room.state == "waiting"),
+            "races_started": self.races_started,
+            "races_finished": self.races_finished,
+            "results_saved": self.results_saved,
+            "results_rejected": self.results_rejected,
+            "ticks_sent": self.ticks_sent,
+        }
+
+
+def _profile(user_id: int):
+    """(display name, rating) for a new racer; blocking, so call it in a thread."""
+    conn = get_conn()
+    row = conn.execute(NAME_QUERY, {"user_id": user_id}).mappings().fetchone()
+    conn.close()
+    name = display_name(row["name"], row["email"]) if row is not None else "Player"
+    return name, int(ensure_fresh().get(user_id, DEFAULT_RATING))
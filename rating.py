@@ -0,0 +1,39 @@
+ELO_W0 = 40.0
+ELO_K = 32.0
+ELO_P = 4.0
+
+DURATION_FACTORS = {
+    15: 0.85,
+    30: 0.95,
+    60: 1.0,
+    120: 1.1,
+}
+LOSS_DAMPING = 0.85
+RATING_MIN = 0.0
+RATING_MAX = 3000.0
+DEFAULT_RATING = 1500
+
+def standard_duration(seconds: float) -> int:
+    """The DURATION_FACTORS test length nearest to `seconds`."""
+    return min(DURATION_FACTORS, key=lambda d: abs(d - seconds))
+
+def expected_wpm(rating: float) -> float:
+    return ELO_W0 * (10 ** ((rating - 1500.0) / 400.0))
+
+def score_from_performance(perf: float, expected: float) -> float:
+    if expected <= 0:
+        return 0.5
+    ratio = perf / expected
+    if ratio <= 0:
+        return 0.0
+    return 1.0 / (1.0 + (1.0 / ratio) ** ELO_P)
+
+def update_rating(current: float, perf: float, duration_seconds: int) -> float:
+    exp_wpm = expected_wpm(current)
+    s = score_from_performance(perf, exp_wpm)
+    duration_factor = DURATION_FACTORS.get(duration_seconds, 1.0)
+    delta = ELO_K * (s - 0.5) * duration_factor
+    if delta < 0:
+        delta *= LOSS_DAMPING
+    new_rating = current + delta
+    return max(RATING_MIN, min(RATING_MAX, new_rating))
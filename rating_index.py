@@ -0,0 +1,227 @@
+import bisect
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import bindparam, text
+
+from db import get_conn
+from leaderboard import display_name
+from rating import DEFAULT_RATING, RATING_MAX, RATING_MIN
+
+logger = logging.getLogger(__name__)
+
+SYNC_SECONDS = float(os.environ.get("TYPINGLAB_RATING_INDEX_SYNC_SECONDS", "60"))
+
+_LOW = int(RATING_MIN)
+_HIGH = int(RATING_MAX)
+
+
+class RatingIndex:
+    """Order statistics over integer ratings.
+
+    A Fenwick tree counts players per rating, indexed from the highest
+    rating down, so prefix sums are "players ranked above". Each rating
+    also keeps a sorted list of user ids to break ties and to list players
+    around a given rank.
+    """
+
+    def __init__(self):
+        self.size = _HIGH - _LOW + 1
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._tree = [0] * (self.size + 1)
+        self._buckets = {}
+        self._ratings = {}
+
+    @staticmethod
+    def _slot(rating: int) -> int:
+        # 1-based Fenwick position; the highest rating comes first.
+        return _HIGH - min(_HIGH, max(_LOW, rating)) + 1
+
+    def _add(self, slot: int, delta: int) -> None:
+        while slot <= self.size:
+            self._tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot: int) -> int:
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def _find(self, k: int) -> int:
+        """Smallest slot whose prefix count exceeds k (0-based ordinal)."""
+        slot = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = slot + step
+            if nxt <= self.size and self._tree[nxt] <= k:
+                slot = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return slot + 1
+
+    def _insert(self, user_id: int, rating: int) -> None:
+        slot = self._slot(rating)
+        bisect.insort(self._buckets.setdefault(slot, []), user_id)
+        self._ratings[user_id] = rating
+        self._add(slot, 1)
+
+    def _remove(self, user_id: int) -> None:
+        rating = self._ratings.pop(user_id)
+        slot = self._slot(rating)
+        bucket = self._buckets[slot]
+        del bucket[bisect.bisect_left(bucket, user_id)]
+        if not bucket:
+            del self._buckets[slot]
+        self._add(slot, -1)
+
+    def load(self, rows) -> None:
+        """Replace the contents with (user_id, rating) pairs in O(n)."""
+        tree = [0] * (self.size + 1)
+        buckets = {}
+        ratings = {}
+        for user_id, rating in rows:
+            rating = int(rating)
+            slot = self._slot(rating)
+            buckets.setdefault(slot, []).append(user_id)
+            ratings[user_id] = rating
+            tree[slot] += 1
+        for slot in range(1, self.size + 1):
+            parent = slot + (slot & -slot)
+            if parent <= self.size:
+                tree[parent] += tree[slot]
+        for bucket in buckets.values():
+            bucket.sort()
+        with self._lock:
+            self._tree, self._buckets, self._ratings = tree, buckets, ratings
+
+    def set(self, user_id: int, rating: int) -> None:
+        rating = int(rating)
+        with self._lock:
+            if self._ratings.get(user_id) == rating:
+                return
+            if user_id in self._ratings:
+                self._remove(user_id)
+            self._insert(user_id, rating)
+
+    def discard(self, user_id: int) -> None:
+        with self._lock:
+            if user_id in self._ratings:
+                self._remove(user_id)
+
+    def get(self, user_id: int, default=None):
+        with self._lock:
+            return self._ratings.get(user_id, default)
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def _ordinal(self, user_id: int) -> int:
+        slot = self._slot(self._ratings[user_id])
+        return self._prefix(slot - 1) + bisect.bisect_left(self._buckets[slot], user_id)
+
+    def _at(self, ordinal: int):
+        slot = self._find(ordinal)
+        offset = ordinal - self._prefix(slot - 1)
+        return self._buckets[slot][offset], _HIGH - slot + 1
+
+    def standing(self, user_id: int):
+        """Return {rating, rank, players, percentile} or None for unknown users.
+
+        Rank counts players with a strictly higher rating, so ties share a
+        rank; percentile is the share of players rated below the user.
+        """
+        with self._lock:
+            rating = self._ratings.get(user_id)
+            if rating is None:
+                return None
+            slot = self._slot(rating)
+            above = self._prefix(slot - 1)
+            players = len(self._ratings)
+            below = players - self._prefix(slot)
+        return {
+            "rating": rating,
+            "rank": above + 1,
+            "players": players,
+            "percentile": round(100.0 * below / players, 1) if players > 1 else 100.0,
+        }
+
+    def around(self, user_id: int, count: int = 5):
+        """Up to `count` players above and below the user, best first, as (user_id, rating, rank)."""
+        with self._lock:
+            if user_id not in self._ratings:
+                return []
+            ordinal = self._ordinal(user_id)
+            lo = max(0, ordinal - count)
+            hi = min(len(self._ratings), ordinal + count + 1)
+            out = []
+            for k in range(lo, hi):
+                uid, rating = self._at(k)
+                out.append((uid, rating, self._prefix(self._slot(rating) - 1) + 1))
+        return out
+
+    def top(self, count: int = 25):
+        with self._lock:
+            out = []
+            for k in range(min(count, len(self._ratings))):
+                uid, rating = self._at(k)
+                out.append((uid, rating, self._prefix(self._slot(rating) - 1) + 1))
+        return out
+
+    def needs_sync(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at >= SYNC_SECONDS
+
+    def mark_synced(self) -> None:
+        self._synced_at = time.monotonic()
+
+
+rating_index = RatingIndex()
+
+NAMES_QUERY = text("SELECT id, name, email FROM users WHERE id IN :ids").bindparams(
+    bindparam("ids", expanding=True)
+)
+
+
+def rebuild() -> None:
+    rating_index.mark_synced()
+    conn = get_conn()
+    rows = conn.execute(text("SELECT id, rating FROM users")).fetchall()
+    conn.close()
+    rating_index.load((row[0], DEFAULT_RATING if row[1] is None else row[1]) for row in rows)
+
+
+def ensure_fresh() -> RatingIndex:
+    # Ratings written by other workers (or elo_replay --write) show up after one sync period.
+    if rating_index.needs_sync():
+        try:
+            rebuild()
+        except Exception:
+            logger.exception("could not rebuild rating index")
+    return rating_index
+
+
+def user_standing(user_id: int, around: int = 5):
+    """Standing plus the players around the user, with display names."""
+    index = ensure_fresh()
+    standing = index.standing(user_id)
+    if standing is None:
+        return None
+    neighbours = index.around(user_id, around)
+    names = {}
+    if neighbours:
+        conn = get_conn()
+        rows = conn.execute(NAMES_QUERY, {"ids": [uid for uid, _, _ in neighbours]}).mappings().fetchall()
+        conn.close()
+        names = {row["id"]: display_name(row["name"], row["email"]) for row in rows}
+    standing["around"] = [
+        {"user_id": uid, "name": names.get(uid, ""), "rating": rating, "rank": rank, "me": uid == user_id}
+        for uid, rating, rank in neighbours
+    ]
+    return standing
@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+import history
+from db import engine, get_conn, init_db
+
+GLOBAL_CACHE_SECONDS = float(os.environ.get("TYPINGLAB_RECORDS_CACHE_SECONDS", "5"))
+
+_lock = threading.Lock()
+_global = {"top_wpm": None, "trophy": None, "loaded_at": None}
+
+
+def trophy_for(top_wpm):
+    if top_wpm is None:
+        return None
+    if 40 <= top_wpm <= 59:
+        return "🥉"
+    if 60 <= top_wpm <= 79:
+        return "🥈"
+    if 80 <= top_wpm <= 99:
+        return "🥇"
+    if top_wpm >= 100:
+        return "🏆"
+    return "—"
+
+
+def apply_session(conn, user_id: int, wpm: float) -> None:
+    apply_sessions(conn, [(user_id, wpm)])
+
+
+def apply_sessions(conn, sessions) -> None:
+    """Fold new (user_id, wpm) sessions into the aggregates; runs inside the caller's transaction."""
+    per_user = {}
+    for user_id, wpm in sessions:
+        best, count = per_user.get(user_id, (None, 0))
+        per_user[user_id] = (wpm if best is None or wpm > best else best, count + 1)
+    if not per_user:
+        return
+    conn.execute(text("""
+        INSERT INTO user_records (user_id, best_wpm, session_count, updated_at)
+        VALUES (:user_id, :wpm, :count, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO UPDATE SET
+            best_wpm = CASE
+                WHEN user_records.best_wpm IS NULL OR excluded.best_wpm > user_records.best_wpm
+                THEN excluded.best_wpm ELSE user_records.best_wpm END,
+            session_count = user_records.session_count + excluded.session_count,
+            updated_at = CURRENT_TIMESTAMP
+    """), [{"user_id": u, "wpm": best, "count": count} for u, (best, count) in per_user.items()])
+    # Only touches (and locks) the global row when the record is actually beaten.
+    top = max(best for best, _ in per_user.values())
+    conn.execute(text("""
+        UPDATE global_records SET top_wpm = :wpm, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1 AND (top_wpm IS NULL OR top_wpm < :wpm)
+    """), {"wpm": top})
+
+
+def after_commit(user_id: int, wpm: float) -> None:
+    with _lock:
+        if _global["loaded_at"] is not None and (_global["top_wpm"] is None or wpm > _global["top_wpm"]):
+            _global["top_wpm"] = wpm
+            _global["trophy"] = trophy_for(wpm)
+
+
+def get_top_wpm_and_trophy():
+    loaded_at = _global["loaded_at"]
+    if loaded_at is not None and time.monotonic() - loaded_at < GLOBAL_CACHE_SECONDS:
+        return _global["top_wpm"], _global["trophy"]
+    conn = get_conn()
+    row = conn.execute(text("SELECT top_wpm FROM global_records WHERE id = 1")).mappings().fetchone()
+    conn.close()
+    top_wpm = float(row["top_wpm"]) if row and row["top_wpm"] is not None else None
+    with _lock:
+        _global["top_wpm"] = top_wpm
+        _global["trophy"] = trophy_for(top_wpm)
+        _global["loaded_at"] = time.monotonic()
+    return top_wpm, _global["trophy"]
+
+
+def invalidate() -> None:
+    with _lock:
+        _global["loaded_at"] = None
+
+
+def rebuild() -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM user_records"))
+        since = history.compacted_before(conn)
+        if since is None:
+            conn.execute(text("""
+                INSERT INTO user_records (user_id, best_wpm, session_count)
+                SELECT user_id, MAX(wpm), COUNT(*) FROM typing_sessions GROUP BY user_id
+            """))
+        else:
+            # Compaction keeps every user's best session, so bests still come from
+            # the raw rows; counts for compacted days come from their rollups.
+            conn.execute(text("""
+                INSERT INTO user_records (user_id, best_wpm, session_count)
+                SELECT user_id, MAX(best_wpm), SUM(session_count) FROM (
+                    SELECT user_id, MAX(wpm) AS best_wpm, SUM(CASE WHEN created_at >= :start THEN 1 ELSE 0 END) AS session_count
+                    FROM typing_sessions GROUP BY user_id
+                    UNION ALL
+                    SELECT user_id, NULL, SUM(session_count) FROM session_daily WHERE day < :day GROUP BY user_id
+                ) AS parts
+                GROUP BY user_id
+            """), {"start": history.day_start_param(since), "day": history.day_param(since)})
+        conn.execute(text("DELETE FROM global_records"))
+        conn.execute(text("""
+            INSERT INTO global_records (id, top_wpm)
+            SELECT 1, MAX(wpm) FROM typing_sessions
+        """))
+    invalidate()
+
+
+def ensure_initialized() -> None:
+    # First start after upgrading: derive the aggregates from existing sessions once.
+    conn = get_conn()
+    row = conn.execute(text("SELECT id FROM global_records WHERE id = 1")).fetchone()
+    conn.close()
+    if row is None:
+        rebuild()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python records.py rebuild")
+        sys.exit(2)
+    init_db()
+    rebuild()
+    top_wpm, trophy = get_top_wpm_and_trophy()
+    print(f"records rebuilt; top WPM {top_wpm} {trophy or ''}".rstrip())
@@ -0,0 +1,354 @@
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+import history
+from db import engine, get_conn, init_db
+from leaderboard import TOP_WPM_LIMIT
+from sessions import EXPIRED_SQL
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_SECONDS = float(os.environ.get("TYPINGLAB_RETENTION_INTERVAL_SECONDS", "3600"))
+# 0 keeps every raw typing session forever; compaction is opt-in
+SESSION_RETENTION_DAYS = int(os.environ.get("TYPINGLAB_SESSION_RETENTION_DAYS", "0"))
+AUTH_PURGE_BATCH = int(os.environ.get("TYPINGLAB_AUTH_PURGE_BATCH", "500"))
+BATCH_PAUSE_SECONDS = 0.05
+# bounds one run, so the first run on an old install is spread over several
+COMPACT_DAYS_PER_RUN = 31
+PARTITION_MONTHS_AHEAD = 3
+# any constant works; it only has to match between workers
+LOCK_KEY = 7_260_113
+
+_is_sqlite = engine.dialect.name == "sqlite"
+
+PURGE_AUTH_QUERY = text(f"""
+    DELETE FROM auth_sessions WHERE session_id IN (
+        SELECT session_id FROM auth_sessions WHERE {EXPIRED_SQL} LIMIT :batch
+    )
+""")
+FIRST_SESSION_QUERY = text("SELECT MIN(created_at) FROM typing_sessions")
+# wpm of the last leaderboard entry; served backwards by the wpm index
+LEADERBOARD_FLOOR_QUERY = text("SELECT wpm FROM typing_sessions ORDER BY wpm DESC LIMIT 1 OFFSET :offset")
+SET_WATERMARK_QUERY = text("""
+    INSERT INTO retention_state (id, sessions_compacted_before) VALUES (1, :day)
+    ON CONFLICT (id) DO UPDATE SET sessions_compacted_before = excluded.sessions_compacted_before
+""")
+# A row may go once it is neither its user's best nor on the leaderboard, so
+# records, personal bests and the top list read the same after compaction.
+DISPOSABLE_SQL = """
+    {t}.wpm < :floor
+    AND {t}.wpm < COALESCE((SELECT r.best_wpm FROM user_records r WHERE r.user_id = {t}.user_id), -1)
+"""
+PARTITION_NAME = re.compile(r"^typing_sessions_p(\d{4})(\d{2})$")
+
+
+def _lock(conn) -> None:
+    if not _is_sqlite:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+
+
+def purge_auth_sessions(batch: int = AUTH_PURGE_BATCH, stop=None) -> int:
+    """Delete auth_sessions rows (sessions and signed-token revocations) past the cookie lifetime.
+
+    Works through the created_at index in short transactions of `batch` rows,
+    so logins and lookups are never blocked for long.
+    """
+    deleted = 0
+    while stop is None or not stop.is_set():
+        with engine.begin() as conn:
+            count = conn.execute(PURGE_AUTH_QUERY, {"batch": batch}).rowcount
+        deleted += count
+        if count < batch:
+            break
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return deleted
+
+
+def _leaderboard_floor(conn) -> float:
+    row = conn.execute(LEADERBOARD_FLOOR_QUERY, {"offset": TOP_WPM_LIMIT - 1}).fetchone()
+    # fewer sessions than leaderboard places: keep them all
+    return float(row[0]) if row else float("inf")
+
+
+def _roll_up(conn, start: date, end: date) -> None:
+    """Recompute session_daily for [start, end) from the raw rows about to be dropped."""
+    conn.execute(
+        text("DELETE FROM session_daily WHERE day >= :start AND day < :end"),
+        {"start": history.day_param(start), "end": history.day_param(end)},
+    )
+    conn.execute(text(f"""
+        INSERT INTO session_daily (user_id, day, session_count, wpm_sum, best_wpm, accuracy_sum)
+        SELECT user_id, {history.SESSION_DAY_SQL}, COUNT(*), SUM(wpm), MAX(wpm), SUM(accuracy)
+        FROM typing_sessions
+        WHERE created_at >= :start AND created_at < :end
+        GROUP BY user_id, {history.SESSION_DAY_SQL}
+    """), {"start": history.day_start_param(start), "end": history.day_start_param(end)})
+
+
+def _compact(start: date, end: date, partition=None) -> int:
+    """Roll [start, end) into daily summaries and drop its disposable raw rows.
+
+    With a monthly partition covering the range, the partition is detached and
+    dropped whole after its few kept rows are moved to the default partition.
+    Returns the number of raw rows removed.
+    """
+    with engine.begin() as conn:
+        _lock(conn)
+        since = history.compacted_before(conn)
+        if since is not None and since >= end:
+            return 0
+        start = max(start, since) if since is not None else start
+        _roll_up(conn, start, end)
+        floor = _leaderboard_floor(conn)
+        if partition is None:
+            removed = conn.execute(text(f"""
+                DELETE FROM typing_sessions
+                WHERE created_at >= :start AND created_at < :end
+                  AND {DISPOSABLE_SQL.format(t="typing_sessions")}
+            """), {
+                "start": history.day_start_param(start),
+                "end": history.day_start_param(end),
+                "floor": floor,
+            }).rowcount
+        else:
+            total = conn.execute(text(f"SELECT COUNT(*) FROM {partition}")).scalar()
+            conn.execute(text(f"ALTER TABLE typing_sessions DETACH PARTITION {partition}"))
+            kept = conn.execute(text(f"""
+                INSERT INTO typing_sessions SELECT * FROM {partition} p
+                WHERE NOT ({DISPOSABLE_SQL.format(t="p")})
+            """), {"floor": floor}).rowcount
+            conn.execute(text(f"DROP TABLE {partition}"))
+            removed = total - kept
+        conn.execute(SET_WATERMARK_QUERY, {"day": history.day_param(end)})
+    return removed
+
+
+def compact_sessions(keep_days: int = SESSION_RETENTION_DAYS, max_days: int = COMPACT_DAYS_PER_RUN):
+    """Compact raw sessions older than `keep_days` UTC days, oldest day first.
+
+    Returns (days, rows removed). Progress is kept in retention_state, so an
+    interrupted run resumes where it stopped and every worker can run it.
+    """
+    if keep_days <= 0:
+        return 0, 0
+    cutoff = datetime.now(timezone.utc).date() - timedelta(days=keep_days)
+    conn = get_conn()
+    since = history.compacted_before(conn)
+    if since is None:
+        first = conn.execute(FIRST_SESSION_QUERY).scalar()
+        if isinstance(first, datetime):
+            since = first.astimezone(timezone.utc).date()
+        elif first is not None:
+            since = date.fromisoformat(str(first)[:10])
+    conn.close()
+    if since is None:
+        return 0, 0
+    partitions = month_partitions() if is_partitioned() else {}
+    day, days, removed = since, 0, 0
+    while day < cutoff and days < max_days:
+        month_end = _next_month(day)
+        partition = partitions.get((day.year, day.month))
+        if partition is not None and day.day == 1 and month_end <= cutoff:
+            removed += _compact(day, month_end, partition)
+            days += (month_end - day).days
+            day = month_end
+            continue
+        removed += _compact(day, day + timedelta(days=1))
+        days += 1
+        day += timedelta(days=1)
+    return days, removed
+
+
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def is_partitioned() -> bool:
+    if _is_sqlite:
+        return False
+    conn = get_conn()
+    row = conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'typing_sessions'::regclass"
+    )).fetchone()
+    conn.close()
+    return row is not None
+
+
+def month_partitions() -> dict:
+    """{(year, month): partition name} for the monthly partitions of typing_sessions."""
+    conn = get_conn()
+    rows = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'typing_sessions'::regclass
+    """)).fetchall()
+    conn.close()
+    found = {}
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            found[(int(match.group(1)), int(match.group(2)))] = name
+    return found
+
+
+def _create_month(conn, month: date) -> None:
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS typing_sessions_p{month.year:04d}{month.month:02d}
+        PARTITION OF typing_sessions
+        FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_next_month(month).isoformat()} 00:00:00+00')
+    """))
+
+
+def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> None:
+    """Create the monthly partitions for this month and the next `months_ahead`."""
+    month = datetime.now(timezone.utc).date().replace(day=1)
+    with engine.begin() as conn:
+        _lock(conn)
+        for _ in range(months_ahead + 1):
+            _create_month(conn, month)
+            month = _next_month(month)
+
+
+def partition_sessions() -> bool:
+    """Rebuild typing_sessions on Postgres as a table range-partitioned by created_at month.
+
+    A one-off, locking rewrite of the whole table: run it in a maintenance
+    window. Returns False if there was nothing to do.
+    """
+    if _is_sqlite:
+        raise RuntimeError("partitioning needs Postgres")
+    if is_partitioned():
+        return False
+    with engine.begin() as conn:
+        _lock(conn)
+        conn.execute(text("LOCK TABLE typing_sessions IN ACCESS EXCLUSIVE MODE"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('typing_sessions', 'id')")).scalar()
+        first = conn.execute(FIRST_SESSION_QUERY).scalar()
+        # index names are per schema; the new table gets the same ones
+        for index in ("idx_typing_sessions_user_created", "idx_typing_sessions_wpm", "idx_typing_sessions_created"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        conn.execute(text("ALTER TABLE typing_sessions RENAME TO typing_sessions_unpartitioned"))
+        conn.execute(text(f"""
+            CREATE TABLE typing_sessions (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                user_id INTEGER NOT NULL,
+                wpm DOUBLE PRECISION NOT NULL,
+                accuracy DOUBLE PRECISION NOT NULL,
+                duration_seconds INTEGER NOT NULL,
+                prompt_id INTEGER NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at),
+                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) PARTITION BY RANGE (created_at)
+        """))
+        # keep the id sequence alive when the old table is dropped
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY typing_sessions.id"))
+        conn.execute(text("CREATE TABLE typing_sessions_default PARTITION OF typing_sessions DEFAULT"))
+        month = (first.astimezone(timezone.utc).date() if first is not None else datetime.now(timezone.utc).date()).replace(day=1)
+        last = _next_month(datetime.now(timezone.utc).date().replace(day=1))
+        for _ in range(PARTITION_MONTHS_AHEAD):
+            last = _next_month(last)
+        while month < last:
+            _create_month(conn, month)
+            month = _next_month(month)
+        conn.execute(text("INSERT INTO typing_sessions SELECT * FROM typing_sessions_unpartitioned"))
+        conn.execute(text("DROP TABLE typing_sessions_unpartitioned"))
+        conn.execute(text("CREATE INDEX idx_typing_sessions_user_created ON typing_sessions (user_id, created_at, id)"))
+        conn.execute(text("CREATE INDEX idx_typing_sessions_wpm ON typing_sessions (wpm)"))
+        conn.execute(text("CREATE INDEX idx_typing_sessions_created ON typing_sessions (created_at)"))
+    return True
+
+
+class RetentionJob:
+    """Background thread that runs the retention policies every INTERVAL_SECONDS.
+
+    Every worker runs it. Each step is idempotent and the compaction
+    watermark is re-read under a lock, so overlapping runs only repeat
+    cheap checks.
+    """
+
+    def __init__(self, interval=INTERVAL_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.runs = 0
+        self.errors = 0
+        self.auth_sessions_deleted = 0
+        self.days_compacted = 0
+        self.sessions_removed = 0
+        self.last_run_seconds = None
+
+    def start(self) -> None:
+        if self.interval <= 0:
+            return
+        # threads do not survive fork, so start per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self) -> None:
+        started = time.monotonic()
+        self.auth_sessions_deleted += purge_auth_sessions(stop=self._stop)
+        if is_partitioned():
+            ensure_partitions()
+        days, removed = compact_sessions()
+        self.days_compacted += days
+        self.sessions_removed += removed
+        self.runs += 1
+        self.last_run_seconds = round(time.monotonic() - started, 3)
+
+    def _run(self) -> None:
+        # spread workers that started together
+        self._stop.wait(random.uniform(0, min(self.interval, 60.0)))
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("retention run failed")
+            self._stop.wait(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "auth_sessions_deleted": self.auth_sessions_deleted,
+            "days_compacted": self.days_compacted,
+            "sessions_removed": self.sessions_removed,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+
+retention_job = RetentionJob()
+
+
+if __name__ == "__main__":
+    command = sys.argv[1:]
+    if command[:1] == ["run"] and len(command) <= 2 and all(arg.isdigit() for arg in command[1:]):
+        init_db()
+        print(f"expired auth sessions deleted: {purge_auth_sessions()}")
+        if is_partitioned():
+            ensure_partitions()
+        keep_days = int(command[1]) if len(command) == 2 else SESSION_RETENTION_DAYS
+        days, removed = compact_sessions(keep_days, max_days=10**6)
+        print(f"days compacted: {days}, raw sessions removed: {removed}")
+    elif command == ["partition"]:
+        init_db()
+        print("typing_sessions partitioned by month" if partition_sessions() else "typing_sessions is already partitioned")
+    else:
+        print("usage: python retention.py run [KEEP_DAYS] | partition")
+        sys.exit(2)
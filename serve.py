@@ -0,0 +1,102 @@
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+
+RESTART_DELAY_SECONDS = 1.0
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(config, sock) -> None:
+    import uvicorn
+
+    import db
+
+    # Connections opened before the fork belong to the parent; never reuse them here.
+    db.engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve TypingLab with pre-forked uvicorn workers.")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("TYPINGLAB_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    workers = max(1, args.workers)
+
+    # Must be set before db is imported: it sizes each worker's share of the pool.
+    os.environ["TYPINGLAB_WORKERS"] = str(workers)
+
+    import uvicorn
+
+    import db
+
+    # Importing the app runs schema setup, the record backfills, the rating
+    # index load and maps the word corpora -- once, here, instead of per worker.
+    app = importlib.import_module("main").app
+    db.engine.dispose()
+
+    config = uvicorn.Config(app, log_level=args.log_level, lifespan="on")
+    sock = _listen(args.host, args.port)
+    print(f"TypingLab listening on http://{args.host}:{args.port} with {workers} worker(s)", flush=True)
+
+    children = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(config, sock)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            code = os.waitstatus_to_exitcode(status)
+            print(f"worker {pid} exited with code {code}; restarting", file=sys.stderr, flush=True)
+            time.sleep(RESTART_DELAY_SECONDS)
+            if not stopping:
+                spawn()
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from db import engine, get_conn
+
+logger = logging.getLogger(__name__)
+
+SESSION_MODE = os.environ.get("TYPINGLAB_SESSION_MODE", "db").strip().lower()
+if SESSION_MODE not in ("db", "signed"):
+    SESSION_MODE = "db"
+
+SESSION_MAX_AGE = 60 * 60 * 24 * 7
+REVOCATION_SYNC_SECONDS = int(os.environ.get("TYPINGLAB_REVOCATION_SYNC_SECONDS", "30"))
+
+# rows older than the cookie lifetime are dead; retention.py deletes them
+if engine.dialect.name == "sqlite":
+    EXPIRED_SQL = f"created_at < datetime('now', '-{SESSION_MAX_AGE} seconds')"
+else:
+    EXPIRED_SQL = f"created_at < CURRENT_TIMESTAMP - INTERVAL '{SESSION_MAX_AGE} seconds'"
+
+TOKEN_VERSION = "v1"
+REVOKED_PREFIX = "revoked:"
+
+_secret = os.environ.get("TYPINGLAB_SESSION_SECRET", "").encode("utf-8")
+if SESSION_MODE == "signed" and not _secret:
+    logger.warning(
+        "TYPINGLAB_SESSION_SECRET is not set; using a random per-process key. "
+        "Sessions will not survive restarts or work across workers."
+    )
+    _secret = secrets.token_bytes(32)
+
+
+def _sign(payload: str) -> str:
+    mac = hmac.new(_secret, payload.encode("ascii"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode("ascii")
+
+
+def issue_token(user_id: int, max_age: int = SESSION_MAX_AGE) -> str:
+    exp = int(time.time()) + max_age
+    jti = secrets.token_urlsafe(12)
+    payload = f"{TOKEN_VERSION}.{int(user_id)}.{exp}.{jti}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def parse_token(token: str):
+    """Return (user_id, exp, jti) for a well-signed, unexpired token, else None."""
+    parts = token.split(".")
+    if len(parts) != 5 or parts[0] != TOKEN_VERSION:
+        return None
+    payload = ".".join(parts[:4])
+    if not hmac.compare_digest(parts[4], _sign(payload)):
+        return None
+    try:
+        user_id = int(parts[1])
+        exp = int(parts[2])
+    except ValueError:
+        return None
+    if exp <= time.time():
+        return None
+    return user_id, exp, parts[3]
+
+
+def is_token(value: str) -> bool:
+    return value.startswith(TOKEN_VERSION + ".") and value.count(".") == 4
+
+
+class RevocationList:
+    """Revoked token ids bucketed by expiry hour, so expired entries drop out wholesale."""
+
+    bucket_seconds = 3600
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, exp: int) -> None:
+        with self._lock:
+            self._buckets.setdefault(exp // self.bucket_seconds, set()).add(jti)
+
+    def contains(self, jti: str, exp: int) -> bool:
+        bucket = self._buckets.get(exp // self.bucket_seconds)
+        return bucket is not None and jti in bucket
+
+    def prune(self, now=None) -> None:
+        current = int(now if now is not None else time.time()) // self.bucket_seconds
+        with self._lock:
+            for key in [k for k in self._buckets if k < current]:
+                del self._buckets[key]
+
+    def __len__(self):
+        return sum(len(b) for b in self._buckets.values())
+
+    def merge(self, entries) -> None:
+        """Add revocations read from the database.
+
+        Never replaces the list: a token revoked here a moment ago may not be
+        committed yet, and a revocation is never undone before it expires.
+        """
+        with self._lock:
+            for jti, exp in entries:
+                self._buckets.setdefault(exp // self.bucket_seconds, set()).add(jti)
+
+
+revocations = RevocationList()
+
+
+def _revocation_key(jti: str, exp: int) -> str:
+    return f"{REVOKED_PREFIX}{exp}:{jti}"
+
+
+def sync_revocations() -> None:
+    # Other workers may have revoked tokens; pick up the persisted list.
+    conn = get_conn()
+    rows = conn.execute(
+        text("SELECT session_id FROM auth_sessions WHERE session_id LIKE :prefix"),
+        {"prefix": REVOKED_PREFIX + "%"},
+    ).mappings().fetchall()
+    conn.close()
+    now = time.time()
+    entries = []
+    for row in rows:
+        try:
+            exp_s, jti = row["session_id"][len(REVOKED_PREFIX):].split(":", 1)
+            exp = int(exp_s)
+        except ValueError:
+            continue
+        if exp > now:
+            entries.append((jti, exp))
+    revocations.merge(entries)
+    revocations.prune(now)
+
+
+class RevocationSync:
+    """Background thread that runs sync_revocations every REVOCATION_SYNC_SECONDS.
+
+    Only needed for signed sessions; db sessions are looked up per request.
+    """
+
+    def __init__(self, interval=REVOCATION_SYNC_SECONDS):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.runs = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        if SESSION_MODE != "signed" or self.interval <= 0:
+            return
+        # threads do not survive fork, so start per process
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                sync_revocations()
+                self.runs += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("could not sync session revocations")
+            self._stop.wait(self.interval)
+
+
+revocation_sync = RevocationSync()
+
+
+def _lookup_db_session(sid: str):
+    if sid.startswith(REVOKED_PREFIX):
+        return None
+    conn = get_conn()
+    row = conn.execute(
+        text(f"SELECT user_id FROM auth_sessions WHERE session_id = :sid AND NOT ({EXPIRED_SQL})"),
+        {"sid": sid},
+    ).mappings().fetchone()
+    conn.close()
+    return row["user_id"] if row else None
+
+
+def resolve_session(sid: str):
+    if not sid:
+        return None
+    if SESSION_MODE == "signed" and is_token(sid):
+        parsed = parse_token(sid)
+        if parsed is None:
+            return None
+        user_id, exp, jti = parsed
+        # kept current by revocation_sync, off the request path
+        if revocations.contains(jti, exp):
+            return None
+        return user_id
+    # db mode, or a cookie issued before switching to signed mode
+    return _lookup_db_session(sid)
+
+
+def create_session(user_id: int) -> str:
+    if SESSION_MODE == "signed":
+        return issue_token(user_id)
+    sid = secrets.token_urlsafe(32)
+    conn = get_conn()
+    conn.execute(
+        text("INSERT INTO auth_sessions (session_id, user_id) VALUES (:session_id, :user_id)"),
+        {"session_id": sid, "user_id": user_id},
+    )
+    conn.commit()
+    conn.close()
+    return sid
+
+
+def revoke_session(sid: str) -> None:
+    if not sid:
+        return
+    if is_token(sid):
+        parsed = parse_token(sid)
+        if parsed is None:
+            return
+        user_id, exp, jti = parsed
+        if revocations.contains(jti, exp):
+            return
+        revocations.add(jti, exp)
+        revocations.prune()
+        conn = get_conn()
+        try:
+            conn.execute(
+                text("INSERT INTO auth_sessions (session_id, user_id) VALUES (:session_id, :user_id)"),
+                {"session_id": _revocation_key(jti, exp), "user_id": user_id},
+            )
+            conn.commit()
+        except IntegrityError:
+            # already revoked by another worker
+            conn.rollback()
+        conn.close()
+        return
+    conn = get_conn()
+    conn.execute(
+        text("DELETE FROM auth_sessions WHERE session_id = :session_id"),
+        {"session_id": sid},
+    )
+    conn.commit()
+    conn.close()
@@ -87,6 +87,57 @@
   let desiredScrollTop = 0;
   let isAutoScroll = false;
   let scrollAnim = null;
+  let promptUsed = false;
+  let extending = false;
+  // Per-key and per-bigram [attempts, errors, ms] for the current test; the
+  // server keeps running totals and weights adaptive prompts with them.
+  const KEYSTAT_KEY = /^[a-z]$/;
+  const KEYSTAT_MAX_GAP_MS = 2000;
+  let keyStats = { chars: {}, bigrams: {} };
+  let keyStatsCount = 0;
+  let lastKeyTs = 0;
+
+  function bumpKeyStat(table, key, miss, ms) {
+    const entry = table[key] || (table[key] = [0, 0, 0]);
+    entry[0] += 1;
+    if (miss) entry[1] += 1;
+    entry[2] += ms;
+  }
+
+  function recordKeystroke(prevLength) {
+    const now = Date.now();
+    const gap = lastKeyTs ? now - lastKeyTs : 0;
+    lastKeyTs = now;
+    // only single characters appended at the end; pastes and deletions are skipped
+    if (typedValue.length !== prevLength + 1) return;
+    const i = prevLength;
+    const expected = (promptPlain[i] || "").toLowerCase();
+    if (!KEYSTAT_KEY.test(expected)) return;
+    const ms = Math.min(gap, KEYSTAT_MAX_GAP_MS);
+    const miss = typedValue[i] !== promptPlain[i];
+    bumpKeyStat(keyStats.chars, expected, miss, ms);
+    const prev = (promptPlain[i - 1] || "").toLowerCase();
+    if (KEYSTAT_KEY.test(prev)) bumpKeyStat(keyStats.bigrams, prev + expected, miss, ms);
+    keyStatsCount += 1;
+  }
+
+  function takeKeyStats() {
+    const stats = keyStatsCount ? keyStats : null;
+    keyStats = { chars: {}, bigrams: {} };
+    keyStatsCount = 0;
+    lastKeyTs = 0;
+    return stats;
+  }
+
+  function submitKeyStats(stats) {
+    if (!stats || !cfg.userId) return;
+    fetch("/api/keystats", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(stats),
+      keepalive: true,
+    }).catch(() => {});
+  }
 
   function reset() {
     started = false;
@@ -126,6 +177,7 @@
 
     wpmSeries = [];
     accSeries = [];
+    takeKeyStats();
 
     if (homeTimerEl) homeTimerEl.classList.add("hidden");
     if (testTimerEl) testTimerEl.classList.add("hidden");
@@ -136,7 +188,8 @@
     }
     if (testTypeboxEl) testTypeboxEl.classList.remove("hidden");
 
-    if (!cfg.ranked && !cfg.training) {
+    // keep the prompt embedded in the page until it has actually been typed on
+    if (!cfg.ranked && !cfg.training && promptUsed) {
       refreshPrompt();
     }
 
@@ -178,8 +231,12 @@
     return { netWpm, accuracy };
   }
 
-  async function submitResult(wpm, accuracy) {
-    if (!cfg.ranked || !cfg.userId) return;
+  async function submitResult(wpm, accuracy, stats) {
+    if (!cfg.userId) return;
+    if (!cfg.ranked) {
+      submitKeyStats(stats);
+      return;
+    }
     try {
       const res = await fetch("/api/session_json", {
         method: "POST",
@@ -189,6 +246,7 @@
           accuracy: accuracy,
           duration_seconds: cfg.durationSeconds,
           prompt_id: cfg.promptId,
+          keystats: stats,
         }),
       });
 
@@ -199,6 +257,9 @@
       if (j && typeof j.rating === "number") {
         animateElo(j.rating, j.delta || 0);
       }
+      if (j && typeof j.percentile === "number" && statusEl) {
+        statusEl.textContent += ` Faster than ${j.percentile}% of ${cfg.durationSeconds}s tests.`;
+      }
     } catch (e) {
       if (statusEl) statusEl.textContent = "Could not save result (network/server error).";
     }
@@ -249,7 +310,7 @@
       renderChart();
     }
 
-    submitResult(netWpm, accuracy);
+    submitResult(netWpm, accuracy, takeKeyStats());
     if (cfg.training) {
       const elapsedSeconds = startTs ? Math.max(0, Math.round((Date.now() - startTs) / 1000)) : 0;
       const event = new CustomEvent("typinglab:ended", {
@@ -320,11 +381,21 @@
 
   async function refreshPrompt() {
     if (cfg.ranked || cfg.training) return;
+    promptUsed = false;
     try {
-      const res = await fetch("/api/prompt");
+      const seed = cfg.promptSeed;
+      const url = seed
+        ? `/api/prompt/seed?${new URLSearchParams({ source: seed.source, number_rate: String(seed.numberRate), words: String(seed.total || 0), ...(seed.adaptive ? { adaptive: "1" } : {}) })}`
+        : "/api/prompt";
+      const res = await fetch(url);
       const j = await res.json();
-      if (j && j.prompt) {
-        cfg.promptText = j.prompt;
+      const text = j && (seed ? j.text : j.prompt);
+      if (text) {
+        if (seed) {
+          const { text: _, ...next } = j;
+          cfg.promptSeed = next;
+        }
+        cfg.promptText = text;
         if (ghostEl) ghostEl.dataset.prompt = cfg.promptText;
         computeDisplayText();
         typedValue = "";
@@ -337,25 +408,61 @@
     }
   }
 
+  function promptExhausted() {
+    const seed = cfg.promptSeed;
+    return !seed || (seed.total && seed.offset >= seed.total);
+  }
+
+  // Seeded prompts arrive in chunks: the server regenerates words from
+  // (seed, source, number rate, offset), so only the next chunk is fetched.
+  async function fetchNextChunk() {
+    const seed = cfg.promptSeed;
+    const count = seed.total ? Math.min(seed.chunkWords, seed.total - seed.offset) : seed.chunkWords;
+    const params = new URLSearchParams({
+      seed: seed.seed,
+      source: seed.source,
+      number_rate: String(seed.numberRate),
+      offset: String(seed.offset),
+      count: String(count),
+    });
+    if (seed.corpus) params.set("corpus", seed.corpus);
+    if (seed.adaptive) params.set("adaptive", "1");
+    const res = await fetch(`/api/prompt/chunk?${params}`);
+    const j = await res.json();
+    if (!j || !j.text || cfg.promptSeed !== seed) return "";
+    seed.offset = j.next;
+    return String(j.text).trim();
+  }
+
   async function extendPrompt(minChars = 120) {
-    if (cfg.ranked) return false;
+    const seeded = !!cfg.promptSeed;
+    if (seeded ? promptExhausted() : cfg.ranked) return false;
     const remaining = promptPlain.length - typedValue.length;
-    if (remaining > minChars) return false;
+    if (remaining > minChars || extending) return false;
+    extending = true;
     try {
-      const res = await fetch("/api/prompt");
-      const j = await res.json();
-      if (!j || !j.prompt) return false;
-      const extra = String(j.prompt).trim();
+      let extra = "";
+      if (seeded) {
+        extra = await fetchNextChunk();
+      } else {
+        const res = await fetch("/api/prompt");
+        const j = await res.json();
+        extra = j && j.prompt ? String(j.prompt).trim() : "";
+      }
       if (!extra) return false;
+      const typed = typedValue;
       cfg.promptText = `${promptPlain} ${extra}`.trim();
       if (ghostEl) ghostEl.dataset.prompt = cfg.promptText;
       computeDisplayText();
+      typedValue = typed;
       inputEl.value = promptPlain;
       setCaretToTyped();
       renderGhost();
       return true;
     } catch (e) {
       return false;
+    } finally {
+      extending = false;
     }
   }
 
@@ -539,7 +646,8 @@
     updateLineScroll();
     window.__typedLen = typedValue.length;
 
-    if (!cfg.ranked && !cfg.training) {
+    promptUsed = true;
+    if (cfg.promptSeed || (!cfg.ranked && !cfg.training)) {
       extendPrompt();
     }
 
@@ -553,10 +661,10 @@
         endTest("completed");
       }
     } else if (typedValue === promptPlain) {
-      if (!cfg.ranked) {
-        extendPrompt();
-      } else {
+      if (cfg.ranked && promptExhausted()) {
         endTest("completed");
+      } else {
+        extendPrompt();
       }
     }
   }
@@ -634,7 +742,9 @@
       if (data) next = next + data;
     }
 
+    const prevLength = typedValue.length;
     typedValue = next;
+    recordKeystroke(prevLength);
     e.preventDefault();
     onTypedChanged();
   });
@@ -674,7 +784,9 @@
       return;
     }
 
+    const prevLength = typedValue.length;
     typedValue = next;
+    recordKeystroke(prevLength);
     ignoreBeforeInput = true;
     e.preventDefault();
     onTypedChanged();
@@ -747,8 +859,9 @@
     syncDurationPills();
   }
 
-  window.__setPrompt = (promptText, durationSeconds, levelId, requiredWords) => {
+  window.__setPrompt = (promptText, durationSeconds, levelId, requiredWords, promptSeed) => {
     if (typeof promptText === "string") {
+      cfg.promptSeed = promptSeed || null;
       cfg.promptText = promptText;
       if (ghostEl) ghostEl.dataset.prompt = cfg.promptText;
       computeDisplayText();
@@ -1077,12 +1190,11 @@
     if (!cfg.userId) return;
     let total = 0;
     try {
-      const res = await fetch("/api/training_progress");
-      const j = await res.json();
-      if (j && j.ok && j.progress) {
-        const easy = j.progress.easy || { 1: 0, 2: 0, 3: 0 };
-        const adv = j.progress.advanced || { 1: 0, 2: 0, 3: 0 };
-        const hard = j.progress.hard || { 1: 0, 2: 0, 3: 0 };
+      const progress = window.TypingLabProgress ? await window.TypingLabProgress.load() : null;
+      if (progress) {
+        const easy = progress.easy || { 1: 0, 2: 0, 3: 0 };
+        const adv = progress.advanced || { 1: 0, 2: 0, 3: 0 };
+        const hard = progress.hard || { 1: 0, 2: 0, 3: 0 };
         const vals = [
           easy[1] || 0,
           easy[2] || 0,
@@ -0,0 +1,41 @@
+(function () {
+  const topEl = document.getElementById("leaderboardTop");
+  const eloEl = document.getElementById("leaderboardElo");
+  const recordWpmEl = document.getElementById("globalRecordWpm");
+  const recordTrophyEl = document.getElementById("globalRecordTrophy");
+  const hasLists = !!(topEl && eloEl);
+  const hasRecord = !!(recordWpmEl && recordTrophyEl);
+  if ((!hasLists && !hasRecord) || !window.EventSource) return;
+
+  // The server sends the full lists and the global record on connect and
+  // again whenever they change, merged to at most one update per second.
+  const source = new EventSource("/api/leaderboard/stream");
+
+  function parse(event) {
+    try {
+      return JSON.parse(event.data);
+    } catch (e) {
+      return null;
+    }
+  }
+
+  if (hasLists) {
+    source.addEventListener("leaderboard", (event) => {
+      const data = parse(event);
+      if (!data) return;
+      topEl.innerHTML = data.html.top;
+      eloEl.innerHTML = data.html.elo;
+    });
+  }
+
+  if (hasRecord) {
+    source.addEventListener("record", (event) => {
+      const data = parse(event);
+      if (!data) return;
+      recordWpmEl.textContent = data.top_wpm == null ? "—" : Number(data.top_wpm).toFixed(1);
+      recordTrophyEl.textContent = data.trophy || "";
+    });
+  }
+
+  window.addEventListener("pagehide", () => source.close());
+})();
@@ -0,0 +1,186 @@
+(function () {
+  const lobbyEl = document.getElementById("raceLobby");
+  const statusEl = document.getElementById("raceStatus");
+  const playersEl = document.getElementById("racePlayers");
+  const joinBtn = document.getElementById("raceJoin");
+  const boxEl = document.getElementById("raceBox");
+  const trackEl = document.getElementById("raceTrack");
+  const ghostEl = document.getElementById("raceGhost");
+  const inputEl = document.getElementById("raceInput");
+  const resultEl = document.getElementById("raceResult");
+  if (!lobbyEl || !joinBtn) return;
+
+  // The server merges progress into ticks anyway; this just keeps the
+  // upstream to a few messages per second instead of one per keystroke.
+  const SEND_INTERVAL_MS = 150;
+  const myId = Number(lobbyEl.dataset.userId || "0");
+
+  let ws = null;
+  let promptText = "";
+  let players = {};
+  let startTimer = null;
+  let sendTimer = null;
+  let lastSent = 0;
+  let correctChars = 0;
+  let keystrokes = 0;
+  let mistakes = 0;
+
+  function escapeHtml(s) {
+    return String(s).replace(/[&<>"']/g, (c) => ({ "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;" }[c]));
+  }
+
+  function renderPlayers(list) {
+    playersEl.innerHTML = list
+      .map((p) => `<li>${escapeHtml(p.name)} <span class="muted">${p.rating}</span></li>`)
+      .join("");
+  }
+
+  function renderTrack(racers) {
+    trackEl.innerHTML = racers
+      .map((r) => {
+        const p = players[r.id] || { name: "Player" };
+        const pct = Math.round((r.progress || 0) * 100);
+        const wpm = typeof r.wpm === "number" ? r.wpm.toFixed(0) : "0";
+        return `<div class="race-lane${r.id === myId ? " me" : ""}">
+          <span class="race-name">${escapeHtml(p.name)}</span>
+          <span class="race-bar"><span style="width:${pct}%"></span></span>
+          <span class="race-wpm">${r.done ? "✓ " : ""}${wpm}</span>
+        </div>`;
+      })
+      .join("");
+  }
+
+  function renderGhost() {
+    const typed = inputEl.value;
+    let html = "";
+    for (let i = 0; i < promptText.length; i++) {
+      const ch = escapeHtml(promptText[i]);
+      if (i >= typed.length) html += `<span class="pending">${ch}</span>`;
+      else html += `<span class="${typed[i] === promptText[i] ? "correct" : "incorrect"}">${ch}</span>`;
+    }
+    ghostEl.innerHTML = html;
+  }
+
+  function sendProgress() {
+    sendTimer = null;
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+    lastSent = Date.now();
+    const accuracy = keystrokes ? (keystrokes - mistakes) / keystrokes : 1;
+    ws.send(JSON.stringify({ type: "progress", chars: correctChars, accuracy }));
+  }
+
+  function scheduleSend() {
+    if (correctChars >= promptText.length) {
+      if (sendTimer) clearTimeout(sendTimer);
+      sendProgress();
+      return;
+    }
+    if (sendTimer) return;
+    sendTimer = setTimeout(sendProgress, Math.max(0, SEND_INTERVAL_MS - (Date.now() - lastSent)));
+  }
+
+  inputEl.addEventListener("input", (e) => {
+    const typed = inputEl.value;
+    if (e.inputType && e.inputType.startsWith("insert")) {
+      keystrokes += 1;
+      const i = typed.length - 1;
+      if (typed[i] !== promptText[i]) mistakes += 1;
+    }
+    let n = 0;
+    while (n < typed.length && typed[n] === promptText[n]) n += 1;
+    correctChars = n;
+    renderGhost();
+    scheduleSend();
+    if (correctChars >= promptText.length) inputEl.disabled = true;
+  });
+
+  function startRace(msg) {
+    promptText = msg.text;
+    players = {};
+    msg.players.forEach((p) => { players[p.id] = p; });
+    correctChars = 0;
+    keystrokes = 0;
+    mistakes = 0;
+    inputEl.value = "";
+    inputEl.disabled = true;
+    resultEl.classList.add("hidden");
+    boxEl.classList.remove("hidden");
+    renderGhost();
+    renderTrack(msg.players.map((p) => ({ id: p.id, progress: 0, wpm: 0 })));
+    let left = Math.ceil(msg.countdown);
+    statusEl.textContent = `Starting in ${left}…`;
+    startTimer = setInterval(() => {
+      left -= 1;
+      if (left > 0) {
+        statusEl.textContent = `Starting in ${left}…`;
+        return;
+      }
+      clearInterval(startTimer);
+      startTimer = null;
+      statusEl.textContent = "Go!";
+      inputEl.disabled = false;
+      inputEl.focus();
+    }, 1000);
+  }
+
+  function showResult(msg) {
+    resultEl.classList.remove("hidden");
+    const place = msg.place ? `Place ${msg.place}` : "Out of time";
+    const wpm = typeof msg.wpm === "number" ? msg.wpm.toFixed(1) : "0.0";
+    let rating = "";
+    if (msg.rated) {
+      const sign = msg.delta >= 0 ? "+" : "";
+      rating = ` · ELO ${msg.rating} (${sign}${msg.delta})`;
+    }
+    resultEl.innerHTML = `<div class="training-result-title">${place} · ${wpm} WPM${rating}</div>`;
+  }
+
+  function endRace(msg) {
+    inputEl.disabled = true;
+    const lines = msg.standings.map((s, i) => {
+      const wpm = typeof s.wpm === "number" ? `${s.wpm.toFixed(1)} WPM` : "—";
+      return `${i + 1}. ${s.name} ${s.done ? wpm : `(${wpm}, unfinished)`}`;
+    });
+    statusEl.textContent = "Race over. " + lines.join("  ");
+    joinBtn.disabled = false;
+    joinBtn.textContent = "Race again";
+  }
+
+  function onMessage(event) {
+    let msg;
+    try {
+      msg = JSON.parse(event.data);
+    } catch (e) {
+      return;
+    }
+    if (msg.type === "lobby") {
+      statusEl.textContent = `Waiting for players (${msg.players.length}/${msg.size})…`;
+      renderPlayers(msg.players);
+    } else if (msg.type === "start") {
+      renderPlayers(msg.players);
+      startRace(msg);
+    } else if (msg.type === "tick") {
+      renderTrack(msg.racers);
+    } else if (msg.type === "result") {
+      showResult(msg);
+    } else if (msg.type === "end") {
+      endRace(msg);
+    }
+  }
+
+  joinBtn.addEventListener("click", () => {
+    if (ws && ws.readyState <= WebSocket.OPEN) return;
+    joinBtn.disabled = true;
+    statusEl.textContent = "Looking for a race…";
+    const scheme = location.protocol === "https:" ? "wss" : "ws";
+    ws = new WebSocket(`${scheme}://${location.host}/ws/race`);
+    ws.addEventListener("message", onMessage);
+    ws.addEventListener("close", (e) => {
+      ws = null;
+      if (startTimer) clearInterval(startTimer);
+      joinBtn.disabled = false;
+      if (e.code === 4409) statusEl.textContent = "You are already racing in another tab.";
+      else if (e.code !== 1000) statusEl.textContent = "Disconnected from the race.";
+    });
+  });
+})();
@@ -24,10 +24,9 @@
 
   async function fetchProgress() {
     try {
-      const res = await fetch("/api/training_progress");
-      const j = await res.json();
-      if (j && j.ok && j.progress) {
-        progress = j.progress;
+      const loaded = await window.TypingLabProgress.load();
+      if (loaded) {
+        progress = loaded;
         state[1] = progress.easy[1] || 0;
         state[2] = progress.easy[2] || 0;
         state[3] = progress.easy[3] || 0;
@@ -37,16 +36,8 @@
     }
   }
 
-  async function saveState(levelId, percent) {
-    try {
-      await fetch("/api/training_progress", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ mode: "easy", level: levelId, percent }),
-      });
-    } catch (e) {
-      // ignore
-    }
+  function saveState(levelId, percent) {
+    window.TypingLabProgress.queue("easy", levelId, percent);
   }
 
   function updateButtons() {
@@ -100,11 +91,12 @@
       }
 
     try {
-      const res = await fetch(`/api/prompt?words=300`);
+      const res = await fetch(`/api/prompt/seed?source=1000&adaptive=1`);
       const j = await res.json();
-      if (!j || !j.prompt) return;
+      if (!j || !j.text) return;
       if (window.__setPrompt) {
-        window.__setPrompt(j.prompt, level.duration, levelId, level.words);
+        const { text, ...seed } = j;
+        window.__setPrompt(text, level.duration, levelId, level.words, seed);
       }
     } catch (e) {
       // ignore
@@ -130,10 +122,9 @@
     const percent = required > 0 ? Math.min(100, Math.round((correct / required) * 100)) : 0;
     state[levelId] = Math.max(state[levelId] || 0, percent);
     progress.easy[levelId] = state[levelId];
-    saveState(levelId, percent).finally(() => {
-      updateButtons();
-      updateTrainingPageSummary();
-    });
+    saveState(levelId, percent);
+    updateButtons();
+    updateTrainingPageSummary();
     if (trainingResult) {
       trainingResult.classList.remove("hidden");
       const wpm = typeof detail.wpm === "number" ? detail.wpm.toFixed(1) : "0.0";
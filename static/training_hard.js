@@ -15,28 +15,19 @@
 
   async function fetchProgress() {
     try {
-      const res = await fetch("/api/training_progress");
-      const j = await res.json();
-      if (j && j.ok && j.progress && j.progress.hard) {
-        state[1] = j.progress.hard[1] || 0;
-        state[2] = j.progress.hard[2] || 0;
-        state[3] = j.progress.hard[3] || 0;
+      const progress = await window.TypingLabProgress.load();
+      if (progress && progress.hard) {
+        state[1] = progress.hard[1] || 0;
+        state[2] = progress.hard[2] || 0;
+        state[3] = progress.hard[3] || 0;
       }
     } catch (e) {
       // ignore
     }
   }
 
-  async function saveState(levelId, percent) {
-    try {
-      await fetch("/api/training_progress", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ mode: "hard", level: levelId, percent }),
-      });
-    } catch (e) {
-      // ignore
-    }
+  function saveState(levelId, percent) {
+    window.TypingLabProgress.queue("hard", levelId, percent);
   }
 
   function updateButtons() {
@@ -67,11 +58,12 @@
       }
 
     try {
-      const res = await fetch(`/api/prompt?words=300&source=5000&number_rate=0.15`);
+      const res = await fetch(`/api/prompt/seed?source=5000&number_rate=0.15&adaptive=1`);
       const j = await res.json();
-      if (!j || !j.prompt) return;
+      if (!j || !j.text) return;
       if (window.__setPrompt) {
-        window.__setPrompt(j.prompt, level.duration, levelId, level.words);
+        const { text, ...seed } = j;
+        window.__setPrompt(text, level.duration, levelId, level.words, seed);
       }
     } catch (e) {
       // ignore
@@ -96,9 +88,8 @@
     const required = LEVELS.find((l) => l.id === levelId)?.words || 0;
     const percent = required > 0 ? Math.min(100, Math.round((correct / required) * 100)) : 0;
     state[levelId] = Math.max(state[levelId] || 0, percent);
-    saveState(levelId, percent).finally(() => {
-      updateButtons();
-    });
+    saveState(levelId, percent);
+    updateButtons();
     if (trainingResult) {
       trainingResult.classList.remove("hidden");
       const wpm = typeof detail.wpm === "number" ? detail.wpm.toFixed(1) : "0.0";
@@ -0,0 +1,77 @@
+(function () {
+  // Shared by the home page and every training page: one progress load per
+  // page, and level results are merged (highest percent wins) and sent in a
+  // single batch once the player pauses or leaves the page.
+  const SYNC_DELAY_MS = 1500;
+  const BATCH_URL = "/api/training_progress/batch";
+
+  const pending = {};
+  let timer = null;
+  let loading = null;
+
+  function mergePending(progress) {
+    Object.keys(pending).forEach((key) => {
+      const [mode, level] = key.split(":");
+      if (!progress[mode]) progress[mode] = { 1: 0, 2: 0, 3: 0 };
+      progress[mode][level] = Math.max(progress[mode][level] || 0, pending[key]);
+    });
+    return progress;
+  }
+
+  function load() {
+    if (!loading) {
+      // The browser revalidates with If-None-Match, so unchanged progress is a 304.
+      loading = fetch("/api/training_progress")
+        .then((res) => res.json())
+        .then((j) => (j && j.ok && j.progress ? j.progress : null))
+        .catch(() => null);
+    }
+    return loading.then((progress) => (progress ? mergePending(JSON.parse(JSON.stringify(progress))) : null));
+  }
+
+  function takePending() {
+    return Object.keys(pending).map((key) => {
+      const [mode, level] = key.split(":");
+      const percent = pending[key];
+      delete pending[key];
+      return { mode, level: Number(level), percent };
+    });
+  }
+
+  function flush(leaving) {
+    if (timer) clearTimeout(timer);
+    timer = null;
+    const updates = takePending();
+    if (!updates.length) return Promise.resolve();
+    const body = JSON.stringify({ updates });
+    if (leaving && navigator.sendBeacon) {
+      navigator.sendBeacon(BATCH_URL, new Blob([body], { type: "application/json" }));
+      return Promise.resolve();
+    }
+    return fetch(BATCH_URL, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body,
+      keepalive: true,
+    }).then(() => {
+      loading = null;
+    }).catch(() => {
+      // keep the results for the next attempt
+      updates.forEach((u) => queue(u.mode, u.level, u.percent));
+    });
+  }
+
+  function queue(mode, level, percent) {
+    const key = `${mode}:${level}`;
+    pending[key] = Math.max(pending[key] || 0, percent);
+    if (timer) clearTimeout(timer);
+    timer = setTimeout(() => flush(false), SYNC_DELAY_MS);
+  }
+
+  window.addEventListener("pagehide", () => flush(true));
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flush(true);
+  });
+
+  window.TypingLabProgress = { load, queue, flush };
+})();
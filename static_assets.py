@@ -0,0 +1,279 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+from pathlib import Path
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped; gzip is always written
+    brotli = None
+
+STATIC_DIR = Path(__file__).with_name("static")
+DIST_DIR = STATIC_DIR / "dist"
+MANIFEST_PATH = DIST_DIR / "manifest.json"
+BUILD_SUFFIXES = (".js", ".css")
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {}
+
+
+# --- minification -------------------------------------------------------------
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_CSS_TIGHT = re.compile(r"\s*([{};,>])\s*|:\s+")
+
+
+def minify_css(source: str) -> str:
+    out = []
+    for part in re.split(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""", _CSS_COMMENT.sub("", source)):
+        if part[:1] in ("'", '"'):
+            out.append(part)
+            continue
+        part = re.sub(r"\s+", " ", part)
+        # no space is removed before ':' because "a :hover" and "a:hover" differ
+        out.append(_CSS_TIGHT.sub(lambda m: m.group(1) or ":", part))
+    return "".join(out).replace(";}", "}").strip() + "\n"
+
+
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "void", "yield", "await", "delete")
+
+
+def minify_js(source: str) -> str:
+    """Drop comments, indentation and blank lines; strings, templates and regexes are copied verbatim.
+
+    Line breaks are kept so automatic semicolon insertion behaves exactly as in
+    the original file.
+    """
+    out = []
+    i = 0
+    n = len(source)
+    stack = []  # template literal nesting: brace depth of each open ${ ... }
+    line = []
+
+    def flush_line():
+        text = "".join(line).strip()
+        if text:
+            out.append(text + "\n")
+        line.clear()
+
+    def last_significant():
+        text = "".join(line).rstrip()
+        if text:
+            return text
+        for chunk in reversed(out):
+            if chunk.strip():
+                return chunk.rstrip()
+        return ""
+
+    def copy_template(start):
+        # start points just after an opening backtick; returns index after the literal or after "${"
+        j = start
+        while j < n:
+            ch = source[j]
+            if ch == "\\":
+                j += 2
+                continue
+            if ch == "`":
+                return j + 1, False
+            if ch == "$" and j + 1 < n and source[j + 1] == "{":
+                return j + 2, True
+            j += 1
+        return n, False
+
+    while i < n:
+        ch = source[i]
+        if ch == "`" or (ch == "}" and stack and stack[-1] == 0):
+            if ch == "}":
+                stack.pop()
+            end, opened = copy_template(i + 1)
+            line.append(source[i:end])
+            i = end
+            if opened:
+                stack.append(0)
+            continue
+        if ch in "{" and stack:
+            stack[-1] += 1
+        elif ch == "}" and stack:
+            stack[-1] -= 1
+        if ch in "\"'":
+            j = i + 1
+            while j < n and source[j] != ch:
+                j += 2 if source[j] == "\\" else 1
+            line.append(source[i:j + 1])
+            i = j + 1
+            continue
+        if ch == "/" and i + 1 < n and source[i + 1] == "/":
+            while i < n and source[i] != "\n":
+                i += 1
+            continue
+        if ch == "/" and i + 1 < n and source[i + 1] == "*":
+            end = source.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            line.append(" ")
+            continue
+        if ch == "/":
+            prev = last_significant()
+            word = re.search(r"[A-Za-z_$][\w$]*$", prev)
+            if not prev or prev[-1] in _REGEX_PRECEDERS or (word and word.group(0) in _REGEX_KEYWORDS):
+                j = i + 1
+                in_class = False
+                while j < n and source[j] != "\n":
+                    c = source[j]
+                    if c == "\\":
+                        j += 2
+                        continue
+                    if c == "[":
+                        in_class = True
+                    elif c == "]":
+                        in_class = False
+                    elif c == "/" and not in_class:
+                        break
+                    j += 1
+                j += 1
+                while j < n and (source[j].isalnum()):
+                    j += 1
+                line.append(source[i:j])
+                i = j
+                continue
+        if ch == "\n":
+            flush_line()
+            i += 1
+            continue
+        if ch in " \t\r":
+            if line and line[-1] != " ":
+                line.append(" ")
+            i += 1
+            continue
+        line.append(ch)
+        i += 1
+    flush_line()
+    return "".join(out)
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css}
+
+
+# --- build --------------------------------------------------------------------
+
+def _write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def build(static_dir: Path = STATIC_DIR, dist_dir: Path = DIST_DIR) -> dict:
+    """Minify, hash and precompress every asset; returns the manifest."""
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    keep = set()
+    for src in sorted(static_dir.iterdir()):
+        if not src.is_file() or src.suffix not in BUILD_SUFFIXES:
+            continue
+        data = MINIFIERS[src.suffix](src.read_text(encoding="utf-8")).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        name = f"{src.stem}.{digest}{src.suffix}"
+        _write(dist_dir / name, data)
+        _write(dist_dir / f"{name}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+        keep.update((name, f"{name}.gz"))
+        if brotli is not None:
+            _write(dist_dir / f"{name}.br", brotli.compress(data, quality=11))
+            keep.add(f"{name}.br")
+        manifest[src.name] = name
+    for old in dist_dir.iterdir():
+        if old.name not in keep and old.name != MANIFEST_PATH.name:
+            old.unlink()
+    _write(dist_dir / MANIFEST_PATH.name, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    load_manifest(dist_dir / MANIFEST_PATH.name)
+    return manifest
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> dict:
+    global _manifest
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        manifest = {}
+    # a source edited after the last build is served unhashed until the next build
+    fresh = {}
+    for source, hashed in manifest.items():
+        try:
+            if (STATIC_DIR / source).stat().st_mtime <= (path.parent / hashed).stat().st_mtime:
+                fresh[source] = hashed
+        except OSError:
+            continue
+    _manifest = fresh
+    return _manifest
+
+
+def static_url(name: str) -> str:
+    """URL of a static asset; the hashed build output when one exists."""
+    hashed = _manifest.get(name)
+    if hashed is None:
+        return f"/static/{name}"
+    return f"/static/dist/{hashed}"
+
+
+# --- serving ------------------------------------------------------------------
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves hashed build outputs as immutable, precompressed when the client allows."""
+
+    async def get_response(self, path: str, scope):
+        parts = Path(path).parts
+        if len(parts) != 2 or parts[0] != "dist" or parts[1] == MANIFEST_PATH.name:
+            return await super().get_response(path, scope)
+        full = DIST_DIR / parts[1]
+        headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+        media_type = mimetypes.guess_type(parts[1])[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type.endswith("javascript"):
+            media_type += "; charset=utf-8"
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for coding, suffix in ENCODINGS:
+            variant = full.with_name(full.name + suffix)
+            if coding in accepted and variant.is_file():
+                return FileResponse(variant, media_type=media_type, headers={**headers, "Content-Encoding": coding})
+        response = await super().get_response(path, scope)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
+
+
+load_manifest()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        print("usage: python static_assets.py build")
+        sys.exit(2)
+    built = build()
+    for source, hashed in sorted(built.items()):
+        sizes = [(DIST_DIR / f"{hashed}{ext}") for ext in ("", ".gz", ".br")]
+        original = (STATIC_DIR / source).stat().st_size
+        summary = " / ".join(f"{p.stat().st_size}" for p in sizes if p.exists())
+        print(f"{source:<24} {original:>7} -> {summary} bytes  ({hashed})")
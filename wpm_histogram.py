@@ -0,0 +1,192 @@
+import logging
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import text
+
+import history
+from db import engine, get_conn, init_db
+
+logger = logging.getLogger(__name__)
+
+SYNC_SECONDS = float(os.environ.get("TYPINGLAB_WPM_HISTOGRAM_SYNC_SECONDS", "60"))
+
+# Same range save_typing_session_json accepts; 400 lands in the last bucket.
+WPM_MAX = 400
+BUCKET_WIDTH = 1
+BUCKETS = WPM_MAX // BUCKET_WIDTH
+
+if engine.dialect.name == "sqlite":
+    _BUCKET_SQL = "CAST(wpm AS INTEGER)"
+else:
+    _BUCKET_SQL = "CAST(FLOOR(wpm) AS INTEGER)"
+
+UPSERT = text("""
+    INSERT INTO wpm_histogram (duration_seconds, bucket, count)
+    VALUES (:duration_seconds, :bucket, :count)
+    ON CONFLICT (duration_seconds, bucket) DO UPDATE SET
+        count = wpm_histogram.count + excluded.count
+""")
+
+
+def bucket_for(wpm: float) -> int:
+    return max(0, min(BUCKETS - 1, int(wpm // BUCKET_WIDTH)))
+
+
+class WpmHistograms:
+    """Fixed-width WPM bucket counts per test duration.
+
+    Each duration also keeps the running "tests below bucket b" prefix, so a
+    percentile is two list lookups. Adding a test touches at most BUCKETS
+    prefix entries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._below = {}
+
+    def load(self, rows) -> None:
+        """Replace everything with (duration_seconds, bucket, count) rows."""
+        counts = {}
+        for duration, bucket, count in rows:
+            per = counts.setdefault(int(duration), [0] * BUCKETS)
+            per[max(0, min(BUCKETS - 1, int(bucket)))] += int(count)
+        below = {}
+        for duration, per in counts.items():
+            prefix = [0] * (BUCKETS + 1)
+            for b in range(BUCKETS):
+                prefix[b + 1] = prefix[b] + per[b]
+            below[duration] = prefix
+        with self._lock:
+            self._below = below
+
+    def add(self, duration_seconds: int, wpm: float, count: int = 1) -> None:
+        start = bucket_for(wpm) + 1
+        with self._lock:
+            prefix = self._below.get(duration_seconds)
+            if prefix is None:
+                prefix = self._below[duration_seconds] = [0] * (BUCKETS + 1)
+            for b in range(start, BUCKETS + 1):
+                prefix[b] += count
+
+    def percentile(self, duration_seconds: int, wpm: float):
+        """Share of tests at this duration slower than wpm, 0-100; ties count half.
+
+        Returns (percentile, tests); percentile is None when there are no tests yet.
+        """
+        b = bucket_for(wpm)
+        with self._lock:
+            prefix = self._below.get(duration_seconds)
+            if prefix is None or prefix[BUCKETS] == 0:
+                return None, 0
+            total = prefix[BUCKETS]
+            slower = prefix[b] + (prefix[b + 1] - prefix[b]) / 2.0
+        return round(100.0 * slower / total, 1), total
+
+    def needs_sync(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at >= SYNC_SECONDS
+
+    def mark_synced(self) -> None:
+        self._synced_at = time.monotonic()
+
+
+wpm_histograms = WpmHistograms()
+
+
+def apply_sessions(conn, sessions) -> None:
+    """Count new (duration_seconds, wpm) sessions into the stored histograms; runs inside the caller's transaction."""
+    per_bucket = {}
+    for duration, wpm in sessions:
+        key = (duration, bucket_for(wpm))
+        per_bucket[key] = per_bucket.get(key, 0) + 1
+    if not per_bucket:
+        return
+    conn.execute(UPSERT, [
+        {"duration_seconds": duration, "bucket": bucket, "count": count}
+        for (duration, bucket), count in per_bucket.items()
+    ])
+
+
+def after_commit(duration_seconds: int, wpm: float) -> None:
+    wpm_histograms.add(duration_seconds, wpm)
+
+
+def reload() -> None:
+    wpm_histograms.mark_synced()
+    conn = get_conn()
+    rows = conn.execute(text("SELECT duration_seconds, bucket, count FROM wpm_histogram")).fetchall()
+    conn.close()
+    wpm_histograms.load(rows)
+
+
+def ensure_fresh() -> WpmHistograms:
+    # Tests saved by other workers show up after one sync period.
+    if wpm_histograms.needs_sync():
+        try:
+            reload()
+        except Exception:
+            logger.exception("could not reload WPM histograms")
+    return wpm_histograms
+
+
+def percentile(duration_seconds: int, wpm: float):
+    return ensure_fresh().percentile(duration_seconds, wpm)
+
+
+def rebuild() -> None:
+    """Recount every stored session. Refused once retention has compacted
+    sessions: the buckets are the only record of the deleted ones."""
+    with engine.begin() as conn:
+        since = history.compacted_before(conn)
+        if since is not None:
+            raise RuntimeError(
+                f"sessions before {since} were compacted; the WPM histograms cannot be rebuilt from typing_sessions"
+            )
+        rows = conn.execute(text(f"""
+            SELECT duration_seconds, {_BUCKET_SQL} AS bucket, COUNT(*)
+            FROM typing_sessions
+            GROUP BY duration_seconds, {_BUCKET_SQL}
+        """)).fetchall()
+        per_bucket = {}
+        for duration, bucket, count in rows:
+            key = (duration, max(0, min(BUCKETS - 1, int(bucket) // BUCKET_WIDTH)))
+            per_bucket[key] = per_bucket.get(key, 0) + count
+        conn.execute(text("DELETE FROM wpm_histogram"))
+        if per_bucket:
+            conn.execute(
+                text("INSERT INTO wpm_histogram (duration_seconds, bucket, count) VALUES (:duration_seconds, :bucket, :count)"),
+                [{"duration_seconds": d, "bucket": b, "count": n} for (d, b), n in per_bucket.items()],
+            )
+    reload()
+
+
+def ensure_initialized() -> None:
+    # First start after upgrading: count existing sessions once.
+    conn = get_conn()
+    have_buckets = conn.execute(text("SELECT 1 FROM wpm_histogram LIMIT 1")).fetchone()
+    have_sessions = conn.execute(text("SELECT 1 FROM typing_sessions LIMIT 1")).fetchone()
+    since = history.compacted_before(conn)
+    conn.close()
+    if have_sessions and not have_buckets and since is not None:
+        logger.warning("WPM histograms are empty but sessions before %s were compacted; not rebuilding", since)
+        reload()
+    elif have_sessions and not have_buckets:
+        rebuild()
+    else:
+        reload()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python wpm_histogram.py rebuild")
+        sys.exit(2)
+    init_db()
+    try:
+        rebuild()
+    except RuntimeError as exc:
+        print(exc)
+        sys.exit(1)
+    print("WPM histograms rebuilt")